@@ -0,0 +1,296 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Client side analysis of the paths packets take through the model."""
+
+import math
+from array import array
+from collections import namedtuple
+
+# One row of a drop summary. Rates are in drops per ns of simulation time,
+# recent ones since the previous summary.
+DropCause = namedtuple('DropCause', ['module', 'reason', 'count', 'rate', 'recent', 'recent_rate'])
+
+
+# Returns the p-th percentile of a sorted sequence, using the nearest rank
+def percentile(values, p):
+    if len(values) == 0:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+# ModuleProfile class - Distribution of the time packets spend in each module.
+#
+# Backtraces are added incrementally: the profile remembers how many hops of
+# each live packet it already counted, so adding the backtrace of the same
+# packet again only counts the hops it completed since.
+class ModuleProfile(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.residency = {}  # module -> array of the time spent in it per hop
+        self.folded = {}     # stack of modules -> total time spent at its top
+        self.packets = 0     # number of distinct packets profiled
+        self._counted = {}   # live packet id -> number of hops already counted
+
+    def add_backtrace(self, packet_id, modules, read_times, write_times, finished=False):
+        """Count the hops of a backtrace. A hop is complete once the packet
+        left the module, i.e. its write time isn't -1."""
+        counted = self._counted.get(packet_id)
+        if counted is None:
+            counted = 0
+            self.packets += 1
+
+        for i in range(counted, len(modules)):
+            read_time = read_times[i]
+            write_time = write_times[i]
+            if write_time == -1:
+                break
+            counted = i + 1
+            if read_time == -1:
+                continue
+
+            time = write_time - read_time
+            module = modules[i]
+            times = self.residency.get(module)
+            if times is None:
+                times = self.residency[module] = array('d')
+            times.append(time)
+            stack = ';'.join(modules[:i + 1])
+            self.folded[stack] = self.folded.get(stack, 0.0) + time
+
+        if finished:
+            self._counted.pop(packet_id, None)
+        else:
+            self._counted[packet_id] = counted
+
+    def retain(self, live_ids):
+        """Forget the packets which are no longer in the simulation"""
+        live_ids = set(live_ids)
+        for packet_id in list(self._counted):
+            if packet_id not in live_ids:
+                del self._counted[packet_id]
+
+    def stats(self):
+        """Return (module, hops, mean, p50, p99, total) rows, the modules where
+        the most time was spent first"""
+        rows = []
+        for module, times in self.residency.items():
+            ordered = sorted(times)
+            total = sum(ordered)
+            rows.append((module, len(ordered), total / len(ordered),
+                         percentile(ordered, 50), percentile(ordered, 99), total))
+        rows.sort(key=lambda row: row[5], reverse=True)
+        return rows
+
+    def export_folded(self, out):
+        """Write the folded stacks, one 'module;module;... time_ns' line per
+        path, as expected by flame graph tools"""
+        for stack in sorted(self.folded):
+            out.write(stack + " " + str(int(round(self.folded[stack]))) + "\n")
+
+
+# FlowGraph class - Directed graph of the modules packets go through.
+#
+# Edges are built incrementally from backtraces as in ModuleProfile and carry
+# the number of packets which took them and the hop latency, from entering
+# the first module to entering the second. Nodes carry the number of packets
+# resident in each module at every occupancy sample; the modules whose
+# occupancy grows the fastest over simulation time are likely bottlenecks.
+class FlowGraph(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.edges = {}    # (from module, to module) -> [packets, total latency]
+        self.samples = []  # (time_ns, {module: packets resident})
+        self.modules = set()
+        self._counted = {} # live packet id -> number of its hops already linked
+
+    def add_backtrace(self, packet_id, modules, read_times, write_times, finished=False):
+        """Add the edges of a backtrace which weren't added before. An edge is
+        known once the packet entered its second module."""
+        counted = self._counted.get(packet_id, 0)
+        if counted == 0 and len(modules) > 0:
+            self.modules.add(modules[0])
+
+        for i in range(max(counted, 1), len(modules)):
+            if read_times[i] == -1:
+                break
+            counted = i + 1
+            self.modules.add(modules[i])
+            edge = self.edges.get((modules[i - 1], modules[i]))
+            if edge is None:
+                edge = self.edges[(modules[i - 1], modules[i])] = [0, 0.0]
+            edge[0] += 1
+            if read_times[i - 1] != -1:
+                edge[1] += read_times[i] - read_times[i - 1]
+
+        if finished:
+            self._counted.pop(packet_id, None)
+        else:
+            self._counted[packet_id] = max(counted, 1)
+
+    def retain(self, live_ids):
+        """Forget the packets which are no longer in the simulation"""
+        live_ids = set(live_ids)
+        for packet_id in list(self._counted):
+            if packet_id not in live_ids:
+                del self._counted[packet_id]
+
+    def add_occupancy(self, time_ns, counts):
+        """Record the number of packets resident in each module"""
+        self.modules.update(counts)
+        self.samples.append((time_ns, dict(counts)))
+
+    def edge_stats(self):
+        """Return (from, to, packets, mean latency) rows, busiest edges first"""
+        rows = [(src, dst, packets, latency / packets)
+                for (src, dst), (packets, latency) in self.edges.items()]
+        rows.sort(key=lambda row: (-row[2], row[0], row[1]))
+        return rows
+
+    def growth(self, module):
+        """Return the least squares slope of the occupancy of a module in
+        packets per ns, or None if there aren't two samples at distinct times"""
+        n = len(self.samples)
+        if n < 2:
+            return None
+        mean_time = sum(time for time, counts in self.samples) / n
+        mean_count = sum(counts.get(module, 0) for time, counts in self.samples) / float(n)
+        covariance = 0.0
+        variance = 0.0
+        for time, counts in self.samples:
+            covariance += (time - mean_time) * (counts.get(module, 0) - mean_count)
+            variance += (time - mean_time) ** 2
+        if variance == 0:
+            return None
+        return covariance / variance
+
+    def node_stats(self, bottlenecks=3):
+        """Return (module, mean occupancy, latest occupancy, growth, is
+        bottleneck) rows. The bottlenecks are the modules whose occupancy grows
+        the fastest, among those whose occupancy grows at all."""
+        rows = []
+        for module in sorted(self.modules):
+            if len(self.samples) > 0:
+                mean = sum(counts.get(module, 0) for time, counts in self.samples) / float(len(self.samples))
+                latest = self.samples[-1][1].get(module, 0)
+            else:
+                mean = None
+                latest = None
+            rows.append([module, mean, latest, self.growth(module), False])
+
+        growing = sorted((row for row in rows if row[3] is not None and row[3] > 0),
+                         key=lambda row: row[3], reverse=True)
+        for row in growing[:bottlenecks]:
+            row[4] = True
+        return [tuple(row) for row in rows]
+
+    def export_dot(self, out, bottlenecks=3):
+        """Write the graph in the DOT language, bottlenecks in red"""
+        def quote(name):
+            return '"' + name.replace('"', '\\"') + '"'
+
+        out.write("digraph flow {\n")
+        for module, mean, latest, growth, bottleneck in self.node_stats(bottlenecks):
+            label = module
+            if mean is not None:
+                label += "\\noccupancy " + str(round(mean, 2))
+            attributes = "label=" + quote(label)
+            if bottleneck:
+                attributes += ", color=red, fontcolor=red"
+            out.write("    " + quote(module) + " [" + attributes + "];\n")
+        for src, dst, packets, latency in self.edge_stats():
+            label = str(packets) + " packets\\n" + str(round(latency, 2)) + " ns"
+            out.write("    " + quote(src) + " -> " + quote(dst) + " [label=" + quote(label) + "];\n")
+        out.write("}\n")
+
+
+# DropLog class - Every packet drop reported by the model.
+#
+# Drops are only ever appended, so the number of drops in the log is also the
+# index from which the model should send the next ones. Each distinct module
+# and reason pair is stored once, drops only keep its index in compact arrays
+# along with the packet id and the time of the drop.
+class DropLog(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids     = array('l')
+        self.times   = array('d')
+        self.causes  = array('l')  # drop -> index in cause_list
+        self.cause_list = []       # (module, reason)
+        self.counts  = []          # cause -> number of drops
+        self._cause_index = {}
+        self._last_summary = None  # (time_ns, counts) of the previous summary
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, packet_id, module, reason, time_ns):
+        cause = self._cause_index.get((module, reason))
+        if cause is None:
+            cause = self._cause_index[(module, reason)] = len(self.cause_list)
+            self.cause_list.append((module, reason))
+            self.counts.append(0)
+        self.ids.append(packet_id)
+        self.times.append(time_ns)
+        self.causes.append(cause)
+        self.counts[cause] += 1
+
+    def drops(self):
+        """Yield (packet id, module, reason, time_ns) for every drop"""
+        for i, packet_id in enumerate(self.ids):
+            module, reason = self.cause_list[self.causes[i]]
+            yield packet_id, module, reason, self.times[i]
+
+    def summary(self, now):
+        """Return the DropCauses, most frequent first. The rate is over the
+        whole simulation and the recent rate since the previous summary."""
+        if self._last_summary is None:
+            last_time, last_counts = 0.0, []
+        else:
+            last_time, last_counts = self._last_summary
+
+        rows = []
+        for cause, count in enumerate(self.counts):
+            module, reason = self.cause_list[cause]
+            recent = count - (last_counts[cause] if cause < len(last_counts) else 0)
+            rate = count / now if now > 0 else None
+            recent_rate = recent / (now - last_time) if now > last_time else None
+            rows.append(DropCause(module, reason, count, rate, recent, recent_rate))
+        rows.sort(key=lambda row: (-row.count, row.module, row.reason))
+
+        self._last_summary = (now, list(self.counts))
+        return rows
@@ -0,0 +1,255 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Client side caches of data obtained from the simulation.
+
+Every cached value is tagged with the debugger's stop generation, which is
+advanced whenever the simulation is allowed to make progress (run, continue,
+next, restart, ...). A value tagged with an older generation is stale.
+"""
+
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+
+# PrefixSet class - Set of strings supporting fast prefix completion.
+#
+# The words are kept in a sorted list, the words starting with a prefix are
+# then a contiguous run found by binary search. This is far more compact than a
+# trie for the tens of thousands of hierarchical counter names of a model.
+class PrefixSet(object):
+    def __init__(self, words=()):
+        self._words = sorted(set(words))
+
+    def add(self, word):
+        index = bisect.bisect_left(self._words, word)
+        if index == len(self._words) or self._words[index] != word:
+            self._words.insert(index, word)
+
+    def __contains__(self, word):
+        index = bisect.bisect_left(self._words, word)
+        return index < len(self._words) and self._words[index] == word
+
+    def __len__(self):
+        return len(self._words)
+
+    def complete(self, prefix):
+        """Return the sorted list of all words starting with prefix"""
+        words = self._words
+        start = end = bisect.bisect_left(words, prefix)
+        while end < len(words) and words[end].startswith(prefix):
+            end += 1
+        return words[start:end]
+
+
+# MetadataCache class - Names and ids used for tab completion.
+#
+# Counter names and packet ids are refetched at most once per stop generation.
+# Module names are accumulated for the whole session from every packet list
+# and backtrace that passes through the debugger, since the module hierarchy of
+# a model does not change while it runs.
+class MetadataCache(object):
+    def __init__(self, debugger):
+        self.debugger = debugger
+        self._counters = PrefixSet()
+        self._counters_generation = None
+        self._packets = PrefixSet()
+        self._packet_ids = None  # ids not yet added to self._packets
+        self._packets_generation = None
+        self._modules = PrefixSet()
+
+        self.log = logging.getLogger("MetadataCache")
+
+    def observe_counters(self, names):
+        self._counters = PrefixSet(names)
+        self._counters_generation = self.debugger.generation
+
+    def observe_packets(self, ids, modules):
+        # The set is only built if packet ids are actually completed
+        self._packet_ids = ids
+        self._packets_generation = self.debugger.generation
+        self.observe_modules(modules)
+
+    def observe_modules(self, modules):
+        for module in modules:
+            self._modules.add(module)
+
+    def counter_names(self, prefix=''):
+        if self._counters_generation != self.debugger.generation:
+            self.log.debug("Counter names are stale, refetching")
+            # print_all_counters will call observe_counters
+            self.debugger.print_all_counters()
+        return self._counters.complete(prefix)
+
+    def packet_ids(self, prefix=''):
+        if self._packets_generation != self.debugger.generation:
+            self.log.debug("Packet ids are stale, refetching")
+            # print_packets will call observe_packets
+            self.debugger.print_packets()
+        if self._packet_ids is not None:
+            self._packets = PrefixSet(str(ident) for ident in self._packet_ids)
+            self._packet_ids = None
+        return self._packets.complete(prefix)
+
+    def module_names(self, prefix=''):
+        # Refreshing the packet list is the only way to learn about new
+        # modules without another protocol message.
+        if self._packets_generation != self.debugger.generation:
+            self.debugger.print_packets()
+        return self._modules.complete(prefix)
+
+
+# PacketCache class - Least recently used cache of the replies about a single
+# packet: its parsed contents, raw contents, fields and backtrace.
+#
+# Keys are tuples starting with the kind of reply and the packet id, e.g.
+# ('field', 5, 'ipv4.ttl'), or None for the current packet. Values are only valid for the stop generation at
+# which they were stored, so the whole cache is dropped as soon as the
+# generation advances.
+class PacketCache(object):
+    # Returned by get() for keys which aren't cached, since None may be cached
+    MISSING = object()
+
+    def __init__(self, debugger, capacity=1024, enabled=True):
+        self.debugger = debugger
+        self.capacity = capacity
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generation = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_generation(self):
+        if self._generation != self.debugger.generation:
+            self._entries.clear()
+            self._generation = self.debugger.generation
+
+    def get(self, key):
+        if not self.enabled:
+            return PacketCache.MISSING
+        self._check_generation()
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return PacketCache.MISSING
+        # Reinserting marks the entry as the most recently used
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        self._check_generation()
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Prefetcher class - Fills the packet cache in the background as soon as the
+# simulation stops, with the replies to the queries which usually follow a stop.
+#
+# The IPC session only supports one request at a time, so the prefetcher may
+# only use it while the debugger is idle at its prompt: stop() must be called
+# before any other request is sent. It waits for the request in flight, if any,
+# and abandons the remaining queries.
+class Prefetcher(object):
+    QUERIES = ('whoami', 'bt', 'print', 'raw')
+
+    def __init__(self, debugger, queries=('whoami', 'bt', 'print'), depth=1):
+        self.debugger = debugger
+        self.queries = list(queries)
+        # Number of packets to prefetch: the stopped packet, then the packets
+        # closest to it by id in the same module
+        self.depth = depth
+        self.enabled = False
+        self.prefetched = 0
+        self._thread = None
+        self._cancel = threading.Event()
+
+        self.log = logging.getLogger("Prefetcher")
+
+    def start(self, packet_id, module=None):
+        self.stop()
+        if not self.enabled or not self.debugger.packet_cache.enabled:
+            return
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._run, args=(packet_id, module))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._cancel.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, packet_id, module):
+        try:
+            self._prefetch(packet_id, True)
+            if self.depth > 1 and module is not None and not self._cancel.is_set():
+                ids = self.debugger.print_packets(module)[0]
+                others = sorted((ident for ident in ids if ident != packet_id),
+                                key=lambda ident: abs(ident - packet_id))
+                for ident in others[:self.depth - 1]:
+                    self._prefetch(ident, False)
+        except Exception as e:
+            self.log.debug("Prefetch failed: " + str(e))
+
+    def _prefetch(self, packet_id, current):
+        debugger = self.debugger
+        for query in self.queries:
+            if self._cancel.is_set():
+                return
+            if query == 'whoami':
+                if not current:
+                    continue
+                debugger.whoami()
+            elif query == 'bt':
+                # The backtrace of the current packet is cached under both its
+                # id and None, which is what a plain 'bt' asks for
+                debugger.backtrace(None if current else packet_id)
+            elif query == 'print':
+                debugger.get_parsed_packet(packet_id)
+            elif query == 'raw':
+                debugger.get_raw_packet(packet_id)
+            self.prefetched += 1
@@ -0,0 +1,1679 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+
+"""Python interface to a model running under the debugger.
+
+This module holds everything needed to drive a simulation from Python without
+the command line interface: the IPC session, the request messages and the
+PFPSimDebugger class which sends them. Nothing in it depends on the terminal,
+the formatting of output or the tracing subsystem, which is only imported the
+first time a trace is started.
+
+Session is a simpler interface on top of PFPSimDebugger returning plain
+Python values, and Simulation manages the model's process:
+
+    with Session.launch("build/model", ["-c", "Configs/"]) as session:
+        session.set_breakpoint(module="ingress")
+        stop = session.run()
+        print(stop.packet_id, session.backtrace())
+"""
+
+import os
+import re
+import fnmatch
+import logging
+import shutil
+import subprocess
+import tempfile
+from collections import namedtuple, OrderedDict
+import nnpy
+from . import PFPSimDebugger_pb2
+from . import cache
+from . import counters
+from . import packets
+from . import analysis
+from . import tables
+
+# Urls of the IPC server and of the trace publisher of a model started with -d,
+# unless it is given other ones
+DEFAULT_URL = "ipc:///tmp/pfpsimdebug.ipc"
+DEFAULT_TRACE_URL = "ipc:///tmp/pfpdb-trace"
+# Given instead of a url, allocates one which no other session uses
+AUTO_URL = "auto"
+
+
+# SimulationExited - Exception raised when the simulation exits while the
+# debugger waits for a reply
+class SimulationExited(Exception):
+    def __init__(self, message, exit_code = None):
+        super(SimulationExited, self).__init__(message)
+        # None if the debugger was attached to the process
+        self.exit_code = exit_code
+
+
+# DebuggerIPCSession class - Handles the transmission and reception of messages to and from the DebuggerIPCServer
+class DebuggerIPCSession:
+    def __init__(self, url):
+        self.url = url  # url on which the ipc will occur
+        self.socket = nnpy.Socket(nnpy.AF_SP, nnpy.REQ) # create socket
+        self.socket.setsockopt(nnpy.SOL_SOCKET, nnpy.RCVTIMEO, 100)
+        self.socket.connect(self.url)   # connect socket
+
+    def close(self):
+        self.socket.close()
+
+    # Send message through socket. The message must be an object generated from the protocol buffer compiler or a wrapper around such an object.
+    def send(self, message):
+        self.socket.send(message.SerializeToString())
+
+    # Receive message from server through the socket.
+    # TODO(gordon) There must be a more concise way of doing this
+    def recv(self):
+        data = self.socket.recv()
+        recv_msg = PFPSimDebugger_pb2.DebugMsg()
+        recv_msg.ParseFromString(data)
+        if recv_msg.type == PFPSimDebugger_pb2.DebugMsg.CounterValue:
+            child_msg = PFPSimDebugger_pb2.CounterValueMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg.value
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllCounterValues:
+            child_msg = PFPSimDebugger_pb2.AllCounterValuesMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllBreakpointValues:
+            child_msg = PFPSimDebugger_pb2.AllBreakpointValuesMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.BreakpointHit:
+            child_msg = PFPSimDebugger_pb2.BreakpointHitMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
+            child_msg = PFPSimDebugger_pb2.GenericAcknowledgeMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg.status
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.WhoAmIReply:
+            child_msg = PFPSimDebugger_pb2.WhoAmIReplyMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.PacketListValues:
+            child_msg = PFPSimDebugger_pb2.PacketListValuesMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.WatchpointHit:
+            child_msg = PFPSimDebugger_pb2.WatchpointHitMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllWatchpointValues:
+            child_msg = PFPSimDebugger_pb2.AllWatchpointValuesMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.BacktraceReply:
+            child_msg = PFPSimDebugger_pb2.BacktraceReplyMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg;
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.SimulationEnd:
+            child_msg = PFPSimDebugger_pb2.SimulationEndMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.SimulationStopped:
+            child_msg = PFPSimDebugger_pb2.SimulationStoppedMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllIgnoreModules:
+            child_msg = PFPSimDebugger_pb2.AllIgnoreModulesMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.SimulationTime:
+            child_msg = PFPSimDebugger_pb2.SimulationTimeMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg.time_ns
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.PacketDropped:
+            child_msg = PFPSimDebugger_pb2.PacketDroppedMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.DroppedPackets:
+            child_msg = PFPSimDebugger_pb2.DroppedPacketsMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.TableEntries:
+            child_msg = PFPSimDebugger_pb2.TableEntriesMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return child_msg;
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.ParsedPacketValue:
+            child_msg = PFPSimDebugger_pb2.ParsedPacketValueMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.RawPacketValue:
+            child_msg = PFPSimDebugger_pb2.RawPacketValueMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.PacketFieldValue:
+            child_msg = PFPSimDebugger_pb2.PacketFieldValueMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.CPCommandResults:
+            child_msg = PFPSimDebugger_pb2.CPCommandResultsMsg()
+            child_msg.ParseFromString(recv_msg.message)
+            return recv_msg.type, child_msg
+        else:
+            return recv_msg.type, recv_msg
+
+# DebuggerMessage class - Base class for wrappers around protobuf objects
+class DebuggerMessage(object):
+    def __init__(self, type_):
+        self.parent_msg = PFPSimDebugger_pb2.DebugMsg()
+        self.message = None
+        self.parent_msg.type = type_
+
+    def SerializeToString(self):
+        self.SerializeMessage()
+        return self.parent_msg.SerializeToString()
+
+    def SerializeMessage(self):
+        if self.message != None:
+            self.parent_msg.message = self.message.SerializeToString()
+
+# Wrappers around protobuf objects. They must inherit DebuggerMessage and set their own type
+class RunMessage(DebuggerMessage):
+    def __init__(self, time_ns = None):
+        super(RunMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Run)
+        self.message = PFPSimDebugger_pb2.RunMsg()
+        if time_ns != None:
+            self.message.time_ns = str(time_ns)
+
+class GetCounterMessage(DebuggerMessage):
+    def __init__(self, name):
+        super(GetCounterMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetCounter)
+        self.message = PFPSimDebugger_pb2.GetCounterMsg()
+        self.message.name = name
+
+class GetAllCountersMessage(DebuggerMessage):
+    def __init__(self, pattern = None, regex = False, sort = None, limit = None, non_zero = False, changed_since = None):
+        super(GetAllCountersMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllCounters)
+        self.message = PFPSimDebugger_pb2.GetAllCountersMsg()
+        if pattern != None:
+            self.message.pattern = pattern
+            self.message.regex = regex
+        if sort != None:
+            self.message.sort = sort
+        if limit != None:
+            self.message.limit = limit
+        if non_zero:
+            self.message.non_zero = True
+        if changed_since != None:
+            self.message.changed_since = changed_since
+
+class SetBreakpointMessage(DebuggerMessage):
+    def __init__(self, condition, value, temp, disabled):
+        super(SetBreakpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.SetBreakpoint)
+        self.message = PFPSimDebugger_pb2.SetBreakpointMsg()
+        if temp is True:
+            self.message.temporary = '1'
+        else:
+            self.message.temporary = '0'
+        if disabled is True:
+            self.message.disabled = '1'
+        else:
+            self.message.disabled = '0'
+
+        for i,cond in enumerate(condition):
+            self.message.condition_list.append(cond)
+            self.message.value_list.append(value[i])
+
+class ContinueMessage(DebuggerMessage):
+    def __init__(self, time_ns = None):
+        super(ContinueMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Continue)
+        self.message = PFPSimDebugger_pb2.ContinueMsg()
+        if time_ns != None:
+            self.message.time_ns = str(time_ns)
+
+class GetAllBreakpointsMessage(DebuggerMessage):
+    def __init__(self):
+        super(GetAllBreakpointsMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllBreakpoints)
+        self.message = PFPSimDebugger_pb2.GetAllBreakpointsMsg()
+
+class RemoveBreakpointMessage(DebuggerMessage):
+    def __init__(self, bkpt_id):
+        super(RemoveBreakpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.RemoveBreakpoint)
+        self.message = PFPSimDebugger_pb2.RemoveBreakpointMsg()
+        self.message.id = str(bkpt_id);
+
+class WhoAmIMessage(DebuggerMessage):
+    def __init__(self):
+        super(WhoAmIMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.WhoAmI)
+        self.message = PFPSimDebugger_pb2.WhoAmIMsg()
+
+class NextMessage(DebuggerMessage):
+    def __init__(self, mode = None, count = None, module = None, hops = False, table_name = None):
+        super(NextMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Next)
+        self.message = PFPSimDebugger_pb2.NextMsg()
+        if mode != None:
+            self.message.mode = mode
+        if count != None:
+            self.message.count = count
+        if module != None:
+            self.message.module = module
+        if hops:
+            self.message.report_hops = True
+        if table_name != None:
+            self.message.table_name = table_name
+
+class GetPacketListMessage(DebuggerMessage):
+    def __init__(self, module = None, since_generation = None, filters = None, summary = False):
+        super(GetPacketListMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetPacketList)
+        self.message = PFPSimDebugger_pb2.GetPacketListMsg()
+        if module != None:
+            self.message.module = module
+        if since_generation != None:
+            self.message.since_generation = since_generation
+        # filters maps GetPacketListMsg field names to their value
+        if filters != None:
+            for field, value in filters.items():
+                setattr(self.message, field, value)
+        if summary:
+            self.message.summary = True
+
+class SetWatchpointMessage(DebuggerMessage):
+    def __init__(self, counter, disabled, condition = None, value = None):
+        super(SetWatchpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.SetWatchpoint)
+        self.message = PFPSimDebugger_pb2.SetWatchpointMsg()
+        self.message.counter_name = counter
+        if disabled is True:
+            self.message.disabled = '1'
+        else:
+            self.message.disabled = '0'
+        if condition != None:
+            self.message.condition = condition
+            self.message.value = str(value)
+
+class GetAllWatchpointValuesMessage(DebuggerMessage):
+    def __init__(self):
+        super(GetAllWatchpointValuesMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllWatchpoints)
+        self.message = PFPSimDebugger_pb2.GetAllWatchpointsMsg()
+
+class RemoveWatchpointMessage(DebuggerMessage):
+    def __init__(self, wp_id):
+        super(RemoveWatchpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.RemoveWatchpoint)
+        self.message = PFPSimDebugger_pb2.RemoveWatchpointMsg()
+        self.message.id = str(wp_id)
+
+class BacktraceMessage(DebuggerMessage):
+    def __init__(self, pk_id = None, all_packets = False, include_finished = False):
+        super(BacktraceMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Backtrace)
+        self.message = PFPSimDebugger_pb2.BacktraceMsg()
+        if pk_id != None:
+            self.message.packet_id = str(pk_id)
+        if all_packets:
+            self.message.all_packets = True
+            self.message.include_finished = include_finished
+
+class EnableDisableBreakpointMessage(DebuggerMessage):
+    def __init__(self, bk_id, enable):
+        super(EnableDisableBreakpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.EnableDisableBreakpoint)
+        self.message = PFPSimDebugger_pb2.EnableDisableBreakpointMsg()
+        self.message.id = str(bk_id)
+        if enable is True:
+            self.message.enable = '1'
+        else:
+            self.message.enable = '0'
+
+class EnableDisableWatchpointMessage(DebuggerMessage):
+    def __init__(self, wp_id, enable):
+        super(EnableDisableWatchpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.EnableDisableWatchpoint)
+        self.message = PFPSimDebugger_pb2.EnableDisableWatchpointMsg()
+        self.message.id = str(wp_id)
+        if enable is True:
+            self.message.enable = '1'
+        else:
+            self.message.enable = '0'
+
+class IgnoreModuleMessage(DebuggerMessage):
+    def __init__(self, module, delete = False):
+        super(IgnoreModuleMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.IgnoreModule)
+        self.message = PFPSimDebugger_pb2.IgnoreModuleMsg()
+        self.message.module = module
+        self.message.delete = delete;
+
+class GetAllIgnoreModulesMessage(DebuggerMessage):
+    def __init__(self):
+        super(GetAllIgnoreModulesMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllIgnoreModules)
+        self.message = PFPSimDebugger_pb2.GetAllIgnoreModulesMsg()
+
+class GetSimulationTimeMessage(DebuggerMessage):
+    def __init__(self):
+        super(GetSimulationTimeMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetSimulationTime)
+        self.message = PFPSimDebugger_pb2.GetSimulationTimeMsg()
+
+class BreakOnPacketDropMessage(DebuggerMessage):
+    def __init__(self, on):
+        super(BreakOnPacketDropMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.BreakOnPacketDrop)
+        self.message = PFPSimDebugger_pb2.BreakOnPacketDropMsg()
+        self.message.on = on
+
+class GetDroppedPacketsMessage(DebuggerMessage):
+    def __init__(self, since_index = None):
+        super(GetDroppedPacketsMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetDroppedPackets)
+        self.message = PFPSimDebugger_pb2.GetDroppedPacketsMsg()
+        if since_index != None:
+            self.message.since_index = since_index
+
+# Control Plane Messages
+class CPCommandMessage(DebuggerMessage):
+    def __init__(self, command, commands = None, parallelism = None):
+        super(CPCommandMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.CPCommand)
+        self.message = PFPSimDebugger_pb2.CPCommandMsg()
+        self.message.command = command
+        if commands != None:
+            self.message.command_list.extend(commands)
+        if parallelism != None:
+            self.message.parallelism = parallelism
+
+class GetTableEntriesMessage(DebuggerMessage):
+    def __init__(self, table_name = None, action_name = None, min_handle = None, max_handle = None,
+                 page_size = None, page_token = None, since_version = None, count_pending = False):
+        super(GetTableEntriesMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetTableEntries)
+        self.message = PFPSimDebugger_pb2.GetTableEntriesMsg()
+        if table_name != None:
+            self.message.table_name = table_name
+        if action_name != None:
+            self.message.action_name = action_name
+        if min_handle != None:
+            self.message.min_handle = min_handle
+        if max_handle != None:
+            self.message.max_handle = max_handle
+        if page_size != None:
+            self.message.page_size = page_size
+        if page_token != None:
+            self.message.page_token = page_token
+        if since_version != None:
+            self.message.since_version = since_version
+        if count_pending:
+            self.message.count_pending = True
+
+class GetParsedPacketMessage(DebuggerMessage):
+    def __init__(self, id, ids = None):
+        super(GetParsedPacketMessage, self).__init__(
+                PFPSimDebugger_pb2.DebugMsg.GetParsedPacket)
+        self.message = PFPSimDebugger_pb2.GetParsedPacketMsg()
+        self.message.id = id
+        if ids != None:
+            self.message.id_list.extend(ids)
+
+class GetRawPacketMessage(DebuggerMessage):
+    def __init__(self, id, ids = None):
+        super(GetRawPacketMessage, self).__init__(
+                PFPSimDebugger_pb2.DebugMsg.GetRawPacket)
+        self.message = PFPSimDebugger_pb2.GetRawPacketMsg()
+        self.message.id = id
+        if ids != None:
+            self.message.id_list.extend(ids)
+
+class GetPacketFieldMessage(DebuggerMessage):
+    def __init__(self, id, field_name, ids = None):
+        super(GetPacketFieldMessage, self).__init__(
+                PFPSimDebugger_pb2.DebugMsg.GetPacketField)
+        self.message = PFPSimDebugger_pb2.GetPacketFieldMsg()
+        self.message.id = id
+        self.message.field_name = field_name
+        if ids != None:
+            self.message.id_list.extend(ids)
+
+class StartTracingMessage(DebuggerMessage):
+    def __init__(self, **kwargs):
+        super(StartTracingMessage, self).__init__(
+                PFPSimDebugger_pb2.DebugMsg.StartTracing)
+        self.message = PFPSimDebugger_pb2.StartTracingMsg()
+
+        if "counter" in kwargs:
+            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.COUNTER
+            self.message.name = kwargs["counter"]
+        elif "throughput" in kwargs:
+            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.THROUGHPUT
+            self.message.name = kwargs["throughput"]
+        elif "from_latency" in kwargs and "to_latency" in kwargs:
+            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.LATENCY
+            self.message.name = kwargs["from_latency"]
+            self.message.end_name = kwargs["to_latency"]
+        elif "samples" in kwargs:
+            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.COUNTER_SAMPLES
+            self.message.interval_ns = float(kwargs["samples"])
+        elif "drops" in kwargs:
+            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.DROPS
+            if kwargs["drops"] != None:
+                self.message.name = kwargs["drops"]
+        else:
+            raise TypeError("Missing required Keyword Args, one of: 'counter',"
+                          + " 'throughput', 'samples', 'drops' or ('from_latency','to_latency')")
+
+
+# Returns the sorted ids of the running processes started from an executable
+# with the given name, like pidof, by scanning /proc
+def find_pids(name):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/" + entry + "/cmdline", "rb") as cmdline_file:
+                argv0 = cmdline_file.read().split(b"\0")[0]
+        except (IOError, OSError):
+            # The process exited during the scan
+            continue
+        if os.path.basename(argv0.decode("utf-8", "replace")) == name:
+            pids.append(int(entry))
+    pids.sort()
+    return pids
+
+
+# Simulation class - The process of a model started in debug mode (-d).
+#
+# It can be passed to PFPSimDebugger in place of a subprocess.Popen object, and
+# allows the debugger to restart the model with the same arguments.
+#
+# The urls of the debugger server and of the trace publisher are passed to the
+# model with --debug-url and --trace-url, unless they are the defaults, so
+# that models which don't take these arguments can still be debugged. AUTO_URL
+# allocates an ipc endpoint in a private temporary directory, which is removed
+# when the simulation is closed.
+class Simulation(object):
+    def __init__(self, exe_path, args = (), verbose = False, cwd = None,
+                 url = DEFAULT_URL, trace_url = DEFAULT_TRACE_URL):
+        self.exe_path = exe_path
+        self.args = list(args)
+        # The output of the model is discarded unless verbose is True
+        self.verbose = verbose
+        # Directory the model is started from, the current one if None
+        self.cwd = cwd
+        self.directory = None
+        if url == AUTO_URL or trace_url == AUTO_URL:
+            self.directory = tempfile.mkdtemp(prefix = "pfpdb-")
+        if url == AUTO_URL:
+            url = "ipc://" + os.path.join(self.directory, "debug.ipc")
+        if trace_url == AUTO_URL:
+            trace_url = "ipc://" + os.path.join(self.directory, "trace.ipc")
+        self.url = url
+        self.trace_url = trace_url
+        self.process = None
+        self._devnull = None
+
+    @property
+    def pid(self):
+        if self.process is None:
+            return None
+        return self.process.pid
+
+    def command(self):
+        """The command line the model is started with"""
+        popen_input = [self.exe_path]
+        popen_input.extend(self.args)
+        popen_input.append('-d')
+        if self.url != DEFAULT_URL:
+            popen_input.extend(['--debug-url', self.url])
+        if self.trace_url != DEFAULT_TRACE_URL:
+            popen_input.extend(['--trace-url', self.trace_url])
+        return popen_input
+
+    def start(self):
+        popen_input = self.command()
+
+        stdout = None
+        if not self.verbose:
+            if self._devnull is None:
+                self._devnull = open(os.devnull, 'w')
+            stdout = self._devnull
+        self.process = subprocess.Popen(popen_input, stdin=subprocess.PIPE, stdout=stdout, cwd=self.cwd)
+        return self
+
+    def poll(self):
+        if self.process is None:
+            return None
+        return self.process.poll()
+
+    def kill(self):
+        if self.process is not None and self.process.poll() == None:
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self):
+        self.kill()
+        return self.start()
+
+    def close(self):
+        self.kill()
+        if self._devnull is not None:
+            self._devnull.close()
+            self._devnull = None
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors = True)
+            self.directory = None
+
+
+# PFPSimDebugger class - Manages requests and replies through the IPC Session and the child process. Creates a layer of abstraction between the front end of the debugger and the ipc session and the child process.
+# The process is a Simulation, or None when attached to a running model.
+class PFPSimDebugger(object):
+    def __init__(self, ipc_session, process, pid, verbose, use_cache = True):
+        self.ipc_session = ipc_session
+        self.process = process
+        self.pid = pid
+        self.log = logging.getLogger("cmd_logger")
+        self.log.addHandler(logging.StreamHandler())
+        self._trace_manager = None
+        # (generation, simulation time in ns) of the latest stop
+        self._stop_time = None
+        # Url the traces are published on by the model
+        self.trace_url = DEFAULT_TRACE_URL
+        # Advanced every time the simulation is allowed to make progress, any
+        # data cached with an older generation is stale.
+        self.generation = 0
+        self.metadata = cache.MetadataCache(self)
+        self.counter_snapshots = counters.CounterSnapshots()
+        self.counter_samples = None
+        # Trace id the counter samples are published with
+        self.counter_sampler_id = None
+        self.packet_mirror = packets.PacketMirror()
+        self.packet_cache = cache.PacketCache(self, enabled = use_cache)
+        self.prefetcher = cache.Prefetcher(self)
+        self.module_profile = analysis.ModuleProfile()
+        self.flow_graph = analysis.FlowGraph()
+        self.drop_log = analysis.DropLog()
+        # Number of table entries requested at a time
+        self.table_page_size = 1024
+        self.table_mirror = tables.TableMirror(self)
+        # Number of control plane commands sent at a time by cp load, and
+        # number of them the model may apply concurrently
+        self.cp_batch_size = 1000
+        self.cp_parallelism = 1
+        if verbose:
+            self.log.setLevel("DEBUG")
+
+    # The tracing subsystem pulls in multiprocessing and the plotting
+    # dependencies, so it is only loaded once a trace is actually started
+    @property
+    def trace_manager(self):
+        if self._trace_manager is None:
+            from . import tracing
+            self._trace_manager = tracing.TraceManager(self.trace_url)
+        return self._trace_manager
+
+    # Stops receiving the published traces, if any were started
+    def close_traces(self):
+        if self._trace_manager is not None:
+            self._trace_manager.close()
+            self._trace_manager = None
+
+    def recv(self):
+        while(1):
+            try:
+                return self.ipc_session.recv()
+            except AssertionError:
+                if nnpy.nanomsg.nn_errno() not in (nnpy.ETIMEDOUT, nnpy.EAGAIN):
+                    error_msg = nnpy.ffi.string(nnpy.nanomsg.nn_strerror(nnpy.nanomsg.nn_errno()))
+                    raise RuntimeError("Error in nanomsg recv: " + error_msg)
+                else:
+                    # The read timed out. If the process is dead, no reply will
+                    # ever come, otherwise do nothing and try again
+                    if self.process is not None:
+                        exit_code = self.process.poll()
+                        if exit_code != None:
+                            raise SimulationExited("The child process has exited. Exit Code: " + str(exit_code),
+                                                   exit_code)
+                    # Used when attaching to running simulation
+                    else:
+                        try:
+                            os.kill(int(self.pid), 0)
+                        except OSError:
+                            raise SimulationExited("The attached process is no longer running.")
+
+    def run(self, time_ns = None):
+        self.log.debug("Request: Run")
+        if time_ns != None:
+            self.log.debug("Run time: " + str(time_ns) + " ns")
+            request = RunMessage(time_ns)
+        else:
+            request = RunMessage()
+        self.generation += 1
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        self.observe_stop(msg_type, reply)
+        return msg_type, reply
+
+    # Remembers the simulation time of the stop from its reply, when the reply
+    # has one, so that it doesn't have to be asked for
+    def observe_stop(self, msg_type, reply):
+        time_ns = None
+        if msg_type == PFPSimDebugger_pb2.DebugMsg.BreakpointHit:
+            time_ns = reply.time_ns
+        elif msg_type == PFPSimDebugger_pb2.DebugMsg.SimulationStopped:
+            time_ns = reply.time
+        elif msg_type == PFPSimDebugger_pb2.DebugMsg.PacketDropped and reply.HasField("time_ns"):
+            time_ns = reply.time_ns
+        if time_ns != None:
+            self._stop_time = (self.generation, time_ns)
+            if self._trace_manager is not None:
+                self._trace_manager.flush(time_ns)
+
+    # Returns the simulation time of the current stop, which is only asked for
+    # if the stop's reply didn't include it, and then at most once per stop
+    def stop_time(self):
+        if self._stop_time is None or self._stop_time[0] != self.generation:
+            self._stop_time = (self.generation, self.get_simulation_time())
+        return self._stop_time[1]
+
+    def restart(self):
+        if self.process is None:
+            return False
+        else:
+            self.log.debug("Restarting simulation...")
+            self.process.restart()
+            self.pid = self.process.pid
+            self.generation += 1
+            self.counter_snapshots.clear()
+            self.packet_mirror.clear()
+            self.module_profile.clear()
+            self.flow_graph.clear()
+            self.drop_log.clear()
+            self.table_mirror.clear()
+            # The restarted model doesn't sample counters until asked again
+            if self.counter_sampler_id != None:
+                self.trace_manager.remove_sink(self.counter_sampler_id)
+                self.counter_sampler_id = None
+            self.counter_samples = None
+            return True
+
+    def print_counter(self, counter_name):
+        self.log.debug("Request: Get Counter Value for " + counter_name)
+        request = GetCounterMessage(counter_name)
+        return self.__sendrecv(request)
+
+    def print_all_counters(self, pattern = None, regex = False, sort = None, limit = None, non_zero = False):
+        self.log.debug("Request: Get All Counter Values")
+        request = GetAllCountersMessage(pattern, regex, sort, limit, non_zero)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        reply = self.recv()
+        self.log.debug("Msg Received!")
+        names, values = reply.name_list, reply.value_list
+        if pattern == None and limit == None and not non_zero:
+            # All the counters were sent, in whatever order
+            self.metadata.observe_counters(names)
+            self.record_counter_snapshot(reply)
+        if pattern != None or sort != None or limit != None or non_zero:
+            # The filters are applied again in case the model doesn't support
+            # them. This is a no-op for the rows a filtering model sent.
+            names, values = filter_counters(names, values, pattern, regex, sort, limit, non_zero)
+        return names, values
+
+    # Keeps the values of all counters at the current stop for later diffs.
+    # Snapshots are only taken when all the counters are fetched anyway, by an
+    # unfiltered print_all_counters or by counter_diff, rather than after every
+    # stop, which would fetch every counter each time the simulation stops.
+    def record_counter_snapshot(self, reply, changed_only = False):
+        time_ns = self.stop_time()
+        if reply.HasField("version"):
+            version = reply.version
+        else:
+            version = None
+        return self.counter_snapshots.record(self.generation, time_ns, reply.name_list,
+                                             reply.value_list, version, changed_only)
+
+    # Returns (old snapshot, new snapshot, list of counters.CounterDelta) between
+    # the given stop (or the one before) and the current stop.
+    def counter_diff(self, since = None):
+        latest = self.counter_snapshots.latest()
+        if latest is None or latest.stop != self.generation:
+            if latest is not None and self.counter_snapshots.version is not None:
+                # Only fetch what changed since the latest snapshot
+                self.log.debug("Request: Get Changed Counter Values")
+                request = GetAllCountersMessage(changed_since = self.counter_snapshots.version)
+                reply = self.__sendrecv(request)
+                self.record_counter_snapshot(reply, changed_only = True)
+            else:
+                self.print_all_counters()
+        return self.counter_snapshots.diff(since)
+
+    def print_packets(self, module = None):
+        self.log.debug("Request: Get Packet List")
+        mirror = self.packet_mirror
+        if module != None and mirror.generation == None:
+            # The model doesn't support incremental packet lists, so let it
+            # do the filtering instead of mirroring the whole list.
+            request = GetPacketListMessage(module);
+            reply = self.__sendrecv(request)
+            self.metadata.observe_modules(set(reply.location_list))
+            return reply.id_list, reply.location_list, reply.time_list
+
+        request = GetPacketListMessage(since_generation = mirror.generation)
+        reply = self.__sendrecv(request)
+        mirror.apply(reply)
+        self.log.debug("Packet mirror at generation " + str(mirror.generation) + " with "
+                       + str(len(mirror)) + " packets")
+        self.metadata.observe_packets(list(mirror.by_id), list(mirror.by_module))
+        return mirror.packets(module)
+
+    # Lists the packets matching the given filters (see GetPacketListMsg),
+    # returns (ids, locations, times, number of matches before paging)
+    def query_packets(self, module = None, **filters):
+        self.log.debug("Request: Get Filtered Packet List")
+        request = GetPacketListMessage(module, filters = filters)
+        reply = self.__sendrecv(request)
+        if reply.filtered:
+            return reply.id_list, reply.location_list, reply.time_list, reply.total
+        # The model doesn't support filtering, do it here instead
+        now = None
+        if 'older_than' in filters:
+            now = self.get_simulation_time()
+        return filter_packets(reply.id_list, reply.location_list, reply.time_list, now, **filters)
+
+    # Summarizes the packets matching the given filters per module, returns
+    # (modules, packet counts, age of the oldest packet in ns)
+    def packet_summary(self, module = None, **filters):
+        self.log.debug("Request: Get Packet Summary")
+        filters.pop('offset', None)
+        filters.pop('limit', None)
+        request = GetPacketListMessage(module, filters = filters, summary = True)
+        reply = self.__sendrecv(request)
+        if reply.filtered:
+            return reply.summary_module_list, reply.summary_count_list, reply.summary_oldest_age_list
+        now = self.get_simulation_time()
+        ids, locations, times, total = filter_packets(reply.id_list, reply.location_list, reply.time_list, now, **filters)
+        return summarize_packets(locations, times, now)
+
+    def get_parsed_packet(self, packet_id):
+        parsed = self.packet_cache.get(('parsed', packet_id))
+        if parsed is cache.PacketCache.MISSING:
+            self.log.debug("Request: Get parsed packet")
+
+            request = GetParsedPacketMessage(packet_id)
+            self.ipc_session.send(request)
+            self.log.debug("Msg Sent!")
+            msg_type, recv_msg = self.recv()
+            self.log.debug("Msg Received!")
+            if msg_type == PFPSimDebugger_pb2.DebugMsg.ParsedPacketValue:
+                parsed = recv_msg
+            else:
+                parsed = None
+            self.packet_cache.put(('parsed', packet_id), parsed)
+
+        if parsed is None:
+            return PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge, PFPSimDebugger_pb2.GenericAcknowledgeMsg()
+        return PFPSimDebugger_pb2.DebugMsg.ParsedPacketValue, parsed
+
+    def get_raw_packet(self, packet_id):
+        self.log.debug("Request: Get raw packet")
+        return self.__get_packet_value(packet_id, GetRawPacketMessage,
+                                       PFPSimDebugger_pb2.DebugMsg.RawPacketValue,
+                                       PFPSimDebugger_pb2.RawPacketValueMsg, 'raw')
+
+    def get_packet_field(self, packet_id, field_name):
+        self.log.debug("Request: Get packet field: " + field_name + " for packet " + str(packet_id))
+        return self.__get_packet_value(packet_id, GetPacketFieldMessage,
+                                       PFPSimDebugger_pb2.DebugMsg.PacketFieldValue,
+                                       PFPSimDebugger_pb2.PacketFieldValueMsg, 'field', field_name)
+
+    # The contents of raw packets and of fields are cached as bytes, or None
+    # if the packet couldn't be found, so that single and bulk requests share
+    # the cached values
+    def __get_packet_value(self, packet_id, message_class, reply_type, reply_class, kind, *args):
+        value = self.packet_cache.get((kind, packet_id) + args)
+        if value is cache.PacketCache.MISSING:
+            request = message_class(packet_id, *args)
+            self.ipc_session.send(request)
+            self.log.debug("Msg Sent!")
+            msg_type, recv_msg = self.recv()
+            self.log.debug("Msg Received!")
+            value = recv_msg.value if msg_type == reply_type else None
+            self.packet_cache.put((kind, packet_id) + args, value)
+
+        if value is None:
+            return PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge, PFPSimDebugger_pb2.GenericAcknowledgeMsg()
+        return reply_type, reply_class(value = value)
+
+    # Gets the parsed contents of many packets in a single request, returns a
+    # list of (packet id, headers) for the packets which could be found
+    def get_parsed_packets(self, packet_ids):
+        self.log.debug("Request: Get parsed packets: " + str(len(packet_ids)))
+        found, missing = self.__lookup_packets(packet_ids, 'parsed')
+
+        if len(missing) > 0:
+            # id is set for models which don't support bulk requests
+            request = GetParsedPacketMessage(missing[0], missing)
+            msg_type, reply = self.__sendrecv(request)
+            if msg_type == PFPSimDebugger_pb2.DebugMsg.ParsedPacketValue and reply.bulk:
+                for packet in reply.packet_list:
+                    found[packet.id] = packet
+            else:
+                for i, packet_id in enumerate(missing):
+                    if i > 0:
+                        msg_type, reply = self.__sendrecv(GetParsedPacketMessage(packet_id))
+                    if msg_type == PFPSimDebugger_pb2.DebugMsg.ParsedPacketValue:
+                        found[packet_id] = reply
+            for packet_id in missing:
+                self.packet_cache.put(('parsed', packet_id), found.get(packet_id))
+
+        return [(packet_id, found[packet_id].headers) for packet_id in packet_ids if packet_id in found]
+
+    # Gets the raw contents of many packets in a single request, returns
+    # (ids, data, lengths) where data holds the contents of the packets which
+    # could be found back to back
+    def get_raw_packets(self, packet_ids):
+        self.log.debug("Request: Get raw packets: " + str(len(packet_ids)))
+        return self.__get_packet_values(packet_ids, GetRawPacketMessage,
+                                        PFPSimDebugger_pb2.DebugMsg.RawPacketValue, 'raw')
+
+    # Gets a field of many packets in a single request, returns (ids, data,
+    # lengths) as get_raw_packets does
+    def get_packet_fields(self, packet_ids, field_name):
+        self.log.debug("Request: Get packet field: " + field_name + " for " + str(len(packet_ids)) + " packets")
+        return self.__get_packet_values(packet_ids, GetPacketFieldMessage,
+                                        PFPSimDebugger_pb2.DebugMsg.PacketFieldValue, 'field', field_name)
+
+    def __get_packet_values(self, packet_ids, message_class, reply_type, kind, *args):
+        found, missing = self.__lookup_packets(packet_ids, kind, *args)
+
+        if len(missing) > 0:
+            # id is set for models which don't support bulk requests
+            request = message_class(missing[0], *args, ids = missing)
+            msg_type, reply = self.__sendrecv(request)
+            if msg_type == reply_type and reply.bulk:
+                start = 0
+                for packet_id, length in zip(reply.id_list, reply.length_list):
+                    found[packet_id] = reply.value[start:start + length]
+                    start += length
+            else:
+                for i, packet_id in enumerate(missing):
+                    if i > 0:
+                        msg_type, reply = self.__sendrecv(message_class(packet_id, *args))
+                    if msg_type == reply_type:
+                        found[packet_id] = reply.value
+            for packet_id in missing:
+                self.packet_cache.put((kind, packet_id) + args, found.get(packet_id))
+
+        ids = [packet_id for packet_id in packet_ids if packet_id in found]
+        values = [found[packet_id] for packet_id in ids]
+        return ids, b''.join(values), [len(value) for value in values]
+
+    # Splits packet ids into a dict of the cached values of the packets which
+    # exist and a list of the ids which aren't cached
+    def __lookup_packets(self, packet_ids, kind, *args):
+        found = {}
+        missing = []
+        for packet_id in packet_ids:
+            value = self.packet_cache.get((kind, packet_id) + args)
+            if value is cache.PacketCache.MISSING:
+                missing.append(packet_id)
+            elif value is not None:
+                found[packet_id] = value
+        return found, missing
+
+    # Yields (packet id, raw contents) for the given packets which can be
+    # found, fetching them batch_size packets at a time
+    def iter_raw_packets(self, packet_ids, batch_size = 256):
+        for first in range(0, len(packet_ids), batch_size):
+            ids, data, lengths = self.get_raw_packets(packet_ids[first:first + batch_size])
+            start = 0
+            for ident, length in zip(ids, lengths):
+                yield ident, data[start:start + length]
+                start += length
+
+    def start_trace(self, **kwargs):
+        FROM_LATENCY = 'from_latency'
+        TO_LATENCY   = 'to_latency'
+        THROUGHPUT   = 'throughput'
+        COUNTER      = 'counter'
+        DROPS        = 'drops'
+
+        APPEND       = 'append'
+
+        if THROUGHPUT in kwargs:
+            request = StartTracingMessage(throughput=kwargs[THROUGHPUT])
+            y_axis  = "throughput (pps)"
+            title   = "Throughput of " + kwargs[THROUGHPUT]
+
+        elif COUNTER in kwargs:
+            request = StartTracingMessage(counter=kwargs[COUNTER])
+            y_axis  = "counter value"
+            title   = kwargs[COUNTER]
+
+        elif DROPS in kwargs:
+            request = StartTracingMessage(drops=kwargs[DROPS])
+            y_axis  = "drops (per us)"
+            if kwargs[DROPS] != None:
+                title = "Drops in " + kwargs[DROPS]
+            else:
+                title = "Drops"
+
+        elif FROM_LATENCY in kwargs and TO_LATENCY in kwargs:
+            request = StartTracingMessage(to_latency=kwargs[TO_LATENCY],
+                                      from_latency=kwargs[FROM_LATENCY])
+            y_axis  = "latency (ns)"
+            if kwargs[FROM_LATENCY] == kwargs[TO_LATENCY]:
+                title = "Latency of " + kwargs[FROM_LATENCY]
+            else:
+                title = "Latency from " + kwargs[FROM_LATENCY] + " to " + kwargs[TO_LATENCY]
+
+        else:
+            raise TypeError("Missing required keyword arguments. " +
+                            "Requires one of ["+THROUGHPUT+", "+COUNTER+", " +
+                            "("+FROM_LATENCY+", "++")]")
+
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, recv_msg = self.recv()
+        self.log.debug("Msg Received!")
+
+        if msg_type == PFPSimDebugger_pb2.DebugMsg.StartTracingStatus:
+            msg = PFPSimDebugger_pb2.StartTracingStatusMsg()
+            msg.ParseFromString(recv_msg.message)
+
+            if DROPS in kwargs:
+                self.trace_manager.add_drop_rate_trace(msg.id, kwargs.get('window_ns', 1000.0),
+                                                       kwargs.get(APPEND), x_axis="time (ns)",
+                                                       y_axis=y_axis, title=title)
+            elif APPEND in kwargs and kwargs[APPEND] is not None:
+                self.trace_manager.append_to_trace(kwargs[APPEND], msg.id,
+                                                   y_axis=y_axis, title=title)
+            else:
+                self.trace_manager.add_trace(msg.id, x_axis="time (ns)",
+                                             y_axis=y_axis, title=title)
+
+            return True
+        else:
+            return False
+
+
+    # Starts sampling all counters every interval_ns of simulation time into
+    # self.counter_samples
+    def start_counter_sampling(self, interval_ns):
+        self.log.debug("Request: Start sampling counters every " + str(interval_ns) + " ns")
+        request = StartTracingMessage(samples=interval_ns)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, recv_msg = self.recv()
+        self.log.debug("Msg Received!")
+
+        if msg_type == PFPSimDebugger_pb2.DebugMsg.StartTracingStatus:
+            msg = PFPSimDebugger_pb2.StartTracingStatusMsg()
+            msg.ParseFromString(recv_msg.message)
+
+            self.counter_samples = counters.CounterSampleStore()
+            self.counter_sampler_id = msg.id
+            self.trace_manager.add_counter_sampler(msg.id, self.counter_samples)
+            return True
+        else:
+            return False
+
+    def continue_(self, time_ns = None):
+        self.log.debug("Request: Continue")
+        if time_ns != None:
+            request = ContinueMessage(time_ns)
+        else:
+            request = ContinueMessage()
+        self.generation += 1
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        self.observe_stop(msg_type, reply)
+        return msg_type, reply
+
+    def next(self, count = None, hops = False):
+        if count != None:
+            request = NextMessage(PFPSimDebugger_pb2.NextMsg.STEP, count = count, hops = hops)
+        else:
+            request = NextMessage()
+        self.generation += 1
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        self.observe_stop(msg_type, reply)
+        return msg_type, reply
+
+    def until(self, module, hops = False):
+        self.log.debug("Request: Until " + module)
+        request = NextMessage(PFPSimDebugger_pb2.NextMsg.UNTIL_MODULE, module = module, hops = hops)
+        self.generation += 1
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        self.observe_stop(msg_type, reply)
+        return msg_type, reply
+
+    def finish(self, hops = False):
+        self.log.debug("Request: Finish")
+        request = NextMessage(PFPSimDebugger_pb2.NextMsg.FINISH, hops = hops)
+        self.generation += 1
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        self.observe_stop(msg_type, reply)
+        return msg_type, reply
+
+    def until_settled(self, table_name = None):
+        self.log.debug("Request: Until settled")
+        request = NextMessage(PFPSimDebugger_pb2.NextMsg.UNTIL_SETTLED, table_name = table_name)
+        self.generation += 1
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        self.observe_stop(msg_type, reply)
+        return msg_type, reply
+
+    def set_breakpoint(self, conditions, values, temp, disabled):
+        request = SetBreakpointMessage(conditions, values, temp, disabled)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        return msg_type, reply
+
+    def delete_breakpoint(self, bkpt_id):
+        request = RemoveBreakpointMessage(bkpt_id)
+        return self.__sendrecv(request)
+
+    def get_breakpoints(self):
+        request = GetAllBreakpointsMessage()
+        return self.__sendrecv(request)
+
+    def disable_breakpoint(self, bkpt_id):
+        request = EnableDisableBreakpointMessage(bkpt_id, False)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        return msg_type, reply
+
+    def enable_breakpoint(self, bkpt_id):
+        request = EnableDisableBreakpointMessage(bkpt_id, True)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        return msg_type, reply
+
+    def set_watchpoint(self, counter_name, disabled, condition = None, value = None):
+        request = SetWatchpointMessage(counter_name, disabled, condition, value)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Recieved!")
+        return msg_type, reply
+
+    def delete_watchpoint(self, wp_id):
+        request = RemoveWatchpointMessage(wp_id)
+        return self.__sendrecv(request)
+
+    def get_watchpoints(self):
+        request = GetAllWatchpointValuesMessage()
+        return self.__sendrecv(request)
+
+    def disable_watchpoint(self, wp_id):
+        request = EnableDisableWatchpointMessage(wp_id, False)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        return msg_type, reply
+
+    def enable_watchpoint(self, wp_id):
+        request = EnableDisableWatchpointMessage(wp_id, True)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        return msg_type, reply
+
+    def backtrace(self, packet_id = None):
+        cached = self.packet_cache.get(('backtrace', packet_id))
+        if cached is not cache.PacketCache.MISSING:
+            return cached
+        if packet_id != None:
+            request = BacktraceMessage(packet_id)
+        else:
+            request = BacktraceMessage();
+        self.log.debug("Request: Backtrace")
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        if msg_type == PFPSimDebugger_pb2.DebugMsg.BacktraceReply:
+            self.metadata.observe_modules(reply.module_list)
+        self.packet_cache.put(('backtrace', packet_id), (msg_type, reply))
+        if packet_id == None and msg_type == PFPSimDebugger_pb2.DebugMsg.BacktraceReply:
+            self.packet_cache.put(('backtrace', reply.packet_id), (msg_type, reply))
+        return msg_type, reply
+
+    # Adds the backtraces of all packets in the simulation, and of those which
+    # left it since the last time, to the module profile and the flow graph
+    def collect_backtraces(self):
+        self.log.debug("Request: Backtrace of all packets")
+        consumers = (self.module_profile, self.flow_graph)
+        request = BacktraceMessage(all_packets = True, include_finished = True)
+        msg_type, reply = self.__sendrecv(request)
+        if msg_type == PFPSimDebugger_pb2.DebugMsg.BacktraceReply and reply.bulk:
+            self.metadata.observe_modules(set(reply.module_list))
+            # Packets which left the simulation without being reported as
+            # finished, e.g. dropped ones, are missing from the reply
+            ids = []
+            start = 0
+            for i, packet_id in enumerate(reply.packet_id_list):
+                end = start + reply.hop_count_list[i]
+                finished = i < len(reply.finished_list) and reply.finished_list[i]
+                modules = reply.module_list[start:end]
+                read_times = reply.read_time_list[start:end]
+                write_times = reply.write_time_list[start:end]
+                for consumer in consumers:
+                    consumer.add_backtrace(packet_id, modules, read_times, write_times, finished)
+                if not finished:
+                    ids.append(packet_id)
+                start = end
+        else:
+            # The model doesn't support bulk backtraces, so only the packets
+            # which are still in the simulation can be collected
+            ids = self.print_packets()[0]
+            for packet_id in ids:
+                msg_type, reply = self.backtrace(packet_id)
+                if msg_type == PFPSimDebugger_pb2.DebugMsg.BacktraceReply:
+                    for consumer in consumers:
+                        consumer.add_backtrace(packet_id, reply.module_list, reply.read_time_list,
+                                               reply.write_time_list)
+        for consumer in consumers:
+            consumer.retain(ids)
+
+    # Records the number of packets currently in each module in the flow graph
+    def sample_occupancy(self):
+        self.print_packets()
+        counts = dict((module, len(ids)) for module, ids in self.packet_mirror.by_module.items())
+        self.flow_graph.add_occupancy(self.get_simulation_time(), counts)
+
+    def whoami(self):
+        reply = self.packet_cache.get(('whoami', None))
+        if reply is cache.PacketCache.MISSING:
+            request = WhoAmIMessage()
+            reply = self.__sendrecv(request)
+            self.packet_cache.put(('whoami', None), reply)
+        return reply
+
+    def ignore_module(self, module):
+        request = IgnoreModuleMessage(module)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        return msg_type, reply
+
+    def delete_ignore_module(self, module):
+        request = IgnoreModuleMessage(module, True)
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        msg_type, reply = self.recv()
+        self.log.debug("Msg Received!")
+        return msg_type, reply
+
+    def get_ignore_modules(self):
+        request = GetAllIgnoreModulesMessage()
+        return self.__sendrecv(request)
+
+    def get_simulation_time(self):
+        request = GetSimulationTimeMessage()
+        return self.__sendrecv(request)
+
+    def break_on_packet_drop(self):
+        request = BreakOnPacketDropMessage(True)
+        return self.__sendrecv(request)
+
+    def delete_break_on_packet_drop(self):
+        request = BreakOnPacketDropMessage(False)
+        return self.__sendrecv(request)
+
+    def get_dropped_packets(self):
+        request = GetDroppedPacketsMessage()
+        return self.__sendrecv(request)
+
+    # Adds the drops which aren't in the drop log yet to it
+    def update_drop_log(self):
+        drop_log = self.drop_log
+        self.log.debug("Request: Dropped packets since " + str(len(drop_log)))
+        request = GetDroppedPacketsMessage(len(drop_log))
+        reply = self.__sendrecv(request)
+        ids = reply.packet_id_list
+        if reply.incremental:
+            first = max(0, len(drop_log) - reply.first_index)
+        elif len(ids) >= len(drop_log):
+            # The model sent all the drops, only those past the log are new
+            first = len(drop_log)
+        else:
+            # The model's list of drops was reset
+            drop_log.clear()
+            first = 0
+
+        if first < len(ids):
+            if len(reply.time_list) == len(ids):
+                times = reply.time_list
+            else:
+                # The model doesn't report when packets were dropped, so use
+                # the time at which the drop was first seen instead
+                times = [self.get_simulation_time()] * len(ids)
+            for i in range(first, len(ids)):
+                drop_log.add(ids[i], reply.module_list[i], reply.reason_list[i], times[i])
+        return drop_log
+
+    def quit(self):
+        if self.process is not None:
+            if self.process.poll() == None:
+                self.process.kill()
+
+    def cp_command(self, command):
+        # Control plane commands change the tables, which changes how packets
+        # are processed from now on
+        self.generation += 1
+        request = CPCommandMessage(command)
+        return self.__sendrecv(request)
+
+    def cp_commands(self, commands, parallelism=None):
+        """Send a batch of control plane commands in a single request.
+
+        Returns the list of (index in commands, error) of the commands which
+        failed."""
+        if len(commands) == 0:
+            return []
+        self.log.debug("Request: Control plane commands: " + str(len(commands)))
+        self.generation += 1
+        request = CPCommandMessage(commands[0], commands, parallelism)
+        msg_type, reply = self.__sendrecv(request)
+        if msg_type == PFPSimDebugger_pb2.DebugMsg.CPCommandResults:
+            return list(zip(reply.failed_index_list, reply.error_list))
+
+        # Models which predate batches only applied the first command
+        failures = []
+        for index, command in enumerate(commands):
+            if index > 0:
+                msg_type, reply = self.cp_command(command)
+            if msg_type != PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge \
+                    or reply != PFPSimDebugger_pb2.GenericAcknowledgeMsg.SUCCESS:
+                failures.append((index, "Failed"))
+        return failures
+
+    def iter_table_entries(self, table_name=None, action_name=None, min_handle=None, max_handle=None,
+                           page_size=None):
+        """Generate the TableEntries matching the filters, fetched one page at a time"""
+        if page_size == None:
+            page_size = self.table_page_size
+        page_token = None
+        while True:
+            request = GetTableEntriesMessage(table_name, action_name, min_handle, max_handle,
+                                             page_size, page_token)
+            msg = self.__sendrecv(request)
+            for entry in msg.entry_list:
+                # Models which predate the filters send all the entries
+                if not msg.filtered:
+                    if table_name != None and entry.table_name != table_name:
+                        continue
+                    if action_name != None and entry.action_name != action_name:
+                        continue
+                    if min_handle != None and entry.handle < min_handle:
+                        continue
+                    if max_handle != None and entry.handle > max_handle:
+                        continue
+                yield tables.TableEntry(entry.table_name, tuple(entry.match_key_list), entry.action_name,
+                                        tuple(entry.action_data_list), entry.handle, entry.status,
+                                        entry.priority)
+            # Models which predate paging send all the entries at once
+            if not msg.next_page_token:
+                return
+            page_token = msg.next_page_token
+
+    def get_table_changes(self, table_name, since_version=None):
+        """Return (version, delta, entries, deleted handles) for a table.
+
+        If delta is True, entries are only those inserted or modified since
+        since_version. Otherwise they are all the entries of the table and
+        there are no deleted handles. version is None if the model doesn't
+        keep versions of its tables."""
+        version = None
+        delta = since_version != None
+        entries = []
+        deleted = []
+        page_token = None
+        while True:
+            request = GetTableEntriesMessage(table_name, page_size = self.table_page_size,
+                                             page_token = page_token, since_version = since_version)
+            msg = self.__sendrecv(request)
+            if msg.HasField("version"):
+                version = msg.version
+            delta = delta and msg.delta
+            for entry in msg.entry_list:
+                if msg.filtered or entry.table_name == table_name:
+                    entries.append(tables.TableEntry(entry.table_name, tuple(entry.match_key_list),
+                                                     entry.action_name, tuple(entry.action_data_list),
+                                                     entry.handle, entry.status, entry.priority))
+            deleted.extend(entry.handle for entry in msg.deleted_list if entry.table_name == table_name)
+            if not msg.next_page_token:
+                break
+            page_token = msg.next_page_token
+        return version, delta, entries, deleted
+
+    def get_pending_operations(self, table_name=None):
+        """Return (counts, counted) where counts is the list of PendingCounts
+        of the tables with pending entries, sorted by name. counted is False
+        if the model doesn't count them itself, which means it doesn't support
+        until_settled either."""
+        request = GetTableEntriesMessage(table_name, page_size = self.table_page_size, count_pending = True)
+        msg = self.__sendrecv(request)
+        if msg.counted:
+            counts = [tables.PendingCount(count.table_name, count.inserting, count.modifying, count.deleting)
+                      for count in msg.pending_list
+                      if count.inserting + count.modifying + count.deleting > 0]
+            return sorted(counts), True
+
+        # Count the entries of the reply, and of the following pages
+        pending = {}
+        statuses = (PFPSimDebugger_pb2.TableEntriesMsg.INSERTING,
+                    PFPSimDebugger_pb2.TableEntriesMsg.MODIFYING,
+                    PFPSimDebugger_pb2.TableEntriesMsg.DELETING)
+        while True:
+            for entry in msg.entry_list:
+                if entry.status in statuses and (table_name == None or entry.table_name == table_name):
+                    count = pending.setdefault(entry.table_name, [0, 0, 0])
+                    count[statuses.index(entry.status)] += 1
+            if not msg.next_page_token:
+                break
+            request = GetTableEntriesMessage(table_name, page_size = self.table_page_size,
+                                             page_token = msg.next_page_token, count_pending = True)
+            msg = self.__sendrecv(request)
+        return sorted(tables.PendingCount(name, *count) for name, count in pending.items()), False
+
+    def get_table_entries(self, table_name=None, action_name=None, min_handle=None, max_handle=None):
+        table_entries = {}
+        for entry in self.iter_table_entries(table_name, action_name, min_handle, max_handle):
+            table_entry = {'table_name' : entry.table_name, 'match_key' : entry.match_key, 'action_name' : entry.action_name, 'handle' : entry.handle, 'status' : entry.status, 'action_data' : entry.action_data}
+            table_entries.setdefault(entry.table_name, {}).setdefault(entry.action_name, []).append(table_entry)
+
+        return table_entries;
+
+    def __sendrecv(self, request):
+        self.ipc_session.send(request)
+        self.log.debug("Msg Sent!")
+        reply = self.recv()
+        self.log.debug("Msg Received!")
+        return reply
+
+# Applies the filters of a GetAllCountersMsg to lists of counter names and values
+def filter_counters(names, values, pattern = None, regex = False, sort = None, limit = None, non_zero = False):
+    rows = zip(names, values)
+    if pattern != None:
+        if regex:
+            matcher = re.compile(pattern).search
+        else:
+            matcher = re.compile(fnmatch.translate(pattern)).match
+        rows = [row for row in rows if matcher(row[0])]
+    if non_zero:
+        rows = [row for row in rows if row[1] != 0]
+    if sort == PFPSimDebugger_pb2.GetAllCountersMsg.BY_NAME:
+        rows = sorted(rows, key=lambda row: row[0])
+    elif sort == PFPSimDebugger_pb2.GetAllCountersMsg.BY_VALUE_ASCENDING:
+        rows = sorted(rows, key=lambda row: row[1])
+    elif sort == PFPSimDebugger_pb2.GetAllCountersMsg.BY_VALUE_DESCENDING:
+        rows = sorted(rows, key=lambda row: row[1], reverse=True)
+    rows = list(rows)
+    if limit != None:
+        rows = rows[:limit]
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+# Applies the filters and paging of a GetPacketListMsg to lists of packet ids,
+# locations and times. now is the current simulation time, needed for older_than.
+def filter_packets(ids, locations, times, now = None, min_id = None, max_id = None, min_time = None,
+                   max_time = None, older_than = None, offset = None, limit = None):
+    rows = sorted(zip(ids, locations, times))
+    if min_id != None:
+        rows = [row for row in rows if row[0] >= min_id]
+    if max_id != None:
+        rows = [row for row in rows if row[0] <= max_id]
+    if min_time != None:
+        rows = [row for row in rows if row[2] >= min_time]
+    if max_time != None:
+        rows = [row for row in rows if row[2] <= max_time]
+    if older_than != None:
+        rows = [row for row in rows if row[2] <= now - older_than]
+    total = len(rows)
+    start = offset if offset != None else 0
+    if limit != None:
+        rows = rows[start:start + limit]
+    else:
+        rows = rows[start:]
+    return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows], total
+
+# Counts packets per module and finds the age of the oldest one
+def summarize_packets(locations, times, now):
+    counts = {}
+    oldest = {}
+    for module, time in zip(locations, times):
+        counts[module] = counts.get(module, 0) + 1
+        if module not in oldest or time < oldest[module]:
+            oldest[module] = time
+    modules = sorted(counts)
+    return modules, [counts[m] for m in modules], [now - oldest[m] for m in modules]
+
+
+
+# Why and where the simulation stopped after run, continue_ or next. reason is
+# one of the Stop.* constants, the other fields are None unless they apply to
+# that reason.
+Stop = namedtuple('Stop', ['reason', 'id', 'packet_id', 'module', 'read', 'time_ns',
+                           'counter_name', 'old_value', 'new_value', 'drop_reason'])
+Stop.__new__.__defaults__ = (None,) * (len(Stop._fields) - 1)
+Stop.BREAKPOINT = 'breakpoint'
+Stop.WATCHPOINT = 'watchpoint'
+Stop.STEP = 'step'
+Stop.DROP = 'drop'
+Stop.END = 'end'
+Stop.NONE = 'none'
+
+# A packet in the simulation
+Packet = namedtuple('Packet', ['id', 'module', 'time_ns'])
+
+# One module a packet went through, times are None if the packet is still there
+Hop = namedtuple('Hop', ['module', 'read_time_ns', 'write_time_ns'])
+
+# A packet dropped by the model
+Drop = namedtuple('Drop', ['packet_id', 'module', 'reason', 'time_ns'])
+
+
+# Returns the Stop for a reply to a run, continue or next request
+def make_stop(msg_type, reply):
+    if msg_type == PFPSimDebugger_pb2.DebugMsg.BreakpointHit:
+        return Stop(Stop.BREAKPOINT, id = reply.id, packet_id = reply.packet_id, module = reply.module,
+                    read = reply.read == "1", time_ns = reply.time_ns)
+    elif msg_type == PFPSimDebugger_pb2.DebugMsg.WatchpointHit:
+        return Stop(Stop.WATCHPOINT, id = reply.id, counter_name = reply.counter_name,
+                    old_value = reply.old_value, new_value = reply.new_value)
+    elif msg_type == PFPSimDebugger_pb2.DebugMsg.SimulationStopped:
+        return Stop(Stop.STEP, packet_id = reply.packet_id, module = reply.module, read = reply.read,
+                    time_ns = reply.time)
+    elif msg_type == PFPSimDebugger_pb2.DebugMsg.PacketDropped:
+        return Stop(Stop.DROP, packet_id = reply.packet_id, module = reply.module,
+                    time_ns = reply.time_ns if reply.HasField("time_ns") else None,
+                    drop_reason = reply.reason)
+    elif msg_type == PFPSimDebugger_pb2.DebugMsg.SimulationEnd:
+        return Stop(Stop.END)
+    return Stop(Stop.NONE)
+
+
+# Session class - Debugging session of one model, returning plain Python values
+# instead of protobuf replies.
+#
+# The underlying PFPSimDebugger is available as session.debugger for anything
+# not covered here.
+class Session(object):
+    def __init__(self, debugger, simulation = None):
+        self.debugger = debugger
+        # Closed along with the session if given
+        self.simulation = simulation
+
+    @classmethod
+    def connect(cls, url = DEFAULT_URL, simulation = None, pid = None, use_cache = True, verbose = False,
+                trace_url = DEFAULT_TRACE_URL):
+        """Connect to a model started with -d, either by a Simulation or
+        independently, in which case pid is the model's process id"""
+        if pid == None and simulation is not None:
+            pid = simulation.pid
+        debugger = PFPSimDebugger(DebuggerIPCSession(url), simulation, pid, verbose, use_cache)
+        debugger.trace_url = trace_url
+        return cls(debugger, simulation)
+
+    @classmethod
+    def launch(cls, exe_path, args = (), url = DEFAULT_URL, verbose = False, cwd = None,
+               trace_url = DEFAULT_TRACE_URL, **kwargs):
+        """Start the model and connect to it. Give AUTO_URL as the urls to
+        run several sessions at once."""
+        simulation = Simulation(exe_path, args, verbose, cwd, url, trace_url).start()
+        try:
+            return cls.connect(simulation.url, simulation, trace_url = simulation.trace_url, **kwargs)
+        except Exception:
+            simulation.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.debugger.prefetcher.stop()
+        self.debugger.quit()
+        self.debugger.close_traces()
+        if self.simulation is not None:
+            self.simulation.close()
+        self.debugger.ipc_session.close()
+
+    def restart(self):
+        """Restart the model, returns False when attached to a running model"""
+        return self.debugger.restart()
+
+    def run(self, time_ns = None):
+        return make_stop(*self.debugger.run(time_ns))
+
+    def continue_(self, time_ns = None):
+        return make_stop(*self.debugger.continue_(time_ns))
+
+    def next(self, count = None):
+        return make_stop(*self.debugger.next(count))
+
+    def time(self):
+        """Current simulation time in ns"""
+        return self.debugger.get_simulation_time()
+
+    def whoami(self):
+        """Id of the packet being followed, or None"""
+        packet_id = self.debugger.whoami().packet_id
+        return None if packet_id == -1 else packet_id
+
+    def counter(self, name):
+        """Value of a counter, or None if there is no such counter"""
+        value = self.debugger.print_counter(name)
+        return None if value == -1 else value
+
+    def counters(self, pattern = None):
+        """OrderedDict of the values of the counters matching the glob pattern"""
+        names, values = self.debugger.print_all_counters(pattern)
+        return OrderedDict(zip(names, values))
+
+    def packets(self, module = None):
+        """List of the Packets in the simulation, or in the given module"""
+        ids, modules, times = self.debugger.print_packets(module)
+        return [Packet(*row) for row in zip(ids, modules, times)]
+
+    def backtrace(self, packet_id = None):
+        """List of the Hops of a packet, the followed one by default, or None if
+        the packet can't be found"""
+        msg_type, reply = self.debugger.backtrace(packet_id)
+        if msg_type != PFPSimDebugger_pb2.DebugMsg.BacktraceReply:
+            return None
+        hops = []
+        for i, module in enumerate(reply.module_list):
+            read_time = reply.read_time_list[i] if i < len(reply.read_time_list) else None
+            write_time = reply.write_time_list[i] if i < len(reply.write_time_list) else None
+            hops.append(Hop(module, read_time, write_time))
+        return hops
+
+    def raw_packet(self, packet_id):
+        """Contents of a packet as bytes, or None if the packet can't be found"""
+        msg_type, reply = self.debugger.get_raw_packet(packet_id)
+        if msg_type != PFPSimDebugger_pb2.DebugMsg.RawPacketValue:
+            return None
+        return reply.value
+
+    def dropped_packets(self):
+        """List of the Drops since the simulation started"""
+        reply = self.debugger.get_dropped_packets()
+        times = list(reply.time_list)
+        times.extend([None] * (len(reply.packet_id_list) - len(times)))
+        return [Drop(*row) for row in zip(reply.packet_id_list, reply.module_list, reply.reason_list, times)]
+
+    def table_entries(self, table_name = None, action_name = None):
+        """Generate the tables.TableEntries of a table, or of all tables"""
+        return self.debugger.iter_table_entries(table_name, action_name)
+
+    def set_breakpoint(self, module = None, packet_id = None, time_ns = None, leaving = False,
+                       temporary = False, disabled = False):
+        """Set a breakpoint hit when all the given conditions are met. The
+        module condition is on entering the module unless leaving is True.
+        Returns whether the breakpoint was set."""
+        conditions = []
+        values = []
+        if module != None:
+            if leaving:
+                conditions.append(PFPSimDebugger_pb2.BREAK_ON_MODULE_WRITE)
+            else:
+                conditions.append(PFPSimDebugger_pb2.BREAK_ON_MODULE_READ)
+            values.append(module)
+        if packet_id != None:
+            conditions.append(PFPSimDebugger_pb2.BREAK_ON_PACKET_ID)
+            values.append(str(packet_id))
+        if time_ns != None:
+            conditions.append(PFPSimDebugger_pb2.BREAK_AT_TIME)
+            values.append(str(float(time_ns)))
+        if len(conditions) == 0:
+            raise ValueError("A breakpoint needs at least one of module, packet_id or time_ns")
+        msg_type, status = self.debugger.set_breakpoint(conditions, values, temporary, disabled)
+        return status == PFPSimDebugger_pb2.GenericAcknowledgeMsg.SUCCESS
+
+    def cp(self, command):
+        """Send a control plane command, returns whether it succeeded"""
+        msg_type, status = self.debugger.cp_command(command)
+        return status == PFPSimDebugger_pb2.GenericAcknowledgeMsg.SUCCESS
@@ -0,0 +1,308 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Client side storage of counter values over the course of a simulation."""
+
+import bisect
+import fnmatch
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+
+# One row of a counter diff. rate is in counts per ns of simulation time, or
+# None if no simulation time elapsed between the two snapshots.
+CounterDelta = namedtuple('CounterDelta', ['name', 'old', 'new', 'delta', 'rate'])
+
+# A snapshot of all the counters. values is indexed by the column of the
+# counter in the owning CounterSnapshots.
+Snapshot = namedtuple('Snapshot', ['stop', 'time_ns', 'values'])
+
+
+# CounterSnapshots class - Values of all counters at a number of stops.
+#
+# Every counter is assigned a column the first time it is seen, and each
+# snapshot stores its values as a single compact array indexed by column, so
+# that many snapshots of tens of thousands of counters stay cheap.
+class CounterSnapshots(object):
+    def __init__(self, max_snapshots=32):
+        self.max_snapshots = max_snapshots
+        self.names   = []   # column -> counter name
+        self.columns = {}   # counter name -> column
+        self.snapshots = OrderedDict()  # stop -> Snapshot
+        # Version of the counters in the latest snapshot as reported by the
+        # model, None if the model doesn't report versions.
+        self.version = None
+
+    def clear(self):
+        self.__init__(self.max_snapshots)
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = len(self.names)
+            self.names.append(name)
+        return column
+
+    def latest(self):
+        if len(self.snapshots) == 0:
+            return None
+        return next(reversed(self.snapshots.values()))
+
+    def record(self, stop, time_ns, names, values, version=None, changed_only=False):
+        """Store a snapshot of the counters at the given stop.
+
+        If changed_only is True, names and values only contain the counters
+        which changed since the latest snapshot, the others keep their value.
+        """
+        latest = self.latest()
+        if changed_only and latest is not None:
+            snapshot_values = array('l', latest.values)
+        else:
+            snapshot_values = array('l')
+
+        for name, value in zip(names, values):
+            column = self._column(name)
+            if column >= len(snapshot_values):
+                snapshot_values.extend([0] * (column + 1 - len(snapshot_values)))
+            snapshot_values[column] = value
+
+        # A counter which first appeared after the latest snapshot was recorded
+        # may still be missing from a full snapshot.
+        if len(snapshot_values) < len(self.names):
+            snapshot_values.extend([0] * (len(self.names) - len(snapshot_values)))
+
+        if stop in self.snapshots:
+            del self.snapshots[stop]
+        self.snapshots[stop] = Snapshot(stop, time_ns, snapshot_values)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+
+        self.version = version
+        return self.snapshots[stop]
+
+    def diff(self, since=None):
+        """Return the CounterDeltas of all counters which changed between the
+        snapshot of stop since (the one before the latest by default) and the
+        latest snapshot, along with both snapshots.
+
+        Raises KeyError if there is no such snapshot."""
+        if len(self.snapshots) < 2 and since is None:
+            raise KeyError("No earlier snapshot")
+        stops = list(self.snapshots.keys())
+        new = self.snapshots[stops[-1]]
+        if since is None:
+            old = self.snapshots[stops[-2]]
+        else:
+            old = self.snapshots[since]
+
+        elapsed = new.time_ns - old.time_ns
+        old_values = old.values
+        old_len = len(old_values)
+
+        deltas = []
+        for column, new_value in enumerate(new.values):
+            old_value = old_values[column] if column < old_len else 0
+            if new_value != old_value:
+                delta = new_value - old_value
+                rate = delta / elapsed if elapsed > 0 else None
+                deltas.append(CounterDelta(self.names[column], old_value,
+                                           new_value, delta, rate))
+        return old, new, deltas
+
+
+# CounterSampleStore class - Values of all counters sampled at a fixed interval.
+#
+# The store is columnar and delta-encoded: each counter has its own pair of
+# compact arrays holding the index of every sample at which its value changed
+# and the amount by which it changed. Counters which rarely change cost
+# almost nothing no matter how many samples are taken, and no Python object is
+# kept per cell.
+class CounterSampleStore(object):
+    def __init__(self):
+        # Samples are added from the trace dispatcher thread
+        self.lock = threading.Lock()
+        self.names   = []   # column -> counter name
+        self.columns = {}   # counter name -> column
+        self.times   = array('d')  # sample -> simulation time in ns
+        self._indices = []  # column -> array of sample indices
+        self._deltas  = []  # column -> array of deltas at those samples
+        self._last    = array('l')  # column -> latest value
+
+    def __len__(self):
+        return len(self.times)
+
+    def _add_column(self, name):
+        column = self.columns[name] = len(self.names)
+        self.names.append(name)
+        self._indices.append(array('l'))
+        self._deltas.append(array('l'))
+        self._last.append(0)
+        return column
+
+    def add_sample(self, time_ns, columns, values, new_names=()):
+        """Add a sample in which the counters at the given columns have the
+        given values and all others are unchanged. Columns are assigned to
+        new_names in order, before the values are applied."""
+        with self.lock:
+            for name in new_names:
+                self._add_column(name)
+            self._add(time_ns, columns, values)
+
+    def add_snapshot(self, time_ns, names, values):
+        """Add a sample from the names and values of all the counters."""
+        with self.lock:
+            columns = []
+            for name in names:
+                column = self.columns.get(name)
+                if column is None:
+                    column = self._add_column(name)
+                columns.append(column)
+            self._add(time_ns, columns, values)
+
+    def _add(self, time_ns, columns, values):
+        sample = len(self.times)
+        self.times.append(time_ns)
+        last = self._last
+        for column, value in zip(columns, values):
+            delta = value - last[column]
+            if delta != 0:
+                self._indices[column].append(sample)
+                self._deltas[column].append(delta)
+                last[column] = value
+
+    def select(self, pattern=None):
+        """Return the columns of the counters matching the glob pattern"""
+        if pattern is None:
+            return list(range(len(self.names)))
+        return [self.columns[name] for name in fnmatch.filter(self.names, pattern)]
+
+    def column_values(self, column):
+        """Return an array of the value of a counter at every sample"""
+        with self.lock:
+            return self._column_values(column)
+
+    def _column_values(self, column):
+        values = array('l')
+        value = 0
+        prev = 0
+        for sample, delta in zip(self._indices[column], self._deltas[column]):
+            values.extend(array('l', [value]) * (sample - prev))
+            value += delta
+            prev = sample
+        values.extend(array('l', [value]) * (len(self.times) - prev))
+        return values
+
+    def to_numpy(self, columns=None):
+        """Return (times, names, values) where values is a samples x counters
+        numpy array, which is held in memory as a whole. Requires numpy."""
+        import numpy
+
+        with self.lock:
+            if columns is None:
+                columns = list(range(len(self.names)))
+            times = numpy.array(self.times, dtype=numpy.float64)
+            values = self._numpy_block(columns, 0, len(self.times),
+                                       [0] * len(columns), [0] * len(columns))
+            return times, [self.names[column] for column in columns], values
+
+    # The _block methods expand the values of the columns at samples start to
+    # stop. current holds the value of each column before start and cursors
+    # the position of start in its indices, both are advanced to stop.
+    def _block(self, columns, start, stop, current, cursors):
+        block = []
+        for j, column in enumerate(columns):
+            indices = self._indices[column]
+            deltas = self._deltas[column]
+            end = bisect.bisect_left(indices, stop, cursors[j])
+            values = array('l')
+            value = current[j]
+            prev = start
+            for k in range(cursors[j], end):
+                values.extend(array('l', [value]) * (indices[k] - prev))
+                value += deltas[k]
+                prev = indices[k]
+            values.extend(array('l', [value]) * (stop - prev))
+            current[j] = value
+            cursors[j] = end
+            block.append(values)
+        return block
+
+    def _numpy_block(self, columns, start, stop, current, cursors):
+        import numpy
+
+        values = numpy.zeros((stop - start, len(columns)), dtype=numpy.int64)
+        for j, column in enumerate(columns):
+            end = bisect.bisect_left(self._indices[column], stop, cursors[j])
+            indices = numpy.array(self._indices[column][cursors[j]:end], dtype=numpy.int64)
+            deltas = numpy.array(self._deltas[column][cursors[j]:end], dtype=numpy.int64)
+            values[indices - start, j] = deltas
+            if stop > start:
+                values[0, j] += current[j]
+            cursors[j] = end
+        numpy.cumsum(values, axis=0, out=values)
+        if stop > start:
+            current[:] = values[-1].tolist()
+        return values
+
+    # Number of samples expanded and written at a time by export_csv
+    CSV_BLOCK = 4096
+
+    def export_csv(self, out, columns=None):
+        """Write one row per sample, with the time and the value of the
+        selected counters, to the file-like object out.
+
+        Only a block of samples is expanded at a time, with numpy when it is
+        available, and samples may still be added between blocks. The samples
+        added after the export started aren't exported."""
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        with self.lock:
+            if columns is None:
+                columns = list(range(len(self.names)))
+            total = len(self.times)
+        current = [0] * len(columns)
+        cursors = [0] * len(columns)
+
+        out.write(",".join(["time_ns"] + [self.names[column] for column in columns]) + "\n")
+        for start in range(0, total, self.CSV_BLOCK):
+            stop = min(start + self.CSV_BLOCK, total)
+            with self.lock:
+                times = self.times[start:stop]
+                if not columns:
+                    rows = [()] * len(times)
+                elif numpy is not None:
+                    rows = self._numpy_block(columns, start, stop, current, cursors).tolist()
+                else:
+                    rows = zip(*self._block(columns, start, stop, current, cursors))
+            out.write("".join([repr(time_ns) + "," + ",".join(map(str, row)) + "\n"
+                               for time_ns, row in zip(times, rows)]))
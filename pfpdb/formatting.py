@@ -0,0 +1,172 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Rendering of the output of commands, as text or as JSON records.
+
+Commands hand their output to a formatter one record at a time: tables row by
+row, and other output such as a breakpoint hit as a single record. The text
+formatter prints what pfpdb always printed, the JSON formatter prints one JSON
+object per line (NDJSON), with a "type" key naming the kind of record.
+"""
+
+import binascii
+import json
+import sys
+from collections import OrderedDict
+from numbers import Number
+
+
+# StreamingTable class - Prints rows as they are added, in the same layout as
+# tabulate, without holding more than one batch of rows in memory.
+#
+# The first batch is laid out by tabulate itself, which decides the width of
+# every column. Later rows are padded to the same widths, a cell which is
+# wider than its column just pushes the following cells to the right.
+class StreamingTable(object):
+    def __init__(self, headers, out, batch_size=1000, **tabulate_args):
+        self.headers = headers
+        self.out = out
+        self.batch_size = batch_size
+        self.tabulate_args = tabulate_args
+        self.rows = 0
+        self._batch = []
+        self._widths = None
+        self._numeric = None
+
+    def add_row(self, row):
+        self.rows += 1
+        if self._widths is not None:
+            self.out.write(self._format(row) + "\n")
+            return
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Print the rows added so far. Must be called after the last row."""
+        if self._widths is not None:
+            return
+        # Loaded on first use, as most sessions never print a table
+        from tabulate import tabulate
+        lines = tabulate(self._batch, headers=self.headers, **self.tabulate_args).split("\n")
+        # The second line underlines every column with dashes
+        self._widths = [len(dashes) for dashes in lines[1].split("  ")]
+        right = self.tabulate_args.get("numalign", "decimal") != "left"
+        self._numeric = [right and all(isinstance(row[i], Number) for row in self._batch if row[i] != None)
+                         and any(row[i] != None for row in self._batch)
+                         for i in range(len(self.headers))]
+        self._batch = None
+        self.out.write("\n".join(lines) + "\n")
+
+    def _format(self, row):
+        cells = []
+        for value, width, numeric in zip(row, self._widths, self._numeric):
+            cell = "" if value == None else str(value)
+            cells.append(cell.rjust(width) if numeric else cell.ljust(width))
+        return "  ".join(cells).rstrip()
+
+
+# JsonRecords class - Prints rows as JSON records, the counterpart of
+# StreamingTable for the JSON formatter.
+class JsonRecords(object):
+    def __init__(self, record_type, keys, out, extra=()):
+        self.record_type = record_type
+        self.keys = keys
+        self.out = out
+        self.extra = list(extra)
+        self.rows = 0
+
+    def add_row(self, row):
+        self.rows += 1
+        write_record(self.out, self.record_type, self.extra + list(zip(self.keys, row)))
+
+    def flush(self):
+        self.out.flush()
+
+
+def _encode(value):
+    """Convert values which json can't serialize: bytes to hex strings, and
+    arrays and other iterables to lists"""
+    if isinstance(value, (bytes, bytearray)):
+        return binascii.hexlify(value).decode("ascii")
+    try:
+        return list(value)
+    except TypeError:
+        return str(value)
+
+
+def write_record(out, record_type, fields):
+    """Write one JSON record made of the type and the (key, value) fields"""
+    record = OrderedDict([("type", record_type)])
+    record.update(fields)
+    out.write(json.dumps(record, default=_encode) + "\n")
+
+
+# TextFormatter class - Renders the output of commands as text for a terminal.
+#
+# Tables are given as (key, heading) columns, the keys are only used by the
+# JSON formatter. Records come with their text rendering, which is printed as
+# is, or not at all if it is None. Headings only label or separate the text
+# rendering.
+class TextFormatter(object):
+    structured = False
+
+    def table(self, record_type, columns, extra=(), **tabulate_args):
+        return StreamingTable([heading for _, heading in columns], sys.stdout, **tabulate_args)
+
+    def record(self, record_type, fields, text):
+        if text != None:
+            print(text)
+
+    def message(self, text):
+        print(text)
+
+    def heading(self, text):
+        print(text)
+
+
+# JsonFormatter class - Renders the output of commands as NDJSON records.
+#
+# extra holds (key, value) fields added to every row of a table. Messages,
+# such as errors, become records of type "message".
+class JsonFormatter(object):
+    structured = True
+
+    def table(self, record_type, columns, extra=(), **tabulate_args):
+        return JsonRecords(record_type, [key for key, _ in columns], sys.stdout, extra)
+
+    def record(self, record_type, fields, text):
+        write_record(sys.stdout, record_type, fields)
+
+    def message(self, text):
+        write_record(sys.stdout, "message", [("text", text)])
+
+    def heading(self, text):
+        pass
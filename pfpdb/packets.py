@@ -0,0 +1,100 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Client side mirror of the packets in flight in the simulation."""
+
+from collections import namedtuple
+
+# Location of a packet, time is the time at which it entered module
+PacketLocation = namedtuple('PacketLocation', ['module', 'time'])
+
+
+# PacketMirror class - Copy of the model's packet list, indexed by packet id and
+# by module.
+#
+# The model stamps its packet list with a generation which changes every time a
+# packet is added, moved or removed. Given the generation of the mirror, it can
+# reply with only what changed since then, which apply() merges in.
+class PacketMirror(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.generation = None  # Generation of the model's list we mirror
+        self.by_id = {}         # packet id -> PacketLocation
+        self.by_module = {}     # module -> set of packet ids
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def apply(self, reply):
+        """Merge a PacketListValuesMsg into the mirror"""
+        if not reply.incremental:
+            self.by_id = {}
+            self.by_module = {}
+
+        for ident in reply.removed_id_list:
+            self._remove(ident)
+
+        for ident, module, time in zip(reply.id_list, reply.location_list, reply.time_list):
+            self._remove(ident)
+            self.by_id[ident] = PacketLocation(module, time)
+            ids = self.by_module.get(module)
+            if ids is None:
+                ids = self.by_module[module] = set()
+            ids.add(ident)
+
+        if reply.HasField("generation"):
+            self.generation = reply.generation
+        else:
+            self.generation = None
+
+    def _remove(self, ident):
+        location = self.by_id.pop(ident, None)
+        if location is not None:
+            ids = self.by_module[location.module]
+            ids.discard(ident)
+            if len(ids) == 0:
+                del self.by_module[location.module]
+
+    def packets(self, module=None):
+        """Return the (ids, locations, times) lists of the packets, sorted by
+        id, optionally only those in the given module"""
+        if module is None:
+            ids = sorted(self.by_id)
+        else:
+            ids = sorted(self.by_module.get(module, ()))
+        locations = []
+        times = []
+        for ident in ids:
+            location = self.by_id[ident]
+            locations.append(location.module)
+            times.append(location.time)
+        return ids, locations, times
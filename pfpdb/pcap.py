@@ -0,0 +1,87 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Writer for the pcapng capture file format.
+
+Only what is needed to save packets from the simulation is supported: a single
+section with a single interface, whose timestamps are in nanoseconds, and
+enhanced packet blocks with an optional comment.
+"""
+
+import struct
+
+LINKTYPE_ETHERNET = 1
+
+_SECTION_HEADER_BLOCK   = 0x0A0D0D0A
+_INTERFACE_DESCRIPTION  = 0x00000001
+_ENHANCED_PACKET_BLOCK  = 0x00000006
+_BYTE_ORDER_MAGIC       = 0x1A2B3C4D
+
+_OPT_ENDOFOPT = 0
+_OPT_COMMENT  = 1
+_IF_TSRESOL   = 9
+
+
+def _pad(data):
+    return data + b'\0' * (-len(data) % 4)
+
+
+def _option(code, value):
+    return struct.pack('<HH', code, len(value)) + _pad(value)
+
+
+def _block(block_type, body):
+    length = len(body) + 12
+    return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+
+
+# PcapngWriter class - Writes packets to a pcapng file as they are given
+class PcapngWriter(object):
+    def __init__(self, out, linktype=LINKTYPE_ETHERNET):
+        self.out = out
+        self.count = 0
+
+        # Section of unspecified length
+        out.write(_block(_SECTION_HEADER_BLOCK,
+                         struct.pack('<IHHq', _BYTE_ORDER_MAGIC, 1, 0, -1)))
+        # Timestamps are in units of 10^-9 s, i.e. simulation time in ns
+        out.write(_block(_INTERFACE_DESCRIPTION,
+                         struct.pack('<HHI', linktype, 0, 0)
+                         + _option(_IF_TSRESOL, b'\x09')
+                         + _option(_OPT_ENDOFOPT, b'')))
+
+    def write_packet(self, data, time_ns, comment=None):
+        timestamp = int(round(time_ns))
+        body = struct.pack('<IIIII', 0, timestamp >> 32, timestamp & 0xFFFFFFFF,
+                           len(data), len(data)) + _pad(data)
+        if comment:
+            body += _option(_OPT_COMMENT, comment.encode('utf-8')) + _option(_OPT_ENDOFOPT, b'')
+        self.out.write(_block(_ENHANCED_PACKET_BLOCK, body))
+        self.count += 1
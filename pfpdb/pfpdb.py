@@ -40,677 +40,67 @@ import os
 import re
 import sys
 import subprocess
-import nnpy
 import cmd
 import argparse
-import logging
 import traceback
+import binascii
+import time
 from functools import wraps
-from tabulate import tabulate
-from hexdump import hexdump
-import json
+from collections import deque, OrderedDict
 from . import PFPSimDebugger_pb2
-from . import tracing
-
-if sys.version_info[0] > 2:
-    from functools import reduce
-
-# DebuggerIPCSession class - Handles the transmission and reception of messages to and from the DebuggerIPCServer
-class DebuggerIPCSession:
-    def __init__(self, url):
-        self.url = url  # url on which the ipc will occur
-        self.socket = nnpy.Socket(nnpy.AF_SP, nnpy.REQ) # create socket
-        self.socket.setsockopt(nnpy.SOL_SOCKET, nnpy.RCVTIMEO, 100)
-        self.socket.connect(self.url)   # connect socket
-
-    # Send message through socket. The message must be an object generated from the protocol buffer compiler or a wrapper around such an object.
-    def send(self, message):
-        self.socket.send(message.SerializeToString())
-
-    # Receive message from server through the socket.
-    # TODO(gordon) There must be a more concise way of doing this
-    def recv(self):
-        data = self.socket.recv()
-        recv_msg = PFPSimDebugger_pb2.DebugMsg()
-        recv_msg.ParseFromString(data)
-        if recv_msg.type == PFPSimDebugger_pb2.DebugMsg.CounterValue:
-            child_msg = PFPSimDebugger_pb2.CounterValueMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg.value
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllCounterValues:
-            child_msg = PFPSimDebugger_pb2.AllCounterValuesMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg.name_list, child_msg.value_list
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllBreakpointValues:
-            child_msg = PFPSimDebugger_pb2.AllBreakpointValuesMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.BreakpointHit:
-            child_msg = PFPSimDebugger_pb2.BreakpointHitMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
-            child_msg = PFPSimDebugger_pb2.GenericAcknowledgeMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg.status
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.WhoAmIReply:
-            child_msg = PFPSimDebugger_pb2.WhoAmIReplyMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.PacketListValues:
-            child_msg = PFPSimDebugger_pb2.PacketListValuesMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg.id_list, child_msg.location_list, child_msg.time_list
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.WatchpointHit:
-            child_msg = PFPSimDebugger_pb2.WatchpointHitMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllWatchpointValues:
-            child_msg = PFPSimDebugger_pb2.AllWatchpointValuesMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.BacktraceReply:
-            child_msg = PFPSimDebugger_pb2.BacktraceReplyMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg;
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.SimulationEnd:
-            child_msg = PFPSimDebugger_pb2.SimulationEndMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.SimulationStopped:
-            child_msg = PFPSimDebugger_pb2.SimulationStoppedMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.AllIgnoreModules:
-            child_msg = PFPSimDebugger_pb2.AllIgnoreModulesMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.SimulationTime:
-            child_msg = PFPSimDebugger_pb2.SimulationTimeMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg.time_ns
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.PacketDropped:
-            child_msg = PFPSimDebugger_pb2.PacketDroppedMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.DroppedPackets:
-            child_msg = PFPSimDebugger_pb2.DroppedPacketsMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.TableEntries:
-            child_msg = PFPSimDebugger_pb2.TableEntriesMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return child_msg;
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.ParsedPacketValue:
-            child_msg = PFPSimDebugger_pb2.ParsedPacketValueMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.RawPacketValue:
-            child_msg = PFPSimDebugger_pb2.RawPacketValueMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
-        elif recv_msg.type == PFPSimDebugger_pb2.DebugMsg.PacketFieldValue:
-            child_msg = PFPSimDebugger_pb2.PacketFieldValueMsg()
-            child_msg.ParseFromString(recv_msg.message)
-            return recv_msg.type, child_msg
+from . import cache
+from . import pcap
+from . import formatting
+from . import script
+from . import startup
+from .client import (DebuggerIPCSession, PFPSimDebugger, Simulation, SimulationExited, DEFAULT_URL,
+                     DEFAULT_TRACE_URL, AUTO_URL, find_pids)
+
+
+# Columns of the table entries printed by table_dump and table_lookup
+TABLE_ENTRY_COLUMNS = [("table", "Table"), ("action", "Action"), ("match_key", "Match Key"), ("handle", "Handle"),
+                       ("action_data", "Action Data"), ("status", "Status")]
+
+# Row of the JSON records of a table entry, matching TABLE_ENTRY_COLUMNS
+def table_entry_record(entry):
+    return [entry.table_name, entry.action_name, list(entry.match_key), entry.handle, list(entry.action_data),
+            table_entry_status(entry.status)]
+
+# Name of a TableEntriesMsg.TableEntryStatus
+def table_entry_status(status):
+    if status == PFPSimDebugger_pb2.TableEntriesMsg.OK:
+        return "OK"
+    elif status == PFPSimDebugger_pb2.TableEntriesMsg.INSERTING:
+        return "INSERTING"
+    elif status == PFPSimDebugger_pb2.TableEntriesMsg.DELETING:
+        return "DELETING"
+    elif status == PFPSimDebugger_pb2.TableEntriesMsg.MODIFYING:
+        return "MODIFYING"
+    return "NONE"
+
+# Formats values stored back to back in data, with the given lengths, in the
+# 'hex', 'dec' or 'ip4' format. Returns None if the format is unknown.
+def format_values(data, lengths, fmt = 'hex'):
+    if fmt not in ('hex', 'dec', 'ip4'):
+        return None
+    # All the data is converted at once, each value is then a slice of digits
+    digits = binascii.hexlify(data).decode('ascii').upper()
+    formatted = []
+    start = 0
+    for length in lengths:
+        value = digits[2 * start:2 * (start + length)]
+        start += length
+        if fmt == 'dec':
+            formatted.append(int(value or '0', 16))
+        elif fmt == 'ip4' and length == 4:
+            formatted.append('.'.join(str(int(value[i:i + 2], 16)) for i in (0, 2, 4, 6)))
         else:
-            return recv_msg.type, recv_msg
-
-# DebuggerMessage class - Base class for wrappers around protobuf objects
-class DebuggerMessage(object):
-    def __init__(self, type_):
-        self.parent_msg = PFPSimDebugger_pb2.DebugMsg()
-        self.message = None
-        self.parent_msg.type = type_
-
-    def SerializeToString(self):
-        self.SerializeMessage()
-        return self.parent_msg.SerializeToString()
-
-    def SerializeMessage(self):
-        if self.message != None:
-            self.parent_msg.message = self.message.SerializeToString()
-
-# Wrappers around protobuf objects. They must inherit DebuggerMessage and set their own type
-class RunMessage(DebuggerMessage):
-    def __init__(self, time_ns = None):
-        super(RunMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Run)
-        self.message = PFPSimDebugger_pb2.RunMsg()
-        if time_ns != None:
-            self.message.time_ns = str(time_ns)
-            print("Session - run time: " + self.message.time_ns)
-
-class GetCounterMessage(DebuggerMessage):
-    def __init__(self, name):
-        super(GetCounterMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetCounter)
-        self.message = PFPSimDebugger_pb2.GetCounterMsg()
-        self.message.name = name
-
-class GetAllCountersMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetAllCountersMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllCounters)
-        self.message = PFPSimDebugger_pb2.GetAllCountersMsg()
-
-class SetBreakpointMessage(DebuggerMessage):
-    def __init__(self, condition, value, temp, disabled):
-        super(SetBreakpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.SetBreakpoint)
-        self.message = PFPSimDebugger_pb2.SetBreakpointMsg()
-        if temp is True:
-            self.message.temporary = '1'
-        else:
-            self.message.temporary = '0'
-        if disabled is True:
-            self.message.disabled = '1'
-        else:
-            self.message.disabled = '0'
-
-        for i,cond in enumerate(condition):
-            self.message.condition_list.append(cond)
-            self.message.value_list.append(value[i])
-
-class ContinueMessage(DebuggerMessage):
-    def __init__(self, time_ns = None):
-        super(ContinueMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Continue)
-        self.message = PFPSimDebugger_pb2.ContinueMsg()
-        if time_ns != None:
-            self.message.time_ns = str(time_ns)
-
-class GetAllBreakpointsMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetAllBreakpointsMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllBreakpoints)
-        self.message = PFPSimDebugger_pb2.GetAllBreakpointsMsg()
-
-class RemoveBreakpointMessage(DebuggerMessage):
-    def __init__(self, bkpt_id):
-        super(RemoveBreakpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.RemoveBreakpoint)
-        self.message = PFPSimDebugger_pb2.RemoveBreakpointMsg()
-        self.message.id = str(bkpt_id);
-
-class WhoAmIMessage(DebuggerMessage):
-    def __init__(self):
-        super(WhoAmIMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.WhoAmI)
-        self.message = PFPSimDebugger_pb2.WhoAmIMsg()
-
-class NextMessage(DebuggerMessage):
-    def __init__(self):
-        super(NextMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Next)
-        self.message = PFPSimDebugger_pb2.NextMsg()
-
-class GetPacketListMessage(DebuggerMessage):
-    def __init__(self, module = None):
-        super(GetPacketListMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetPacketList)
-        self.message = PFPSimDebugger_pb2.GetPacketListMsg()
-        if module != None:
-            self.message.module = module
-
-class SetWatchpointMessage(DebuggerMessage):
-    def __init__(self, counter, disabled):
-        super(SetWatchpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.SetWatchpoint)
-        self.message = PFPSimDebugger_pb2.SetWatchpointMsg()
-        self.message.counter_name = counter
-        if disabled is True:
-            self.message.disabled = '1'
-        else:
-            self.message.disabled = '0'
-
-class GetAllWatchpointValuesMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetAllWatchpointValuesMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllWatchpoints)
-        self.message = PFPSimDebugger_pb2.GetAllWatchpointsMsg()
-
-class RemoveWatchpointMessage(DebuggerMessage):
-    def __init__(self, wp_id):
-        super(RemoveWatchpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.RemoveWatchpoint)
-        self.message = PFPSimDebugger_pb2.RemoveWatchpointMsg()
-        self.message.id = str(wp_id)
-
-class BacktraceMessage(DebuggerMessage):
-    def __init__(self, pk_id = None):
-        super(BacktraceMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.Backtrace)
-        self.message = PFPSimDebugger_pb2.BacktraceMsg()
-        if pk_id != None:
-            self.message.packet_id = str(pk_id)
-
-class EnableDisableBreakpointMessage(DebuggerMessage):
-    def __init__(self, bk_id, enable):
-        super(EnableDisableBreakpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.EnableDisableBreakpoint)
-        self.message = PFPSimDebugger_pb2.EnableDisableBreakpointMsg()
-        self.message.id = str(bk_id)
-        if enable is True:
-            self.message.enable = '1'
-        else:
-            self.message.enable = '0'
-
-class EnableDisableWatchpointMessage(DebuggerMessage):
-    def __init__(self, wp_id, enable):
-        super(EnableDisableWatchpointMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.EnableDisableWatchpoint)
-        self.message = PFPSimDebugger_pb2.EnableDisableWatchpointMsg()
-        self.message.id = str(wp_id)
-        if enable is True:
-            self.message.enable = '1'
-        else:
-            self.message.enable = '0'
-
-class IgnoreModuleMessage(DebuggerMessage):
-    def __init__(self, module, delete = False):
-        super(IgnoreModuleMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.IgnoreModule)
-        self.message = PFPSimDebugger_pb2.IgnoreModuleMsg()
-        self.message.module = module
-        self.message.delete = delete;
-
-class GetAllIgnoreModulesMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetAllIgnoreModulesMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetAllIgnoreModules)
-        self.message = PFPSimDebugger_pb2.GetAllIgnoreModulesMsg()
-
-class GetSimulationTimeMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetSimulationTimeMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetSimulationTime)
-        self.message = PFPSimDebugger_pb2.GetSimulationTimeMsg()
-
-class BreakOnPacketDropMessage(DebuggerMessage):
-    def __init__(self, on):
-        super(BreakOnPacketDropMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.BreakOnPacketDrop)
-        self.message = PFPSimDebugger_pb2.BreakOnPacketDropMsg()
-        self.message.on = on
-
-class GetDroppedPacketsMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetDroppedPacketsMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetDroppedPackets)
-        self.message = PFPSimDebugger_pb2.GetDroppedPacketsMsg()
-
-# Control Plane Messages
-class CPCommandMessage(DebuggerMessage):
-    def __init__(self, command):
-        super(CPCommandMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.CPCommand)
-        self.message = PFPSimDebugger_pb2.CPCommandMsg()
-        self.message.command = command
-
-class GetTableEntriesMessage(DebuggerMessage):
-    def __init__(self):
-        super(GetTableEntriesMessage, self).__init__(PFPSimDebugger_pb2.DebugMsg.GetTableEntries)
-        self.message = PFPSimDebugger_pb2.GetTableEntriesMsg()
-
-class GetParsedPacketMessage(DebuggerMessage):
-    def __init__(self, id):
-        super(GetParsedPacketMessage, self).__init__(
-                PFPSimDebugger_pb2.DebugMsg.GetParsedPacket)
-        self.message = PFPSimDebugger_pb2.GetParsedPacketMsg()
-        self.message.id = id
-
-class GetRawPacketMessage(DebuggerMessage):
-    def __init__(self, id):
-        super(GetRawPacketMessage, self).__init__(
-                PFPSimDebugger_pb2.DebugMsg.GetRawPacket)
-        self.message = PFPSimDebugger_pb2.GetRawPacketMsg()
-        self.message.id = id
-
-class GetPacketFieldMessage(DebuggerMessage):
-    def __init__(self, id, field_name):
-        super(GetPacketFieldMessage, self).__init__(
-                PFPSimDebugger_pb2.DebugMsg.GetPacketField)
-        self.message = PFPSimDebugger_pb2.GetPacketFieldMsg()
-        self.message.id = id
-        self.message.field_name = field_name
-
-class StartTracingMessage(DebuggerMessage):
-    def __init__(self, **kwargs):
-        super(StartTracingMessage, self).__init__(
-                PFPSimDebugger_pb2.DebugMsg.StartTracing)
-        self.message = PFPSimDebugger_pb2.StartTracingMsg()
-
-        if "counter" in kwargs:
-            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.COUNTER
-            self.message.name = kwargs["counter"]
-        elif "throughput" in kwargs:
-            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.THROUGHPUT
-            self.message.name = kwargs["throughput"]
-        elif "from_latency" in kwargs and "to_latency" in kwargs:
-            self.message.type = PFPSimDebugger_pb2.StartTracingMsg.LATENCY
-            self.message.name = kwargs["from_latency"]
-            self.message.end_name = kwargs["to_latency"]
-        else:
-            raise TypeError("Missing required Keyword Args, one of: 'counter',"
-                          + " 'throughput', or ('from_latency','to_latency')")
-
-
-# PFPSimDebugger class - Manages requests and replies through the IPC Session and the child process. Creates a layer of abstraction between the front end of the debugger and the ipc session and the child process.
-class PFPSimDebugger(object):
-    def __init__(self, ipc_session, process, pid, verbose):
-        self.ipc_session = ipc_session
-        self.process = process
-        self.pid = pid
-        self.log = logging.getLogger("cmd_logger")
-        self.log.addHandler(logging.StreamHandler())
-        self.trace_manager = tracing.TraceManager()
-        if verbose:
-            self.log.setLevel("DEBUG")
-
-    def recv(self):
-        while(1):
-            try:
-                return self.ipc_session.recv()
-            except AssertionError:
-                if nnpy.nanomsg.nn_errno() not in (nnpy.ETIMEDOUT, nnpy.EAGAIN):
-                    error_msg = nnpy.ffi.string(nnpy.nanomsg.nn_strerror(nnpy.nanomsg.nn_errno()))
-                    raise RuntimeError("Error in nanomsg recv: " + error_msg)
-                else:
-                    # The read timed out. If the process is dead, we should terminate, otherwise do
-                    # nothing and try again
-                    if self.process is not None:
-                        exit_code = self.process.poll()
-                        if exit_code != None:
-                            print("The child process has exited. Exit Code: " + str(exit_code))
-                            sys.exit(1)
-                    # Used when attaching to running simulation
-                    else:
-                        try:
-                            os.kill(int(self.pid), 0)
-                        except OSError:
-                            print("The attached process is no longer running.")
-                            sys.exit(0)
-
-    def run(self, time_ns = None):
-        self.log.debug("Request: Run")
-        if time_ns != None:
-            request = RunMessage(time_ns)
-        else:
-            request = RunMessage()
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Recieved!")
-        return msg_type, reply
-
-    def restart(self):
-        if self.process is None:
-            return False
-        else:
-            if self.process.poll() == None:
-                self.log.debug("Killing simulation...")
-                self.process.kill()
-            self.log.debug("Starting simulation...")
-            self.process = start_simulation()
-            return True
-
-    def print_counter(self, counter_name):
-        self.log.debug("Request: Get Counter Value for " + counter_name)
-        request = GetCounterMessage(counter_name)
-        return self.__sendrecv(request)
-
-    def print_all_counters(self):
-        self.log.debug("Request: Get All Counter Values")
-        request = GetAllCountersMessage()
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        names, values = self.recv()
-        self.log.debug("Msg Received!")
-        return names, values
-
-    def print_packets(self, module = None):
-        self.log.debug("Request: Get Packet List")
-        if module == None:
-            request = GetPacketListMessage();
-        else:
-            request = GetPacketListMessage(module);
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        ids, locations, times = self.recv()
-        self.log.debug("Msg Received!")
-        return ids, locations, times
-
-    def get_parsed_packet(self, packet_id):
-        self.log.debug("Request: Get parsed packet")
-
-        request = GetParsedPacketMessage(packet_id)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, recv_msg = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, recv_msg
-
-    def get_raw_packet(self, packet_id):
-        self.log.debug("Request: Get raw packet")
-
-        request = GetRawPacketMessage(packet_id)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, recv_msg = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, recv_msg
-
-    def get_packet_field(self, packet_id, field_name):
-        self.log.debug("Request: Get packet field: " + field_name + " for packet " + str(packet_id))
-
-        request = GetPacketFieldMessage(packet_id, field_name)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, recv_msg = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, recv_msg
-
-    def start_trace(self, **kwargs):
-        FROM_LATENCY = 'from_latency'
-        TO_LATENCY   = 'to_latency'
-        THROUGHPUT   = 'throughput'
-        COUNTER      = 'counter'
-
-        APPEND       = 'append'
-
-        if THROUGHPUT in kwargs:
-            request = StartTracingMessage(throughput=kwargs[THROUGHPUT])
-            y_axis  = "throughput (pps)"
-            title   = "Throughput of " + kwargs[THROUGHPUT]
-
-        elif COUNTER in kwargs:
-            request = StartTracingMessage(counter=kwargs[COUNTER])
-            y_axis  = "counter value"
-            title   = kwargs[COUNTER]
-
-        elif FROM_LATENCY in kwargs and TO_LATENCY in kwargs:
-            request = StartTracingMessage(to_latency=kwargs[TO_LATENCY],
-                                      from_latency=kwargs[FROM_LATENCY])
-            y_axis  = "latency (ns)"
-            if kwargs[FROM_LATENCY] == kwargs[TO_LATENCY]:
-                title = "Latency of " + kwargs[FROM_LATENCY]
-            else:
-                title = "Latency from " + kwargs[FROM_LATENCY] + " to " + kwargs[TO_LATENCY]
-
-        else:
-            raise TypeError("Missing required keyword arguments. " +
-                            "Requires one of ["+THROUGHPUT+", "+COUNTER+", " +
-                            "("+FROM_LATENCY+", "++")]")
-
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, recv_msg = self.recv()
-        self.log.debug("Msg Received!")
-
-        if msg_type == PFPSimDebugger_pb2.DebugMsg.StartTracingStatus:
-            msg = PFPSimDebugger_pb2.StartTracingStatusMsg()
-            msg.ParseFromString(recv_msg.message)
-
-            if APPEND in kwargs and kwargs[APPEND] is not None:
-                self.trace_manager.append_to_trace(kwargs[APPEND], msg.id,
-                                                   y_axis=y_axis, title=title)
-            else:
-                self.trace_manager.add_trace(msg.id, x_axis="time (ns)",
-                                             y_axis=y_axis, title=title)
-
-            return True
-        else:
-            return False
-
-
-    def continue_(self, time_ns = None):
-        self.log.debug("Request: Continue")
-        if time_ns != None:
-            request = ContinueMessage(time_ns)
-        else:
-            request = ContinueMessage()
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def next(self):
-        request = NextMessage()
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Recieved!")
-        return msg_type, reply
-
-    def set_breakpoint(self, conditions, values, temp, disabled):
-        request = SetBreakpointMessage(conditions, values, temp, disabled)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Recieved!")
-        return msg_type, reply
-
-    def delete_breakpoint(self, bkpt_id):
-        request = RemoveBreakpointMessage(bkpt_id)
-        return self.__sendrecv(request)
-
-    def get_breakpoints(self):
-        request = GetAllBreakpointsMessage()
-        return self.__sendrecv(request)
-
-    def disable_breakpoint(self, bkpt_id):
-        request = EnableDisableBreakpointMessage(bkpt_id, False)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def enable_breakpoint(self, bkpt_id):
-        request = EnableDisableBreakpointMessage(bkpt_id, True)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def set_watchpoint(self, counter_name, disabled):
-        request = SetWatchpointMessage(counter_name, disabled)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Recieved!")
-        return msg_type, reply
-
-    def delete_watchpoint(self, wp_id):
-        request = RemoveWatchpointMessage(wp_id)
-        return self.__sendrecv(request)
-
-    def get_watchpoints(self):
-        request = GetAllWatchpointValuesMessage()
-        return self.__sendrecv(request)
-
-    def disable_watchpoint(self, wp_id):
-        request = EnableDisableWatchpointMessage(wp_id, False)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def enable_watchpoint(self, wp_id):
-        request = EnableDisableWatchpointMessage(wp_id, True)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def backtrace(self, packet_id = None):
-        if packet_id != None:
-            request = BacktraceMessage(packet_id)
-        else:
-            request = BacktraceMessage();
-        self.log.debug("Request: Backtrace")
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def whoami(self):
-        request = WhoAmIMessage()
-        return self.__sendrecv(request)
-
-    def ignore_module(self, module):
-        request = IgnoreModuleMessage(module)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def delete_ignore_module(self, module):
-        request = IgnoreModuleMessage(module, True)
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        msg_type, reply = self.recv()
-        self.log.debug("Msg Received!")
-        return msg_type, reply
-
-    def get_ignore_modules(self):
-        request = GetAllIgnoreModulesMessage()
-        return self.__sendrecv(request)
-
-    def get_simulation_time(self):
-        request = GetSimulationTimeMessage()
-        return self.__sendrecv(request)
-
-    def break_on_packet_drop(self):
-        request = BreakOnPacketDropMessage(True)
-        return self.__sendrecv(request)
-
-    def delete_break_on_packet_drop(self):
-        request = BreakOnPacketDropMessage(False)
-        return self.__sendrecv(request)
-
-    def get_dropped_packets(self):
-        request = GetDroppedPacketsMessage()
-        return self.__sendrecv(request)
-
-    def quit(self):
-        if self.process is not None:
-            if self.process.poll() == None:
-                self.process.kill()
-
-    def cp_command(self, command):
-        request = CPCommandMessage(command)
-        return self.__sendrecv(request)
-
-    def get_table_entries(self):
-        request = GetTableEntriesMessage()
-        msg  = self.__sendrecv(request)
-        table_entries = {}
-        for entry in msg.entry_list:
-            table_entry = {'table_name' : entry.table_name, 'match_key' : entry.match_key_list, 'action_name' : entry.action_name, 'handle' : entry.handle, 'status' : entry.status, 'action_data' : entry.action_data_list}
-            if entry.table_name in table_entries:
-                if entry.action_name in table_entries[entry.table_name]:
-                    table_entries[entry.table_name][entry.action_name].append(table_entry)
-                else:
-                    table_entries[entry.table_name][entry.action_name] = [table_entry]
-            else:
-                table_entries[entry.table_name] = {}
-                table_entries[entry.table_name][entry.action_name] = [table_entry]
-
-        return table_entries;
-
-    def __sendrecv(self, request):
-        self.ipc_session.send(request)
-        self.log.debug("Msg Sent!")
-        reply = self.recv()
-        self.log.debug("Msg Received!")
-        return reply
+            formatted.append(':'.join(map(''.join, zip(value[0::2], value[1::2]))))
+    return formatted
 
+# Formats bytes as colon separated hex digits, e.g. C0:FF:00:01
+def format_hex(data):
+    return format_values(data, [len(data)])[0]
 
 # BadInputException - Exception raised when the the command is incorrect in any way
 class BadInputException(Exception):
@@ -726,25 +116,175 @@ def handle_bad_input(func):
         try:
             return func(self, line)
         except BadInputException as e:
-            print("Incorrect %s command. Use 'help' command to see correct syntax." % (e))
+            self.formatter.message("Incorrect %s command. Use 'help' command to see correct syntax." % (e))
+            self.errors += 1
     return func_wrapper
 
+# Comparison operators accepted by 'watch counter <name> if <op> <value>'
+WATCH_COMPARISONS = {
+    '>'  : PFPSimDebugger_pb2.WATCH_GREATER_THAN,
+    '>=' : PFPSimDebugger_pb2.WATCH_GREATER_EQUAL,
+    '<'  : PFPSimDebugger_pb2.WATCH_LESS_THAN,
+    '<=' : PFPSimDebugger_pb2.WATCH_LESS_EQUAL,
+    '==' : PFPSimDebugger_pb2.WATCH_EQUAL,
+}
+
+# Returns a human readable description of a watchpoint condition
+def describe_watch_condition(condition, value):
+    for op, cond in WATCH_COMPARISONS.items():
+        if cond == condition:
+            return op + " " + value
+    if condition == PFPSimDebugger_pb2.WATCH_CROSSES:
+        return "crosses " + value
+    elif condition == PFPSimDebugger_pb2.WATCH_DELTA_AT_LEAST:
+        return "delta >= " + value
+    elif condition == PFPSimDebugger_pb2.WATCH_RATE_ABOVE:
+        return "rate > " + value + " per ns"
+    return "any change"
+
 # PFPSimDebuggerCmd class - Command Line Interface for PFPSimDebugger
+# Commands which don't change the state of the simulation, and may therefore
+# have their requests batched together in batch mode
+READ_ONLY_COMMANDS = ('print', 'backtrace', 'bt', 'whoami', 'whattimeisit', 'info', 'table_dump',
+                      'table_lookup', 'help')
+
 class PFPSimDebuggerCmd(cmd.Cmd):
-    def __init__(self, debugger):
+    def __init__(self, debugger, interactive = True, output = "text"):
         cmd.Cmd.__init__(self)	# Call cmd.Cmd constructor
         self.prompt = "\033[36m(PFPSimDebug) \033[0m"
         self.debugger = debugger
         self.run_called = False
         self.sim_ended = False
-
-        # By default many special chars delimit words for the Cmd completer
-        # but our counter names may have weird special chars in them, so we
-        # want to only delimit based on space chars
-        #
-        # Sometimes global stuff makes life better
-        import readline
-        readline.set_completer_delims(" \t\n")
+        # Number of commands which failed, for the exit code of batch mode
+        self.errors = 0
+        # Renders the output of commands, JSON for a single command given -j
+        if output == "json":
+            self.default_formatter = formatting.JsonFormatter()
+        else:
+            self.default_formatter = formatting.TextFormatter()
+        self.formatter = self.default_formatter
+        self.interactive = interactive
+        # startup.StartupProfile printed before the first prompt, if any
+        self.startup_profile = None
+        # (packet id, module) of the stop to prefetch from after the command
+        self.prefetch_from = None
+
+    # readline is only needed once the first prompt is shown, so it isn't
+    # loaded in batch mode nor before the simulation is started
+    def preloop(self):
+        if self.interactive:
+            # By default many special chars delimit words for the Cmd completer
+            # but our counter names may have weird special chars in them, so we
+            # want to only delimit based on space chars
+            #
+            # Sometimes global stuff makes life better
+            import readline
+            readline.set_completer_delims(" \t\n")
+        if self.startup_profile is not None:
+            self.startup_profile.mark("readline")
+            self.startup_profile.report()
+            self.startup_profile = None
+
+    # The prefetcher must be done with the IPC session before a command or a
+    # completion sends its own requests
+    def onecmd(self, line):
+        self.debugger.prefetcher.stop()
+        self.prefetch_from = None
+        words = line.split()
+        if "-j" in words[1:]:
+            del words[words.index("-j", 1)]
+            self.formatter = formatting.JsonFormatter()
+            try:
+                return cmd.Cmd.onecmd(self, " ".join(words))
+            finally:
+                self.formatter = self.default_formatter
+        return cmd.Cmd.onecmd(self, line)
+
+    # Prefetching only starts once the command which stopped the simulation
+    # is done with the IPC session
+    def postcmd(self, stop, line):
+        if self.prefetch_from != None:
+            self.debugger.prefetcher.start(*self.prefetch_from)
+            self.prefetch_from = None
+        return stop
+
+    def default(self, line):
+        self.errors += 1
+        self.formatter.message("*** Unknown syntax: " + line)
+
+    def complete(self, text, state):
+        if state == 0:
+            self.debugger.prefetcher.stop()
+        return cmd.Cmd.complete(self, text, state)
+
+    # Runs the (line number, command) pairs generated from a script without
+    # prompting. Returns the exit code of batch mode: 0 if all the commands
+    # succeeded, 1 if some failed and 2 if the script is invalid.
+    def runScript(self, commands, batch_size = 256):
+        commands = iter(commands)
+        buffered = deque()
+        try:
+            while True:
+                if len(buffered) == 0:
+                    # Read ahead a run of read-only commands, so that their
+                    # requests can be sent together
+                    for item in commands:
+                        buffered.append(item)
+                        if not self.isReadOnly(item[1]) or len(buffered) == batch_size:
+                            break
+                    if len(buffered) == 0:
+                        break
+                    self.prefetchCommands([command for _, command in buffered if self.isReadOnly(command)])
+
+                line_number, command = buffered.popleft()
+                try:
+                    if self.postcmd(self.onecmd(command), command):
+                        break
+                except SimulationExited:
+                    raise
+                except Exception as e:
+                    sys.stderr.write("line " + str(line_number) + ": " + command + ": " + str(e) + "\n")
+                    self.errors += 1
+        except script.ScriptError as e:
+            sys.stderr.write("error: " + str(e) + "\n")
+            return 2
+        return 1 if self.errors > 0 else 0
+
+    def isReadOnly(self, command):
+        words = command.split()
+        return len(words) > 0 and words[0] in READ_ONLY_COMMANDS
+
+    # Fetches the packets printed by a run of read-only commands with one bulk
+    # request per kind of contents, so that the commands are answered from the
+    # packet cache
+    def prefetchCommands(self, commands):
+        # The bulk requests are sent before the commands stop the prefetcher
+        self.debugger.prefetcher.stop()
+        parsed = []
+        raw = []
+        fields = {}
+        for command in commands:
+            args = command.split()
+            if args[0] != "print" or len(args) < 2 or "module" in args:
+                continue
+            try:
+                if args[1] == "raw" and len(args) == 3:
+                    raw.extend(self.parsePacketIds(args[2:])[0])
+                elif args[1] == "field" and len(args) in (4, 5):
+                    fields.setdefault(args[2], []).extend(self.parsePacketIds(args[3:])[0])
+                elif len(args) == 2 and args[1][0].isdigit():
+                    parsed.extend(self.parsePacketIds(args[1:])[0])
+            except BadInputException:
+                # Reported when the command itself runs
+                continue
+
+        if len(parsed) > 1:
+            self.debugger.get_parsed_packets(parsed)
+        if len(raw) > 1:
+            self.debugger.get_raw_packets(raw)
+        for field_name, packet_ids in fields.items():
+            if len(packet_ids) > 1:
+                self.debugger.get_packet_fields(packet_ids, field_name)
 
     # run command - starts running the simulation
     @handle_bad_input
@@ -779,14 +319,14 @@ r <time> <units>
             self.handleRunOrContinueReply(msg_type, reply)
         else:
             if self.sim_ended is True:
-                print("Simulation has ended.")
+                self.formatter.message("Simulation has ended.")
             else:
-                print("Simulation is already started.")
+                self.formatter.message("Simulation is already started.")
             response = ""
             while response != "y" and response != "n":
                 response = raw_input("Do you wish to restart it? y or n? ")
             if response == "y":
-                print("Restarting simulation...")
+                self.formatter.message("Restarting simulation...")
                 self.do_restart(line)
 
     # r command - same as run
@@ -841,12 +381,15 @@ restart clean
                     self.debugger.set_breakpoint(bkpts.breakpoint_condition_list[i].condition_list, bkpts.breakpoint_condition_list[i].value_list, bkpts.temporary[i], bkpts.disabled[i])
 
                 for j in range(len(wps.id_list)):
-                    self.debugger.set_watchpoint(wps.name_list[j], wps.disabled[j])
+                    if j < len(wps.condition_list):
+                        self.debugger.set_watchpoint(wps.name_list[j], wps.disabled[j], wps.condition_list[j], wps.value_list[j])
+                    else:
+                        self.debugger.set_watchpoint(wps.name_list[j], wps.disabled[j])
 
                 for k in range(len(ignore.module_list)):
                     self.debugger.ignore_module(ignore.module_list[k])
         else:
-            print("Cannot restart an attached process")
+            self.formatter.message("Cannot restart an attached process")
 
     @handle_bad_input
     def do_trace(self, line):
@@ -867,6 +410,11 @@ trace [append <id>] throughput <module>
 trace [append <id>] -t <module>
     Start tracing the throughput of a given module. This is calculated
     as the number of packets per second written by the module.
+
+trace [append <id>] drops [<module>] [every <time> <unit>]
+    Start tracing the rate of packet drops, in all modules or in the given
+    module. The drops are counted over windows of simulation time, 1 us by
+    default.
         '''
         args = line.split()
 
@@ -890,13 +438,101 @@ trace [append <id>] -t <module>
         elif len(args) == 2 and args[0] in ('throughput', '-t'):
             status = self.debugger.start_trace(throughput=args[1],
                                                append=append_id)
+        elif len(args) >= 1 and args[0] == 'drops':
+            window_ns = 1000.0
+            if len(args) >= 4 and args[-3] == 'every':
+                try:
+                    window_ns = float(self.getTimeInNS(args[-2], args[-1]))
+                except:
+                    raise BadInputException("trace")
+                if window_ns <= 0:
+                    raise BadInputException("trace")
+                args = args[:-3]
+            if len(args) > 2:
+                raise BadInputException("trace")
+            module = args[1] if len(args) == 2 else None
+            status = self.debugger.start_trace(drops=module, window_ns=window_ns,
+                                               append=append_id)
         else:
             raise BadInputException("trace")
 
         if status:
-            print("Trace started")
+            self.formatter.message("Trace started")
         else:
-            print("Failed to start trace for counter " + args[1])
+            self.formatter.message("Failed to start trace for " + " ".join(args))
+
+    # sample command - periodic sampling of all counters
+    @handle_bad_input
+    def do_sample(self, line):
+        '''
+sample counters every <time> <unit>
+    Start recording the value of every counter at a fixed interval of simulation time. The samples are sent by the
+    simulation while it runs and are stored compactly, only the changes of each counter are kept.
+    Supported units:
+        ns (nanoseconds)
+        us (microseconds)
+        ms (milliseconds)
+        s (seconds)
+        m (minutes)
+        h (hours)
+
+sample status
+    Print the number of samples and counters recorded so far.
+
+sample export <file> [--match <pattern>]
+    Export the samples to a file, with one row per sample and one column per counter. The format is chosen from the
+    file extension: .csv for comma separated values, or .npz for a NumPy archive holding the 'time_ns', 'names' and
+    'values' arrays (requires NumPy). With --match, only counters whose name matches the glob pattern are exported.
+        '''
+        args = line.split()
+        if len(args) == 5 and args[0] == "counters" and args[1] == "every":
+            try:
+                interval = float(self.getTimeInNS(args[2], args[3]))
+            except:
+                raise BadInputException("sample")
+            if interval <= 0:
+                raise BadInputException("sample")
+            if self.debugger.counter_samples is not None:
+                self.formatter.message("Counters are already being sampled.")
+            elif self.debugger.start_counter_sampling(interval):
+                self.formatter.message("Sampling counters every " + str(interval) + " ns")
+            else:
+                self.formatter.message("Failed to start sampling counters")
+        elif len(args) == 1 and args[0] == "status":
+            store = self.debugger.counter_samples
+            if store is None:
+                self.formatter.message("Counters are not being sampled.")
+            else:
+                self.formatter.record("sample_status", [("samples", len(store)), ("counters", len(store.names))],
+                                      str(len(store)) + " samples of " + str(len(store.names)) + " counters")
+        elif len(args) in (2, 4) and args[0] == "export":
+            store = self.debugger.counter_samples
+            if store is None:
+                self.formatter.message("Counters are not being sampled.")
+                return
+            if len(args) == 4:
+                if args[2] != "--match":
+                    raise BadInputException("sample")
+                columns = store.select(args[3])
+            else:
+                columns = None
+            filename = args[1]
+            if filename.endswith(".csv"):
+                with open(filename, "w") as f:
+                    store.export_csv(f, columns)
+            elif filename.endswith(".npz"):
+                try:
+                    import numpy
+                except ImportError:
+                    self.formatter.message("NumPy is required to export to " + filename)
+                    return
+                times, names, values = store.to_numpy(columns)
+                numpy.savez_compressed(filename, time_ns=times, names=numpy.array(names), values=values)
+            else:
+                raise BadInputException("sample")
+            self.formatter.message("Exported " + str(len(store)) + " samples to " + filename)
+        else:
+            raise BadInputException("sample")
 
     # print command - obtain information from simulation and print it to screen
     @handle_bad_input
@@ -907,13 +543,51 @@ print -c <counter_name>
     Print the value of the given counter. Use the name 'all' to print a list of all the counters within the simulation
     and their corresponding values. Auto-completion of the counter name is supported.
 
-print packets <filters>
-print -p <filters>
-    Print the list of packets that are currently in the simulation.  The filters are optional.
+print counter all <options>
+    The list of all counters can be narrowed down by the simulation before it is sent to the debugger.
+
+    options:
+        --match <pattern>
+            Only print counters whose name matches the given glob pattern, e.g. egress.*drop*
+        --regex <pattern>
+            Only print counters whose name matches the given regular expression.
+        --sort name|value|-value
+            Sort the counters by name, by increasing value or by decreasing value.
+        --top <n>
+            Only print the first n counters. Sorts by decreasing value unless --sort is given.
+        --nonzero
+            Only print counters whose value is not zero.
+
+print counter diff [since <stop>]
+    Print the counters which changed between two stops of the simulation, along with their rate of change over
+    simulation time. The values of all counters are kept every time they are all printed or diffed. By default, the
+    current values are compared to the ones kept at the previous such stop. Use 'info snapshots' to list the stops
+    for which values were kept.
+
+print packets <filters> <options>
+print -p <filters> <options>
+    Print the list of packets that are currently in the simulation.  The filters are optional and are applied by the
+    simulation, so only the matching packets are sent to the debugger.
 
     filters:
         -m <module_name>
             Will only print packets which are currently in the given module.
+        --ids <first>-<last>
+            Will only print packets whose id is within the given range.
+        --since <time> <unit>
+            Will only print packets whose time is at or after the given time.
+        --before <time> <unit>
+            Will only print packets whose time is at or before the given time.
+        --older-than <time> <unit>
+            Will only print packets whose time is at least the given amount of time ago.
+
+    options:
+        --limit <n>
+            Print at most n packets.
+        --offset <n>
+            Skip the first n matching packets. Use with --limit to page through the packets.
+        --summary
+            Instead of the packets, print the number of packets in each module and the age of the oldest one.
 
 print raw <packet id>
     Print the raw contents of the given packet in a hexdump format.
@@ -935,9 +609,23 @@ print field <field name> <packet id> [<output format>]
       dec          : prints a decimal representation of the field data
       ip4          : prints the field as an IPv4 address. Only valid for 4-byte fields
 
+print raw <packets>
+print <packets>
+print field <field name> <packets> [<output format>]
+    Print the raw contents, the parsed contents or a field of many packets at once, which is much faster than
+    printing them one by one. Packets which can't be found are skipped. <packets> is either:
+        module <module_name>
+            All the packets currently in the given module, e.g. print field ipv4.ttl module egress
+        a list of packet ids and ranges of ids
+            e.g. print raw 1,2,3 or print field ipv4.ttl 1-5000
+
 
 print dropped_packets
     Print the list of packets that have been dropped.
+
+print dropped_packets --summary
+    Print the number of drops for each module and reason, with the rate of drops over the whole simulation and since
+    the previous summary. Only the drops which happened since the last time are sent by the simulation.
         '''
 
 
@@ -947,72 +635,114 @@ print dropped_packets
                 counter_name = args[1]
             except:
                 raise BadInputException("print")
-            if counter_name == 'all':
-                names, values = self.debugger.print_all_counters()
-                table = []
+            if counter_name == 'diff':
+                if len(args) == 2:
+                    since = None
+                elif len(args) == 4 and args[2] == "since" and args[3].isdigit():
+                    since = int(args[3])
+                else:
+                    raise BadInputException("print")
+                try:
+                    old, new, deltas = self.debugger.counter_diff(since)
+                except KeyError:
+                    self.formatter.message("No counter values were kept for an earlier stop. Use 'info snapshots' to list them.")
+                    return
+                self.formatter.record("counter_diff",
+                                      [("old_stop", old.stop), ("old_time_ns", old.time_ns),
+                                       ("new_stop", new.stop), ("new_time_ns", new.time_ns)],
+                                      "Counter changes from stop " + str(old.stop) + " (" + str(old.time_ns) + " ns) to stop "
+                                      + str(new.stop) + " (" + str(new.time_ns) + " ns):")
+                table = self.formatter.table("counter_delta", [("name", "Counter Name"), ("old", "Old"), ("new", "New"),
+                                                               ("delta", "Delta"), ("rate_per_us", "Rate (per us)")])
+                for d in deltas:
+                    if d.rate is None:
+                        rate = None
+                    else:
+                        rate = d.rate * 1000
+                    table.add_row([d.name, d.old, d.new, d.delta, rate])
+                table.flush()
+            elif counter_name == 'all':
+                names, values = self.debugger.print_all_counters(**self.parseCounterFilters(args[2:]))
+                table = self.formatter.table("counter", [("name", "Counter Name"), ("value", "Value")])
                 for i,name in enumerate(names):
-                    table.append([name, values[i]])
-                print(tabulate(table, headers=["Counter Name", "Value"]))
+                    table.add_row([name, values[i]])
+                table.flush()
             else:
                 reply = self.debugger.print_counter(counter_name)
                 if reply == -1:
-                    print("No counter with name " + counter_name + " was found.")
+                    self.formatter.message("No counter with name " + counter_name + " was found.")
                 else:
-                    print(counter_name + ": " + str(reply))
+                    self.formatter.record("counter", [("name", counter_name), ("value", reply)],
+                                          counter_name + ": " + str(reply))
         elif args[0] == "packets" or args[0] == "-p":
-            if len(args) == 3:
-                if args[1] == "-m":
-                    module = args[2]
-                    ids, locations, times = self.debugger.print_packets(module)
-                else:
-                    raise BadInputException("print")
-            elif len(args) == 1:
-                ids, locations, times = self.debugger.print_packets()
+            module, filters, summary = self.parsePacketFilters(args[1:])
+            if summary:
+                modules, counts, ages = self.debugger.packet_summary(module, **filters)
+                table = self.formatter.table("packet_summary", [("module", "Module"), ("packets", "Packets"),
+                                                                ("oldest_age_ns", "Oldest Age (ns)")], numalign="left")
+                for i, mod in enumerate(modules):
+                    table.add_row([mod, counts[i], ages[i]])
+                table.flush()
+                return
+            if len(filters) == 0:
+                ids, locations, times = self.debugger.print_packets(module)
+                total = len(ids)
             else:
-                raise BadInputException("print")
-            table = []
+                ids, locations, times, total = self.debugger.query_packets(module, **filters)
+            table = self.formatter.table("packet", [("id", "Packet ID"), ("module", "Module"), ("time_ns", "Time (ns)")],
+                                         numalign="left")
             for i, ident in enumerate(ids):
-                table.append([ident, locations[i], times[i]])
+                table.add_row([ident, locations[i], times[i]])
+            table.flush()
 
-            print(tabulate(table, headers=["Packet ID", "Module", "Time (ns)"], numalign="left"))
+            if total > len(ids):
+                self.formatter.record("packet_count", [("shown", len(ids)), ("total", total)],
+                                      "Showing " + str(len(ids)) + " of " + str(total) + " packets")
         elif args[0] == "dropped_packets":
-            if len(args) > 1:
-                raise BadInputException("print")
+            if len(args) == 1:
+                drop_log = self.debugger.update_drop_log()
+                table = self.formatter.table("dropped_packet", [("id", "Packet ID"), ("module", "Module"),
+                                                                ("reason", "Reason")], numalign="left")
+                for packet_id, mod, reason, time_ns in drop_log.drops():
+                    table.add_row([packet_id, mod, reason])
+                table.flush()
+            elif len(args) == 2 and args[1] == "--summary":
+                drop_log = self.debugger.update_drop_log()
+                now = self.debugger.get_simulation_time()
+                table = self.formatter.table("drop_summary",
+                                             [("module", "Module"), ("reason", "Reason"), ("drops", "Drops"),
+                                              ("rate_per_us", "Rate (per us)"), ("recent_drops", "Recent Drops"),
+                                              ("recent_rate_per_us", "Recent Rate (per us)")], numalign="left")
+                for cause in drop_log.summary(now):
+                    row = [cause.module, cause.reason, cause.count, cause.rate, cause.recent, cause.recent_rate]
+                    # In drops per us
+                    for i in (3, 5):
+                        row[i] = row[i] * 1000 if row[i] is not None else None
+                    table.add_row(row)
+                table.flush()
+                self.formatter.record("drop_count", [("drops", len(drop_log)), ("time_ns", now)],
+                                      str(len(drop_log)) + " drops in " + str(now) + " ns")
             else:
-                reply = self.debugger.get_dropped_packets()
-                table = []
-                for i, mod in enumerate(reply.module_list):
-                    table.append([reply.packet_id_list[i], mod, reply.reason_list[i]])
-                print(tabulate(table, headers=["Packet ID", "Module", "Reason"], numalign="left"))
+                raise BadInputException("print")
         elif args[0].isdigit() and len(args) == 1:
             msg_type, packet_data = self.debugger.get_parsed_packet(int(args[0]))
 
             if msg_type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
-                print("Cannot print packet " + args[0])
+                self.formatter.message("Cannot print packet " + args[0])
             else:
-                for header in packet_data.headers:
-                    print(header.name + ":")
-                    for field in header.fields:
-                        field_bytes = field.value
-
-                        # In python2.X this is a str, so we need to map each char to its
-                        # integer equivalent.
-                        # In python3.X its bytes, which is already a sequence of ints
-                        if type(field_bytes) == str:
-                            field_bytes = map(ord, field_bytes)
-
-                        print("  " + field.name + ": " + ':'.join(hex(n)[2:].zfill(2).upper() for n in field_bytes))
-                    print("")
+                self.printParsedPacket(int(args[0]), packet_data.headers)
 
         elif len(args) == 2 and args[0] == "raw" and args[1].isdigit():
             msg_type, packet_data = self.debugger.get_raw_packet(int(args[1]))
 
             if msg_type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
-                print("Cannot print packet " + args[1])
+                self.formatter.message("Cannot print packet " + args[1])
             else:
                 raw_packet = packet_data.value
 
-                hexdump(raw_packet)
+                from hexdump import hexdump
+                self.formatter.record("raw_packet", [("id", int(args[1])), ("data", format_hex(raw_packet))],
+                                      hexdump(raw_packet, result='return'))
 
         elif len(args) in (3,4) and args[0] == "field" and args[2].isdigit():
 
@@ -1021,32 +751,180 @@ print dropped_packets
             msg_type, packet_data = self.debugger.get_packet_field(int(args[2]), args[1])
 
             if msg_type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
-                print("Cannot print packet " + args[2])
+                self.formatter.message("Cannot print packet " + args[2])
             else:
                 field_bytes = packet_data.value
 
-                # In python2.X this is a str, so we need to map each char to its
-                # integer equivalent.
-                # In python3.X its bytes, which is already a sequence of ints
-                if type(field_bytes) == str:
-                    field_bytes = map(ord, field_bytes)
-
                 fmt = args[3] if len(args) == 4 else 'hex'
 
-                fmt = 'hex' if fmt == 'ip4' and len(field_bytes) != 4 else fmt
-
-                if fmt == 'hex':
-                    print(':'.join(hex(n)[2:].zfill(2).upper() for n in field_bytes))
-                elif fmt == 'dec':
-                    print(reduce(lambda x,y: (x*0x100)+y, field_bytes))
-                elif fmt == 'ip4':
-                    print('.'.join(map(str, field_bytes)))
-                else:
+                formatted = format_values(field_bytes, [len(field_bytes)], fmt)
+                if formatted == None:
                     raise BadInputException("print")
+                self.formatter.record("packet_field", [("id", int(args[2])), ("field", args[1]),
+                                                       ("value", formatted[0])], formatted[0])
+
+        elif args[0] == "field" and len(args) >= 3:
+            field_name = args[1]
+            packet_ids, rest = self.parsePacketIds(args[2:])
+            if len(rest) > 1:
+                raise BadInputException("print")
+            fmt = rest[0] if len(rest) == 1 else 'hex'
+            if fmt not in ('hex', 'dec', 'ip4'):
+                raise BadInputException("print")
+
+            ids, data, lengths = self.debugger.get_packet_fields(packet_ids, field_name)
+            if len(ids) == 0:
+                self.formatter.message("Cannot print field " + field_name + " of any of the packets")
+                return
+            table = self.formatter.table("packet_field", [("id", "Packet ID"), ("value", field_name)],
+                                         extra=[("field", field_name)], numalign="left")
+            for row in zip(ids, format_values(data, lengths, fmt)):
+                table.add_row(row)
+            table.flush()
+
+        elif args[0] == "raw" and len(args) >= 2:
+            packet_ids, rest = self.parsePacketIds(args[1:])
+            if len(rest) > 0:
+                raise BadInputException("print")
+
+            ids, data, lengths = self.debugger.get_raw_packets(packet_ids)
+            if len(ids) == 0:
+                self.formatter.message("Cannot print any of the packets")
+                return
+            from hexdump import hexdump
+            start = 0
+            for i, ident in enumerate(ids):
+                raw_packet = data[start:start + lengths[i]]
+                text = "Packet " + str(ident) + ":\n" + hexdump(raw_packet, result='return')
+                self.formatter.record("raw_packet", [("id", ident), ("data", format_hex(raw_packet))],
+                                      text if i == 0 else "\n" + text)
+                start += lengths[i]
+
+        elif len(args) <= 2 and (args[0] == "module" or args[0][:1].isdigit()):
+            packet_ids, rest = self.parsePacketIds(args)
+            if len(rest) > 0:
+                raise BadInputException("print")
+
+            parsed = self.debugger.get_parsed_packets(packet_ids)
+            if len(parsed) == 0:
+                self.formatter.message("Cannot print any of the packets")
+                return
+            for ident, headers in parsed:
+                self.printParsedPacket(ident, headers, "Packet " + str(ident) + ":")
 
         else:
             raise BadInputException("print")
 
+    def printParsedPacket(self, packet_id, headers, title = None):
+        lines = [] if title == None else [title]
+        records = []
+        for header in headers:
+            lines.append(header.name + ":")
+            fields = OrderedDict()
+            for field in header.fields:
+                lines.append("  " + field.name + ": " + format_hex(field.value))
+                fields[field.name] = format_hex(field.value)
+            lines.append("")
+            records.append(OrderedDict([("name", header.name), ("fields", fields)]))
+        self.formatter.record("parsed_packet", [("id", packet_id), ("headers", records)],
+                              "\n".join(lines) if len(lines) > 0 else None)
+
+    # Parses the packets selected by 'module <module_name>' or by a list of
+    # ids and id ranges such as 1,4,10-20 at the start of args, returns
+    # (packet ids, remaining args)
+    def parsePacketIds(self, args, command = "print"):
+        if args[0] == "module":
+            if len(args) < 2:
+                raise BadInputException(command)
+            ids, locations, times = self.debugger.print_packets(args[1])
+            return list(ids), args[2:]
+
+        packet_ids = []
+        try:
+            for item in args[0].split(","):
+                first, sep, last = item.partition("-")
+                if sep:
+                    packet_ids.extend(range(int(first), int(last) + 1))
+                else:
+                    packet_ids.append(int(first))
+        except ValueError:
+            raise BadInputException(command)
+        return packet_ids, args[1:]
+
+    # Parses the filters and options of 'print packets' into (module, filters, summary)
+    def parsePacketFilters(self, args):
+        module = None
+        filters = {}
+        summary = False
+        i = 0
+        try:
+            while i < len(args):
+                if args[i] == "-m":
+                    module = args[i + 1]
+                    i += 1
+                elif args[i] == "--ids":
+                    first, last = args[i + 1].split("-")
+                    filters['min_id'] = int(first)
+                    filters['max_id'] = int(last)
+                    i += 1
+                elif args[i] in ("--since", "--before", "--older-than"):
+                    time = float(self.getTimeInNS(args[i + 1], args[i + 2]))
+                    if args[i] == "--since":
+                        filters['min_time'] = time
+                    elif args[i] == "--before":
+                        filters['max_time'] = time
+                    else:
+                        filters['older_than'] = time
+                    i += 2
+                elif args[i] == "--limit":
+                    filters['limit'] = int(args[i + 1])
+                    i += 1
+                elif args[i] == "--offset":
+                    filters['offset'] = int(args[i + 1])
+                    i += 1
+                elif args[i] == "--summary":
+                    summary = True
+                elif args[i] != '':
+                    raise BadInputException("print")
+                i += 1
+        except (IndexError, ValueError, UnboundLocalError):
+            raise BadInputException("print")
+        return module, filters, summary
+
+    # Parses the options of 'print counter all' into keyword arguments for print_all_counters
+    def parseCounterFilters(self, args):
+        SORT_ORDERS = {
+            'name'   : PFPSimDebugger_pb2.GetAllCountersMsg.BY_NAME,
+            'value'  : PFPSimDebugger_pb2.GetAllCountersMsg.BY_VALUE_ASCENDING,
+            '-value' : PFPSimDebugger_pb2.GetAllCountersMsg.BY_VALUE_DESCENDING,
+        }
+        filters = {}
+        i = 0
+        try:
+            while i < len(args):
+                if args[i] == "--match" or args[i] == "--regex":
+                    filters['pattern'] = args[i + 1]
+                    filters['regex'] = args[i] == "--regex"
+                    if filters['regex']:
+                        re.compile(filters['pattern'])
+                    i += 1
+                elif args[i] == "--sort":
+                    filters['sort'] = SORT_ORDERS[args[i + 1]]
+                    i += 1
+                elif args[i] == "--top":
+                    filters['limit'] = int(args[i + 1])
+                    i += 1
+                elif args[i] == "--nonzero":
+                    filters['non_zero'] = True
+                elif args[i] != '':
+                    raise BadInputException("print")
+                i += 1
+        except (IndexError, KeyError, ValueError, re.error):
+            raise BadInputException("print")
+        if 'limit' in filters and 'sort' not in filters:
+            filters['sort'] = PFPSimDebugger_pb2.GetAllCountersMsg.BY_VALUE_DESCENDING
+        return filters
+
     # continue command - continues simulation after break
     @handle_bad_input
     def do_continue(self, line):
@@ -1076,9 +954,9 @@ c <time> <units>
             self.handleRunOrContinueReply(msg_type, reply)
         else:
             if self.run_called is False:
-                print("Simulation has not been started. Use 'Run' command to start simulation.")
+                self.formatter.message("Simulation has not been started. Use 'Run' command to start simulation.")
             elif self.sim_ended is True:
-                print("Simulation has ended. Use 'restart' command to start simulation from the beginning.")
+                self.formatter.message("Simulation has ended. Use 'restart' command to start simulation from the beginning.")
 
     # c command - same as continue
     def do_c(self, line):
@@ -1102,31 +980,80 @@ c <time> <units>
     @handle_bad_input
     def do_next(self, line):
         '''
-next
-n
+next [<count>] [--hops]
+n [<count>] [--hops]
     Use this command to continue the simulation until the current packet leaves the current module or enters the next
-    module. The current packet is defined by the whoami command.
+    module. The current packet is defined by the whoami command. If a count is given, this is repeated count times
+    within the simulation and only the final stop is printed. With --hops, the intermediate stops are listed as well.
         '''
-        if len(line.split(" ")) == 1 and line.split(" ")[0] == '':
-            if self.run_called:
-                msg_type, reply = self.debugger.next()
-                self.handleRunOrContinueReply(msg_type, reply);
-            else:
-                print("Simulation has not been started. Use 'Run' command to start simulation.")
+        args = line.split()
+        hops = "--hops" in args
+        if hops:
+            args.remove("--hops")
+        if len(args) == 0:
+            count = None
+        elif len(args) == 1 and args[0].isdigit() and int(args[0]) > 0:
+            count = int(args[0])
         else:
             raise BadInputException("next")
+        if self.run_called:
+            msg_type, reply = self.debugger.next(count, hops)
+            self.handleRunOrContinueReply(msg_type, reply);
+        else:
+            self.formatter.message("Simulation has not been started. Use 'Run' command to start simulation.")
 
     # n command - same as next
     def do_n(self, line):
         '''
-next
-n
+next [<count>] [--hops]
+n [<count>] [--hops]
     Use this command to continue the simulation until the current packet leaves the current module or enters the next
-    module. The current packet is defined by the whoami command.
+    module. The current packet is defined by the whoami command. If a count is given, this is repeated count times
+    within the simulation and only the final stop is printed. With --hops, the intermediate stops are listed as well.
         '''
 
         self.do_next(line)
 
+    # until command - step the current packet until it reaches a module
+    @handle_bad_input
+    def do_until(self, line):
+        '''
+until <module_name> [--hops]
+    Continue the simulation until the current packet enters the given module. The stepping is done within the
+    simulation and only the final stop is printed. With --hops, the intermediate stops are listed as well.
+        '''
+        args = line.split()
+        hops = "--hops" in args
+        if hops:
+            args.remove("--hops")
+        if len(args) != 1:
+            raise BadInputException("until")
+        if self.run_called:
+            msg_type, reply = self.debugger.until(args[0], hops)
+            self.handleRunOrContinueReply(msg_type, reply)
+        else:
+            self.formatter.message("Simulation has not been started. Use 'Run' command to start simulation.")
+
+    # finish command - step the current packet out of its module
+    @handle_bad_input
+    def do_finish(self, line):
+        '''
+finish [--hops]
+    Continue the simulation until the current packet leaves the current module. With --hops, the intermediate stops
+    are listed as well.
+        '''
+        args = line.split()
+        hops = "--hops" in args
+        if hops:
+            args.remove("--hops")
+        if len(args) != 0:
+            raise BadInputException("finish")
+        if self.run_called:
+            msg_type, reply = self.debugger.finish(hops)
+            self.handleRunOrContinueReply(msg_type, reply)
+        else:
+            self.formatter.message("Simulation has not been started. Use 'Run' command to start simulation.")
+
     # break command - set breakpoints
     @handle_bad_input
     def do_break(self, line):
@@ -1171,7 +1098,7 @@ break <conditions> <options>
 
         if len(args) == 1 and args[0] == "dropped_packet":
             self.debugger.break_on_packet_drop()
-            print("Breakpoint was set successfully.")
+            self.formatter.message("Breakpoint was set successfully.")
             return
 
         while (i < len(args)):
@@ -1210,9 +1137,9 @@ break <conditions> <options>
 
         msg_type, reply = self.debugger.set_breakpoint(conditions, values, temp, disabled)
         if(reply == PFPSimDebugger_pb2.GenericAcknowledgeMsg.SUCCESS):
-            print("Breakpoint was set successfully.")
+            self.formatter.message("Breakpoint was set successfully.")
         else:
-            print("Breakpoint could not be set.")
+            self.formatter.message("Breakpoint could not be set.")
 
     # tbreak command - shortcut to set temporary breakpoint
     def do_tbreak(self, line):
@@ -1248,37 +1175,70 @@ tbreak <conditions> <options>
     @handle_bad_input
     def do_watch(self, line):
         '''
-watch counter <counter_name> <options>
-watch -c <counter_name> <options>
-    Set a watchpoint on the given counter. The user will be notified every time the given counter's value changes.
-    Auto-completion for the counter name is supported.
+watch counter <counter_name> [if <condition>] <options>
+watch -c <counter_name> [if <condition>] <options>
+    Set a watchpoint on the given counter. Without a condition, the user will be notified every time the given
+    counter's value changes. Auto-completion for the counter name is supported.
+
+    conditions:
+        The condition is evaluated within the simulation and the watchpoint is only hit when the condition becomes
+        true, so frequently changing counters can be watched without stopping on every change.
+        > <value>, >= <value>, < <value>, <= <value>, == <value>
+            Hit when the counter's value starts satisfying the comparison.
+        crosses <value>
+            Hit when the counter's value goes from one side of the given value to the other.
+        delta >= <n>
+            Hit when the counter has changed by at least n since the watchpoint was last hit.
+        rate > <r> per <unit>
+            Hit when the counter changes faster than r per unit of simulation time since the watchpoint was last
+            hit. Supported units are the same as for the run command.
 
     options:
         --disable
             Creates a watchpoint that is disabled. It will not be hit until it is enabled using the 'enable' command.
         '''
 
-        args = line.split(" ")
-        if len(args) == 2 or len(args) == 3:
-            if args[0] == "counter" or args[0] == "-c":
-                counter_name = args[1]
-                if len(args) == 3:
-                    if args[2] == "--disable":
-                        disabled = True
-                    else:
-                        raise BadInputException("watch")
-                else:
-                    disabled = False
-                msg_type, reply = self.debugger.set_watchpoint(counter_name, disabled)
-                if reply == PFPSimDebugger_pb2.GenericAcknowledgeMsg.SUCCESS:
-                    print("Watchpoint was set successfully.")
-                else:
-                    print("Watchpoint could not be set.")
+        args = line.split()
+        disabled = False
+        if len(args) > 0 and args[-1] == "--disable":
+            disabled = True
+            args = args[:-1]
+        if len(args) >= 2 and (args[0] == "counter" or args[0] == "-c"):
+            counter_name = args[1]
+            if len(args) == 2:
+                condition, value = None, None
+            elif args[2] == "if":
+                condition, value = self.parseWatchCondition(args[3:])
             else:
                 raise BadInputException("watch")
+            msg_type, reply = self.debugger.set_watchpoint(counter_name, disabled, condition, value)
+            if reply == PFPSimDebugger_pb2.GenericAcknowledgeMsg.SUCCESS:
+                self.formatter.message("Watchpoint was set successfully.")
+            else:
+                self.formatter.message("Watchpoint could not be set.")
         else:
             raise BadInputException("watch")
 
+    # Parses the tokens following 'if' in a watch command into a (condition, value) pair
+    def parseWatchCondition(self, args):
+        try:
+            if len(args) == 2 and args[0] in WATCH_COMPARISONS:
+                float(args[1])
+                return WATCH_COMPARISONS[args[0]], args[1]
+            elif len(args) == 2 and args[0] == "crosses":
+                float(args[1])
+                return PFPSimDebugger_pb2.WATCH_CROSSES, args[1]
+            elif len(args) == 3 and args[0] == "delta" and args[1] == ">=":
+                float(args[2])
+                return PFPSimDebugger_pb2.WATCH_DELTA_AT_LEAST, args[2]
+            elif len(args) == 5 and args[0] == "rate" and args[1] == ">" and args[3] == "per":
+                # The model expects the rate per ns
+                rate = float(args[2]) / float(self.getTimeInNS(1, args[4]))
+                return PFPSimDebugger_pb2.WATCH_RATE_ABOVE, rate
+        except (ValueError, UnboundLocalError):
+            pass
+        raise BadInputException("watch")
+
     # enable command - enable breakpoint or watchpoint
     @handle_bad_input
     def do_enable(self, line):
@@ -1376,10 +1336,10 @@ bt <packet_id>
         else:
             msg_type, reply = self.debugger.backtrace()
         if msg_type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge and reply == PFPSimDebugger_pb2.GenericAcknowledgeMsg.FAILED:
-            print("Could not get backtrace for packet " + packet_id)
+            self.formatter.message("Could not get backtrace for packet " + packet_id)
         else:
-            print("Backtrace for packet " + str(reply.packet_id) + ":")
             table = []
+            hops = []
             for i, mod in enumerate(reply.module_list):
                 read_time = reply.read_time_list[i]
                 write_time = reply.write_time_list[i]
@@ -1396,8 +1356,14 @@ bt <packet_id>
                 else:
                     write = float(write_time)
                 table.append([mod, read, write, delta])
+                hops.append(OrderedDict([("module", mod), ("read_time_ns", read if read != "" else None),
+                                         ("write_time_ns", write if write != "" else None),
+                                         ("delta_ns", delta if delta != "" else None)]))
 
-            print(tabulate(table, headers=["Module Name", "Read Time (ns)", "Write Time (ns)", "Delta (ns)"]))
+            from tabulate import tabulate
+            self.formatter.record("backtrace", [("packet_id", reply.packet_id), ("hops", hops)],
+                                  "Backtrace for packet " + str(reply.packet_id) + ":\n" +
+                                  tabulate(table, headers=["Module Name", "Read Time (ns)", "Write Time (ns)", "Delta (ns)"]))
 
     # bt command - same as backtrace
     def do_bt(self, line):
@@ -1423,10 +1389,18 @@ info break
 
 info watchpoints
 info watch
-    Prints the list of watchpoints that are currently set. It indicates their ID and the counter name they are set on.
+    Prints the list of watchpoints that are currently set. It indicates their ID, the counter name they are set on and
+    the condition under which they are hit.
 
 info ignore
     Prints the list of modules that are currently being ignored.
+
+info snapshots
+    Prints the list of stops for which the values of all counters were kept, for use with 'print counter diff'.
+
+info cache
+    Prints the statistics of the cache of packet contents, fields and backtraces. The cache is emptied every time the
+    simulation makes progress, and can be disabled by starting pfpdb with --no-cache.
         '''
 
         args = line.split(" ")
@@ -1437,7 +1411,7 @@ info ignore
         if args[0] == "breakpoints" or args[0] == "break":
             reply = self.debugger.get_breakpoints()
             # Prints all breakpoints!
-            print("Breakpoint List:")
+            self.formatter.heading("Breakpoint List:")
             for i, bkpt in enumerate(reply.breakpoint_condition_list):
                 if reply.temporary[i] == "1":
                     temp = "Yes"
@@ -1449,34 +1423,74 @@ info ignore
                 else:
                     enabled = "Yes"
 
-                print(str(reply.id_list[i]) + " - Temporary: " + temp + ", Enabled: " + enabled)
+                lines = [str(reply.id_list[i]) + " - Temporary: " + temp + ", Enabled: " + enabled]
+                conditions = []
                 for j, condition in enumerate(bkpt.condition_list):
                     if condition == PFPSimDebugger_pb2.BREAK_ON_MODULE_READ:
-                        print("    Enter Module: " + bkpt.value_list[j])
+                        lines.append("    Enter Module: " + bkpt.value_list[j])
+                        conditions.append(OrderedDict([("enter_module", bkpt.value_list[j])]))
                     elif condition == PFPSimDebugger_pb2.BREAK_ON_MODULE_WRITE:
-                        print("    Leave Module: " + bkpt.value_list[j])
+                        lines.append("    Leave Module: " + bkpt.value_list[j])
+                        conditions.append(OrderedDict([("leave_module", bkpt.value_list[j])]))
                     elif condition == PFPSimDebugger_pb2.BREAK_ON_PACKET_ID:
-                        print("    Packet: " + bkpt.value_list[j])
+                        lines.append("    Packet: " + bkpt.value_list[j])
+                        conditions.append(OrderedDict([("packet_id", int(bkpt.value_list[j]))]))
                     elif condition == PFPSimDebugger_pb2.BREAK_AT_TIME:
-                        print("    Time: " + bkpt.value_list[j] + " ns")
+                        lines.append("    Time: " + bkpt.value_list[j] + " ns")
+                        conditions.append(OrderedDict([("time_ns", float(bkpt.value_list[j]))]))
+                self.formatter.record("breakpoint",
+                                      [("id", reply.id_list[i]), ("temporary", temp == "Yes"),
+                                       ("enabled", enabled == "Yes"), ("conditions", conditions)],
+                                      "\n".join(lines))
 
         elif args[0] == "watchpoints" or args[0] == "watch":
             reply = self.debugger.get_watchpoints()
             # Print all watchpoints
-            print("Watchpoint List:")
+            self.formatter.heading("Watchpoint List:")
             for i, wp_id in enumerate(reply.id_list):
                 if reply.disabled[i] == "0":
                     enabled = "Yes"
                 else:
                     enabled = "No"
-                print(str(wp_id) + " - Counter Name: " + reply.name_list[i] + ", Enabled: " + enabled)
+                if i < len(reply.condition_list):
+                    condition = describe_watch_condition(reply.condition_list[i], reply.value_list[i])
+                else:
+                    condition = describe_watch_condition(None, None)
+                self.formatter.record("watchpoint",
+                                      [("id", wp_id), ("counter_name", reply.name_list[i]),
+                                       ("enabled", enabled == "Yes"), ("condition", condition)],
+                                      str(wp_id) + " - Counter Name: " + reply.name_list[i] + ", Enabled: " + enabled + ", Condition: " + condition)
         elif args[0] == "ignore":
             reply = self.debugger.get_ignore_modules();
             # Print all ignored modules
-            table = []
+            table = self.formatter.table("ignored_module", [("module", "Ignored Modules")])
             for mod in reply.module_list:
-                table.append([mod])
-            print(tabulate(table, headers=["Ignored Modules"]))
+                table.add_row([mod])
+            table.flush()
+        elif args[0] == "snapshots":
+            table = self.formatter.table("snapshot", [("stop", "Stop"), ("time_ns", "Time (ns)")], numalign="left")
+            for snapshot in self.debugger.counter_snapshots.snapshots.values():
+                table.add_row([snapshot.stop, snapshot.time_ns])
+            table.flush()
+        elif args[0] == "cache":
+            packet_cache = self.debugger.packet_cache
+            if not packet_cache.enabled:
+                self.formatter.message("The packet cache is disabled.")
+                return
+            lookups = packet_cache.hits + packet_cache.misses
+            if lookups > 0:
+                hit_rate = str(round(100.0 * packet_cache.hits / lookups, 1)) + "%"
+            else:
+                hit_rate = "-"
+            self.formatter.record("packet_cache",
+                                  [("entries", len(packet_cache)), ("capacity", packet_cache.capacity),
+                                   ("hits", packet_cache.hits), ("misses", packet_cache.misses),
+                                   ("evictions", packet_cache.evictions),
+                                   ("prefetched", self.debugger.prefetcher.prefetched)],
+                                  "Entries: " + str(len(packet_cache)) + " of " + str(packet_cache.capacity) +
+                                  "\nHits: " + str(packet_cache.hits) + ", Misses: " + str(packet_cache.misses) +
+                                  ", Hit rate: " + hit_rate + ", Evictions: " + str(packet_cache.evictions) +
+                                  "\nPrefetched: " + str(self.debugger.prefetcher.prefetched))
         else:
             raise BadInputException("info")
 
@@ -1547,9 +1561,10 @@ whoami
         if len(line.split(" ")) == 1 and line.split(" ")[0] == '':
             reply = self.debugger.whoami()
             if reply.packet_id == -1:
-                print("whoamoi is not determined.")
+                self.formatter.record("whoami", [("packet_id", None)], "whoamoi is not determined.")
             else:
-                print("Packet ID: " + str(reply.packet_id))
+                self.formatter.record("whoami", [("packet_id", reply.packet_id)],
+                                      "Packet ID: " + str(reply.packet_id))
         else:
             raise BadInputException("whoami")
 
@@ -1579,8 +1594,9 @@ whattimeisit
         if len(args) > 1 or (len(args) == 1 and args[0] != ''):
             raise BadInputException("whattimeisit")
         else:
-            time = self.debugger.get_simulation_time()
-            print("Simulation Time: " + str(time) + " ns")
+            time_ns = self.debugger.get_simulation_time()
+            self.formatter.record("simulation_time", [("time_ns", time_ns)],
+                                  "Simulation Time: " + str(time_ns) + " ns")
 
     # quit command - quit debugger. Kills child process.
     @handle_bad_input
@@ -1614,7 +1630,7 @@ EOF (ctrl-d)
     Kill the simulation and exit the PFPSimDebugger.
         '''
 
-        print('')
+        self.formatter.heading('')
         return self.do_quit(line)
 
     # clear command
@@ -1630,6 +1646,203 @@ clear
         else:
             raise BadInputException("clear")
 
+    @handle_bad_input
+    def do_dump(self, line):
+        '''
+dump pcap <file> [module <module_name> | dropped | ids <packets>]
+    Save the raw contents of packets to a pcapng file which can be opened with standard packet analysis tools. By
+    default all the packets currently in the simulation are saved. Otherwise, only the packets in the given module,
+    the packets which were dropped or the given list of packet ids and ranges of ids (e.g. 1,4,10-20) are saved.
+
+    The timestamp of each packet is its simulation time, and its comment holds the module it is in, or the module
+    which dropped it and the reason why. Packets whose contents can't be found are skipped.
+        '''
+        args = line.split()
+        if len(args) < 2 or args[0] != "pcap":
+            raise BadInputException("dump")
+        filename = args[1]
+        selection = args[2:]
+
+        comments = {}
+        if len(selection) == 0 or selection[0] == "module":
+            if len(selection) == 0:
+                ids, locations, times = self.debugger.print_packets()
+            elif len(selection) == 2:
+                ids, locations, times = self.debugger.print_packets(selection[1])
+            else:
+                raise BadInputException("dump")
+            for ident, module in zip(ids, locations):
+                comments[ident] = "module: " + module
+        elif selection == ["dropped"]:
+            ids = []
+            times = []
+            for ident, module, reason, time_ns in self.debugger.update_drop_log().drops():
+                ids.append(ident)
+                times.append(time_ns)
+                comments[ident] = "module: " + module + ", dropped: " + reason
+        elif len(selection) == 2 and selection[0] == "ids":
+            ids, rest = self.parsePacketIds(selection[1:], "dump")
+            self.debugger.print_packets()
+            in_flight = self.debugger.packet_mirror.by_id
+            now = None
+            times = []
+            for ident in ids:
+                location = in_flight.get(ident)
+                if location is None:
+                    if now is None:
+                        now = self.debugger.get_simulation_time()
+                    times.append(now)
+                else:
+                    times.append(location.time)
+                    comments[ident] = "module: " + location.module
+        else:
+            raise BadInputException("dump")
+
+        time_of = dict(zip(ids, times))
+        with open(filename, "wb") as f:
+            writer = pcap.PcapngWriter(f)
+            for ident, data in self.debugger.iter_raw_packets(list(ids)):
+                writer.write_packet(data, time_of[ident], comments.get(ident))
+        self.formatter.message("Saved " + str(writer.count) + " of " + str(len(ids)) + " packets to " + filename)
+
+    @handle_bad_input
+    def do_profile(self, line):
+        '''
+profile modules [--folded <file>]
+    Add the backtraces of all the packets in the simulation, and of the packets which left it since the last time, to
+    the module profile and print where the simulation time goes: for each module, the number of times a packet went
+    through it and the mean, median (p50), 99th percentile (p99) and total time packets spent in it. Run it at
+    several points of the simulation to profile more packets, each hop of a packet is only counted once.
+
+    With --folded, the profile is also written to the given file as folded stacks, one line per path through the
+    modules with the total time spent at its end, which flame graph tools accept as input.
+
+profile reset
+    Forget all the profiled packets.
+        '''
+        args = line.split()
+        if len(args) == 1 and args[0] == "reset":
+            self.debugger.module_profile.clear()
+        elif len(args) in (1, 3) and args[0] == "modules":
+            if len(args) == 3 and args[1] != "--folded":
+                raise BadInputException("profile")
+            self.debugger.collect_backtraces()
+            profile = self.debugger.module_profile
+            table = self.formatter.table("module_profile",
+                                         [("module", "Module"), ("hops", "Hops"), ("mean_ns", "Mean (ns)"),
+                                          ("p50_ns", "p50 (ns)"), ("p99_ns", "p99 (ns)"), ("total_ns", "Total (ns)")],
+                                         numalign="left")
+            for row in profile.stats():
+                table.add_row(row)
+            table.flush()
+            self.formatter.record("profile_count", [("packets", profile.packets)],
+                                  "Profiled " + str(profile.packets) + " packets")
+            if len(args) == 3:
+                with open(args[2], "w") as f:
+                    profile.export_folded(f)
+                self.formatter.message("Folded stacks written to " + args[2])
+        else:
+            raise BadInputException("profile")
+
+    @handle_bad_input
+    def do_flow(self, line):
+        '''
+flow [--dot <file>]
+    Add the backtraces of all the packets in the simulation, and of the packets which left it since the last time, to
+    the graph of the paths packets take through the modules, take a sample of the number of packets in each module
+    and print the graph. Each edge between two modules shows how many packets took it and their mean latency, from
+    entering the first module to entering the second. Each module shows its mean and current number of packets and
+    how fast it grows over simulation time. The modules whose number of packets grows the fastest are flagged as
+    likely bottlenecks. Run it at several points of the simulation to build the graph up.
+
+    With --dot, the graph is also written to the given file in the DOT language, with the bottlenecks in red.
+
+flow reset
+    Forget the graph and the samples.
+        '''
+        args = line.split()
+        flow_graph = self.debugger.flow_graph
+        if args == ["reset"]:
+            flow_graph.clear()
+            return
+        if not (len(args) == 0 or (len(args) == 2 and args[0] == "--dot")):
+            raise BadInputException("flow")
+
+        self.debugger.collect_backtraces()
+        self.debugger.sample_occupancy()
+
+        table = self.formatter.table("flow_edge", [("from", "From"), ("to", "To"), ("packets", "Packets"),
+                                                  ("mean_latency_ns", "Mean Latency (ns)")], numalign="left")
+        for row in flow_graph.edge_stats():
+            table.add_row(row)
+        table.flush()
+        self.formatter.heading("")
+        table = self.formatter.table("flow_node", [("module", "Module"), ("mean_packets", "Mean Packets"),
+                                                  ("packets", "Packets"), ("growth_per_us", "Growth (per us)"),
+                                                  ("bottleneck", "Bottleneck")], numalign="left")
+        for module, mean, latest, growth, bottleneck in flow_graph.node_stats():
+            if growth is not None:
+                # In packets per us
+                growth *= 1000
+            if self.formatter.structured:
+                flag = bottleneck
+            elif bottleneck:
+                flag = "yes"
+            else:
+                flag = ""
+            table.add_row([module, mean, latest, growth, flag])
+        table.flush()
+        self.formatter.record("sample_count", [("samples", len(flow_graph.samples))],
+                              str(len(flow_graph.samples)) + " samples")
+        if len(args) == 2:
+            with open(args[1], "w") as f:
+                flow_graph.export_dot(f)
+            self.formatter.message("Graph written to " + args[1])
+
+    @handle_bad_input
+    def do_prefetch(self, line):
+        '''
+prefetch on|off
+    As soon as the simulation stops on a packet, fetch what is usually asked about it next in the background, so that
+    those commands answer instantly from the packet cache. Off by default, or on if pfpdb is started with --prefetch.
+
+prefetch queries <query>[,<query>...]
+    Choose what is fetched for each packet, among whoami, bt, print (parsed contents) and raw (raw contents).
+    The default is whoami,bt,print
+
+prefetch depth <n>
+    Fetch the stopped packet and the n-1 packets closest to it by id in the same module. The default is 1.
+
+prefetch
+    Print the prefetch settings.
+        '''
+        prefetcher = self.debugger.prefetcher
+        args = line.split()
+        if len(args) == 0:
+            if prefetcher.enabled:
+                status = "on"
+            else:
+                status = "off"
+            self.formatter.record("prefetch",
+                                  [("enabled", prefetcher.enabled), ("queries", prefetcher.queries),
+                                   ("depth", prefetcher.depth)],
+                                  "Prefetch: " + status + ", Queries: " + ",".join(prefetcher.queries) +
+                                  ", Depth: " + str(prefetcher.depth))
+        elif len(args) == 1 and args[0] in ("on", "off"):
+            prefetcher.enabled = args[0] == "on"
+            if prefetcher.enabled and not self.debugger.packet_cache.enabled:
+                self.formatter.message("The packet cache is disabled, nothing will be prefetched.")
+        elif len(args) == 2 and args[0] == "queries":
+            queries = args[1].split(",")
+            for query in queries:
+                if query not in cache.Prefetcher.QUERIES:
+                    raise BadInputException("prefetch")
+            prefetcher.queries = queries
+        elif len(args) == 2 and args[0] == "depth" and args[1].isdigit() and int(args[1]) > 0:
+            prefetcher.depth = int(args[1])
+        else:
+            raise BadInputException("prefetch")
+
     # Control Plane Commands
     @handle_bad_input
     def do_cp(self, line):
@@ -1649,9 +1862,31 @@ modify_entry <table_name> <handle> <action_name> <action_data>
 delete_entry <table_name> <handle>
     Deletes an existing table entry. Note that any changes to the match action tables are not instantanenous as these do not bypass the simulation. Thus, the simulation must run a certain amount of
     time before changes are reflected. There can be multiple action data.
+
+cp load <file> [batch <size>] [parallel <n>]
+    Sends all the commands of a file, one per line, in batches of the given size (1000 by default). Lines starting with # are ignored.
+    The simulation may apply up to n commands concurrently (1 by default). The commands which failed are summarized at the end.
+
+cp pending [<table_name>]
+    Prints the number of entries of each table which are being inserted, modified or deleted.
+
+cp wait [<table_name>] [every <time> <units>]
+    Continues the simulation until no entry of the table, or of any table, is pending. If the simulation can't wait by itself,
+    pfpdb continues it for the given time (1 us by default) until the entries are no longer pending. The simulation stops
+    earlier on breakpoints, watchpoints and dropped packets.
         '''
 
-        if len(line) > 0:
+        args = line.split()
+        if len(args) > 0 and args[0] == "load":
+            self.cpLoad(args[1:])
+        elif len(args) > 0 and args[0] == "pending":
+            if len(args) > 2:
+                raise BadInputException("cp")
+            counts = self.debugger.get_pending_operations(args[1] if len(args) == 2 else None)[0]
+            self.printPendingOperations(counts)
+        elif len(args) > 0 and args[0] == "wait":
+            self.cpWait(args[1:])
+        elif len(line) > 0:
             try:
                 command = line
                 self.debugger.cp_command(command);
@@ -1660,68 +1895,265 @@ delete_entry <table_name> <handle>
         else:
             raise BadInputException("cp")
 
+    def cpLoad(self, args):
+        if len(args) == 0 or len(args) % 2 == 0:
+            raise BadInputException("cp")
+        path = args[0]
+        batch_size = self.debugger.cp_batch_size
+        parallelism = self.debugger.cp_parallelism
+        for option, value in zip(args[1::2], args[2::2]):
+            if not value.isdigit() or int(value) == 0:
+                raise BadInputException("cp")
+            if option == "batch":
+                batch_size = int(value)
+            elif option == "parallel":
+                parallelism = int(value)
+            else:
+                raise BadInputException("cp")
+
+        try:
+            cp_file = open(path)
+        except IOError as e:
+            self.formatter.message("Cannot open " + path + ": " + e.strerror)
+            return
+
+        # Failures are grouped by error, with the number of commands and the
+        # first line which failed that way
+        errors = {}
+        failed = 0
+        sent = 0
+        show_progress = sys.stdout.isatty() and not self.formatter.structured
+        start = time.time()
+        with cp_file:
+            batch = []
+            line_numbers = []
+            lines = enumerate(cp_file, 1)
+            while True:
+                for line_number, command in lines:
+                    command = command.strip()
+                    if command == "" or command.startswith("#"):
+                        continue
+                    batch.append(command)
+                    line_numbers.append(line_number)
+                    if len(batch) == batch_size:
+                        break
+                if len(batch) == 0:
+                    break
+
+                for index, error in self.debugger.cp_commands(batch, parallelism):
+                    failed += 1
+                    if error in errors:
+                        errors[error][0] += 1
+                    else:
+                        errors[error] = [1, line_numbers[index], batch[index]]
+                sent += len(batch)
+                batch = []
+                line_numbers = []
+
+                if show_progress:
+                    elapsed = time.time() - start
+                    sys.stdout.write("\rSent {} commands ({:.0f} per second)".format(
+                        sent, sent / elapsed if elapsed > 0 else 0))
+                    sys.stdout.flush()
+        if show_progress:
+            sys.stdout.write("\n")
+
+        elapsed = time.time() - start
+        self.formatter.record("cp_load", [("sent", sent), ("failed", failed), ("elapsed_s", elapsed)],
+                              "Sent {} commands in {:.2f} s ({:.0f} per second), {} failed".format(
+                                  sent, elapsed, sent / elapsed if elapsed > 0 else 0, failed))
+        if len(errors) > 0:
+            table = self.formatter.table("cp_error", [("error", "Error"), ("commands", "Commands"),
+                                                      ("first_line", "First Line"),
+                                                      ("first_command", "First Command")], numalign="left")
+            for error, (count, line_number, command) in sorted(errors.items(), key=lambda item: item[1][1]):
+                table.add_row([error, count, line_number, command])
+            table.flush()
+
+    def printPendingOperations(self, counts):
+        if len(counts) == 0:
+            self.formatter.message("No pending operations")
+            return
+        table = self.formatter.table("pending_operations",
+                                     [("table", "Table"), ("inserting", "Inserting"), ("modifying", "Modifying"),
+                                      ("deleting", "Deleting"), ("pending", "Pending")], numalign="left")
+        for count in counts:
+            table.add_row([count.table_name, count.inserting, count.modifying, count.deleting,
+                           count.inserting + count.modifying + count.deleting])
+        table.flush()
+
+    def cpWait(self, args):
+        table_name = None
+        interval = "1000.0"
+        if len(args) in (1, 4):
+            table_name = args.pop(0)
+        if len(args) == 3 and args[0] == "every":
+            interval = self.getTimeInNS(args[1], args[2])
+        elif len(args) != 0:
+            raise BadInputException("cp")
+        if not self.run_called or self.sim_ended:
+            self.formatter.message("Simulation is not running. Use 'run' command to start simulation.")
+            return
+
+        counts, counted = self.debugger.get_pending_operations(table_name)
+        while len(counts) > 0:
+            if counted:
+                msg_type, reply = self.debugger.until_settled(table_name)
+            else:
+                msg_type, reply = self.debugger.continue_(interval)
+            if msg_type != PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
+                # Stopped for another reason before the entries settled
+                self.handleRunOrContinueReply(msg_type, reply)
+                self.printPendingOperations(self.debugger.get_pending_operations(table_name)[0])
+                return
+            if counted:
+                break
+            counts = self.debugger.get_pending_operations(table_name)[0]
+        self.formatter.message("No pending operations")
+
     @handle_bad_input
     def do_table_dump(self, line):
         '''
-table_dump <table_name>
+table_dump [<table_name>] [action <action_name>] [handles <first>[-<last>]]
     Prints out the contents of a table. If no table name is given, all tables will be printed.
+    The entries printed can be limited to those with the given action or with a handle in the given range.
         '''
 
-        args = line.split(" ")
-        num = len(args)
-        if num > 1:
+        args = line.split()
+        table_name = None
+        action_name = None
+        min_handle = None
+        max_handle = None
+        if len(args) % 2 == 1:
+            table_name = args.pop(0)
+        if len(args) > 4:
             raise BadInputException("table_dump")
+        for option, value in zip(args[::2], args[1::2]):
+            if option == "action" and action_name == None:
+                action_name = value
+            elif option == "handles" and min_handle == None:
+                first, _, last = value.partition("-")
+                if not first.isdigit() or not (last == "" or last.isdigit()):
+                    raise BadInputException("table_dump")
+                min_handle = int(first)
+                max_handle = int(last) if last != "" else min_handle
+            else:
+                raise BadInputException("table_dump")
+
+        table = self.formatter.table("table_entry", TABLE_ENTRY_COLUMNS)
+        last_table = None
+        last_action = None
+        for entry in self.debugger.iter_table_entries(table_name, action_name, min_handle, max_handle):
+            if self.formatter.structured:
+                table.add_row(table_entry_record(entry))
+                continue
+            # Only the first entry of each table and action is labelled
+            row = [entry.table_name, entry.action_name]
+            if entry.table_name == last_table:
+                row[0] = ''
+                if entry.action_name == last_action:
+                    row[1] = ''
+            last_table = entry.table_name
+            last_action = entry.action_name
+
+            row.extend([", ".join(entry.match_key), entry.handle, ", ".join(entry.action_data),
+                        table_entry_status(entry.status)])
+            table.add_row(row)
+        table.flush()
+
+    @handle_bad_input
+    def do_table_lookup(self, line):
+        '''
+table_lookup <table_name> <match_key>
+    Prints the entry of a table which a key would match, with one value per field of the key.
+    The table is mirrored by pfpdb, so only the changes since the last lookup are fetched.
+        '''
+
+        args = line.split()
+        if len(args) < 2:
+            raise BadInputException("table_lookup")
+        table_name = args[0]
+        key = " ".join(args[1:]).replace(",", " ").split()
+
+        entry = self.debugger.table_mirror.lookup(table_name, key)
+        if entry == None:
+            self.formatter.message("No entry of " + table_name + " matches " + ", ".join(key))
         else:
-            table_name = args[0]
-            final_table = []
-            entries = self.debugger.get_table_entries()
-            headings = ["Table", "Action", "Match Key", "Handle", "Action Data", "Status"]
-            for table, action_dict in entries.items():
-                if table_name == '' or table_name == table:
-                    l = [table]
-                    i = 0
-                    for action, entry_list in action_dict.items():
-                        if i != 0:
-                            l = ['']
-                        l.append(action)
-                        j = 0
-                        for entry in entry_list:
-                            if j != 0:
-                                l = ['','']
-                            match_key = ", ".join(entry['match_key'])
-                            action_data = ", ".join(entry['action_data'])
-
-                            entry_status = "NONE"
-                            if entry['status'] == PFPSimDebugger_pb2.TableEntriesMsg.OK:
-                                entry_status = "OK"
-                            elif entry['status'] == PFPSimDebugger_pb2.TableEntriesMsg.INSERTING:
-                                entry_status = "INSERTING"
-                            elif entry['status'] == PFPSimDebugger_pb2.TableEntriesMsg.DELETING:
-                                entry_status = "DELETING"
-                            elif entry['status'] == PFPSimDebugger_pb2.TableEntriesMsg.MODIFYING:
-                                entry_status = "MODIFYING"
-
-                            l.extend([match_key, entry['handle'], action_data, entry_status])
-                            final_table.append(l)
-                            j += 1
-                        i += 1
-
-            print(tabulate(final_table, headers=headings))
+            table = self.formatter.table("table_entry", TABLE_ENTRY_COLUMNS)
+            if self.formatter.structured:
+                table.add_row(table_entry_record(entry))
+            else:
+                table.add_row([entry.table_name, entry.action_name, ", ".join(entry.match_key), entry.handle,
+                               ", ".join(entry.action_data), table_entry_status(entry.status)])
+            table.flush()
 
     # Auto complete for print command
     def complete_print(self, text, line, begidx, endidx):
         args = line.split(" ")
-        PRINT_OPTIONS = ('counter', 'packets', 'dropped_packets')
+        PRINT_OPTIONS = ('counter', 'packets', 'dropped_packets', 'raw', 'field')
         FLAGS = ('-c', '-p')
         if args[1] in PRINT_OPTIONS or args[1] in FLAGS:
-            if args[1] == 'counter' or args[1] == '-c':
-                names, values = self.debugger.print_all_counters()
-                names.append('all')
-                return [i for i in names if i.startswith(text)]
+            if (args[1] == 'counter' or args[1] == '-c') and len(args) == 3:
+                return self.debugger.metadata.counter_names(text) + [i for i in ('all', 'diff') if i.startswith(text)]
             elif args[1] == 'packets' or args[1] == '-p':
-                pass
-        else:
-            return [i for i in PRINT_OPTIONS if i.startswith(text)]
+                if len(args) == 4 and args[2] == '-m':
+                    return self.debugger.metadata.module_names(text)
+            elif args[1] == 'raw' and len(args) == 3:
+                return self.debugger.metadata.packet_ids(text)
+            elif args[1] == 'field' and len(args) == 4:
+                return self.debugger.metadata.packet_ids(text)
+        elif len(args) == 2:
+            options = [i for i in PRINT_OPTIONS if i.startswith(text)]
+            if text.isdigit():
+                options.extend(self.debugger.metadata.packet_ids(text))
+            return options
+
+    # Auto complete for sample command
+    def complete_sample(self, text, line, begidx, endidx):
+        SAMPLE_OPTIONS = ('counters', 'status', 'export')
+        args = line.split(" ")
+        if len(args) == 2:
+            return [i for i in SAMPLE_OPTIONS if i.startswith(text)]
+        elif len(args) == 3 and args[1] == 'counters':
+            return [i for i in ('every',) if i.startswith(text)]
+        return []
+
+    # Auto complete for dump command
+    def complete_dump(self, text, line, begidx, endidx):
+        args = line.split(" ")
+        if len(args) == 2:
+            return [i for i in ('pcap',) if i.startswith(text)]
+        elif len(args) == 4:
+            return [i for i in ('module', 'dropped', 'ids') if i.startswith(text)]
+        elif len(args) == 5 and args[3] == 'module':
+            return self.debugger.metadata.module_names(text)
+        return []
+
+    # Auto complete for profile command
+    def complete_profile(self, text, line, begidx, endidx):
+        args = line.split(" ")
+        if len(args) == 2:
+            return [i for i in ('modules', 'reset') if i.startswith(text)]
+        elif len(args) == 3 and args[1] == 'modules':
+            return [i for i in ('--folded',) if i.startswith(text)]
+        return []
+
+    # Auto complete for flow command
+    def complete_flow(self, text, line, begidx, endidx):
+        if len(line.split(" ")) == 2:
+            return [i for i in ('--dot', 'reset') if i.startswith(text)]
+        return []
+
+    # Auto complete for prefetch command
+    def complete_prefetch(self, text, line, begidx, endidx):
+        args = line.split(" ")
+        if len(args) == 2:
+            return [i for i in ('on', 'off', 'queries', 'depth') if i.startswith(text)]
+        elif len(args) == 3 and args[1] == 'queries':
+            # Complete the last query of the comma separated list
+            done, sep, last = text.rpartition(',')
+            return [done + sep + i for i in cache.Prefetcher.QUERIES if i.startswith(last)]
+        return []
 
     # Auto complete for restart command
     def complete_restart(self, text, line, begidx, endidx):
@@ -1729,7 +2161,7 @@ table_dump <table_name>
         return [i for i in RESTART_OPTIONS if i.startswith(text)]
 
     def complete_trace(self, text, line, begidx, endidx):
-        TRACE_MODES = ('latency', 'throughput', 'counter')
+        TRACE_MODES = ('latency', 'throughput', 'counter', 'drops')
         APPEND      = ('append',)
 
         splitline = line.split()
@@ -1745,10 +2177,17 @@ table_dump <table_name>
             return filter(starts_with_text, TRACE_MODES)
 
         if re.match(r'^trace\s+(append\s+\d+\s+)?counter(\s*|\s+[^\s]+)$', line):
-            names, values = self.debugger.print_all_counters()
-            return filter(starts_with_text, names)
+            return self.debugger.metadata.counter_names(text)
+
+        if re.match(r'^trace\s+(append\s+\d+\s+)?(latency|-l)(\s+[^\s]+){0,1}(\s*|\s+[^\s]+)$', line):
+            return self.debugger.metadata.module_names(text)
+
+        if re.match(r'^trace\s+(append\s+\d+\s+)?(throughput|-t)(\s*|\s+[^\s]+)$', line):
+            return self.debugger.metadata.module_names(text)
+
+        if re.match(r'^trace\s+(append\s+\d+\s+)?drops(\s*|\s+[^\s]+)$', line):
+            return self.debugger.metadata.module_names(text) + [i for i in ('every',) if i.startswith(text)]
 
-        # TODO(gordon) complete module names?
         return ()
 
 
@@ -1758,19 +2197,41 @@ table_dump <table_name>
         args = line.split(" ")
         if args[1] in WATCH_OPTIONS:
             if args[1] == 'counter':
-                names, values = self.debugger.print_all_counters()
-                return [i for i in names if i.startswith(text)]
+                return self.debugger.metadata.counter_names(text)
         else:
             return [i for i in WATCH_OPTIONS if i .startswith(text)]
 
     # Auto complete for break command
     def complete_break(self, text, line, begidx, endidx):
         BREAK_OPTIONS = ('dropped_packet',)
+        args = line.split(" ")
+        if len(args) >= 3 and args[-2] in ('-m', '-m_in', '-m_out'):
+            return self.debugger.metadata.module_names(text)
+        elif len(args) >= 3 and args[-2] == '-p':
+            return self.debugger.metadata.packet_ids(text)
         return [i for i in BREAK_OPTIONS if i.startswith(text)]
 
+    # Auto complete for tbreak command
+    def complete_tbreak(self, text, line, begidx, endidx):
+        return self.complete_break(text, line, begidx, endidx)
+
+    # Auto complete for backtrace command
+    def complete_backtrace(self, text, line, begidx, endidx):
+        return self.debugger.metadata.packet_ids(text)
+
+    def complete_bt(self, text, line, begidx, endidx):
+        return self.complete_backtrace(text, line, begidx, endidx)
+
+    # Auto complete for until and ignore commands
+    def complete_until(self, text, line, begidx, endidx):
+        return self.debugger.metadata.module_names(text)
+
+    def complete_ignore(self, text, line, begidx, endidx):
+        return self.debugger.metadata.module_names(text)
+
     # Auto complete for info command
     def complete_info(self, text, line, begidx, endidx):
-        INFO_OPTIONS = ('break', 'watch', 'ignore')
+        INFO_OPTIONS = ('break', 'watch', 'ignore', 'snapshots', 'cache')
         return [i for i in INFO_OPTIONS if i.startswith(text)]
 
     # Auto complete for delete command
@@ -1806,20 +2267,46 @@ table_dump <table_name>
                 read_write = "Read"
             else:
                 read_write = "Write"
-            print("\033[0mBreakpoint Hit - ID: " + str(reply.id) + "\nPacket ID: " + str(reply.packet_id) + "\nModule: " + reply.module + " (" + read_write + ")\nTime: " + str(reply.time_ns) + " ns")
+            self.formatter.record("breakpoint_hit",
+                                  [("id", reply.id), ("packet_id", reply.packet_id), ("module", reply.module),
+                                   ("access", read_write.lower()), ("time_ns", reply.time_ns)],
+                                  "\033[0mBreakpoint Hit - ID: " + str(reply.id) + "\nPacket ID: " + str(reply.packet_id) + "\nModule: " + reply.module + " (" + read_write + ")\nTime: " + str(reply.time_ns) + " ns")
+            self.prefetch_from = (reply.packet_id, reply.module)
         elif msg_type == PFPSimDebugger_pb2.DebugMsg.WatchpointHit:
-            print("\033[0mWatchpoint Hit - ID: " + str(reply.id) + "\nCounter Name: " + reply.counter_name + "\nCounter Value: " + str(reply.old_value) + " -> " + str(reply.new_value))
+            self.formatter.record("watchpoint_hit",
+                                  [("id", reply.id), ("counter_name", reply.counter_name),
+                                   ("old_value", reply.old_value), ("new_value", reply.new_value)],
+                                  "\033[0mWatchpoint Hit - ID: " + str(reply.id) + "\nCounter Name: " + reply.counter_name + "\nCounter Value: " + str(reply.old_value) + " -> " + str(reply.new_value))
         elif msg_type == PFPSimDebugger_pb2.DebugMsg.SimulationEnd:
-            print("\033[0mSimulation has ended.")
+            self.formatter.record("simulation_end", [], "\033[0mSimulation has ended.")
             self.sim_ended = True
         elif msg_type == PFPSimDebugger_pb2.DebugMsg.SimulationStopped:
             if reply.read is True:
                 read_str = "Read"
             else:
                 read_str = "Write"
-            print("\033[0mPacket ID: " + str(reply.packet_id) + "\nModule: " + reply.module + " (" + read_str + ")\nTime: " + str(reply.time) + " ns")
+            lines = []
+            hops = []
+            if len(reply.hop_module_list) > 0:
+                lines.append("\033[0mHops:")
+                for i, mod in enumerate(reply.hop_module_list):
+                    if reply.hop_read_list[i]:
+                        hop_str = "Read"
+                    else:
+                        hop_str = "Write"
+                    lines.append("    " + mod + " (" + hop_str + ") at " + str(reply.hop_time_list[i]) + " ns")
+                    hops.append(OrderedDict([("module", mod), ("access", hop_str.lower()),
+                                             ("time_ns", reply.hop_time_list[i])]))
+            lines.append("\033[0mPacket ID: " + str(reply.packet_id) + "\nModule: " + reply.module + " (" + read_str + ")\nTime: " + str(reply.time) + " ns")
+            self.formatter.record("simulation_stopped",
+                                  [("packet_id", reply.packet_id), ("module", reply.module),
+                                   ("access", read_str.lower()), ("time_ns", reply.time), ("hops", hops)],
+                                  "\n".join(lines))
+            self.prefetch_from = (reply.packet_id, reply.module)
         elif msg_type == PFPSimDebugger_pb2.DebugMsg.PacketDropped:
-            print("\033[0mPacket Dropped!\nPacket ID: " + str(reply.packet_id) + "\nModule: " + reply.module + "\nReason: " + reply.reason)
+            self.formatter.record("packet_dropped",
+                                  [("packet_id", reply.packet_id), ("module", reply.module), ("reason", reply.reason)],
+                                  "\033[0mPacket Dropped!\nPacket ID: " + str(reply.packet_id) + "\nModule: " + reply.module + "\nReason: " + reply.reason)
         elif msg_type == PFPSimDebugger_pb2.DebugMsg.GenericAcknowledge:
             pass
 
@@ -1844,72 +2331,94 @@ table_dump <table_name>
             time_final = str(time_double_ns)
         return time_final
 
-def start_simulation():
-    print("Launching " + exe_name + " as child process...")
-
-    # Put together list with command to execute and its arguments
-    popen_input = ['./' + exe_name]
-    popen_input.extend(arg_list)
-    popen_input.append('-d')
-
-    if verbose is False:
-        FNULL = open(os.devnull, 'w')
-        return subprocess.Popen(popen_input, stdin=subprocess.PIPE, stdout=FNULL)
-    else:
-        return subprocess.Popen(popen_input, stdin=subprocess.PIPE)
-
 def main():
+    simulation = None
+    debugger = None
+    profile = startup.StartupProfile()
     try:
         argparser = argparse.ArgumentParser(description="Debugger for PFPSim")
         argparser.add_argument('-v', action='store_true', help="Verbose Mode")
         argparser.add_argument('--debug', action='store_true', help="PFPDB Debug Mode")
+        argparser.add_argument('--no-cache', action='store_true', help="Always fetch packet contents and backtraces from the simulation")
+        argparser.add_argument('--prefetch', action='store_true', help="Fetch packet contents and backtraces in the background when the simulation stops")
         argparser.add_argument('-a', action='store_true', help=argparse.SUPPRESS) # Attach to existing simulation
+        argparser.add_argument('-x', dest='script', metavar='SCRIPT', help="Run the commands of a script without prompting, then exit")
+        argparser.add_argument('--batch', action='store_true', help="Run commands from the script, or from stdin, without prompting, then exit")
+        argparser.add_argument('-D', dest='variables', action='append', default=[], metavar='NAME=VALUE', help="Set a variable of the script")
+        argparser.add_argument('--output', choices=['text', 'json'], default='text', help="Print the output of commands as text or as JSON records, one per line")
+        argparser.add_argument('--url', default=DEFAULT_URL, help="Url of the debugger server of the model, or 'auto' for a new private one, which lets several sessions run at once (default: " + DEFAULT_URL + ")")
+        argparser.add_argument('--trace-url', help="Url the model publishes traces on, or 'auto' (default: 'auto' if --url is, " + DEFAULT_TRACE_URL + " otherwise)")
+        argparser.add_argument('--startup-profile', action='store_true', help="Print how long each phase of the startup and each import took")
         argparser.add_argument('--args', action='store', type=str, help="Arguments which must be passed to executable.", required=True)
         argparser.add_argument('exe_path')
         # argparser.add_argument('--json', help='JSON description of P4 program', type=str, action="store", required=True)
         args = argparser.parse_args()
-        global verbose
-        if args.v:
-            verbose = True
-        else:
-            verbose = False
-
-        global arg_list
+        if args.trace_url == None:
+            args.trace_url = AUTO_URL if args.url == AUTO_URL else DEFAULT_TRACE_URL
+        if args.a and AUTO_URL in (args.url, args.trace_url):
+            argparser.error("the urls of a running simulation can't be 'auto'")
+        if args.startup_profile:
+            profile.enable()
+        profile.mark("arguments")
         arg_list = []
         if args.args:
             arg_list = args.args.strip(" ").split(" ")
 
+        # The script is parsed before the simulation is started, and relative
+        # to the directory pfpdb is started from
+        statements = None
+        if args.script != None or args.batch:
+            variables = {}
+            for variable in args.variables:
+                name, sep, value = variable.partition("=")
+                if not sep or not script.NAME.match(name):
+                    sys.stderr.write("error: invalid variable " + variable + "\n")
+                    sys.exit(2)
+                variables[name] = value
+            try:
+                if args.script != None:
+                    with open(args.script) as script_file:
+                        statements = script.parse(script_file)
+                else:
+                    statements = script.parse(sys.stdin)
+            except IOError as e:
+                sys.stderr.write("error: cannot read " + args.script + ": " + e.strerror + "\n")
+                sys.exit(2)
+            except script.ScriptError as e:
+                sys.stderr.write("error: " + str(e) + "\n")
+                sys.exit(2)
+            profile.mark("script")
+
         exe_path = args.exe_path
         if os.path.exists(exe_path):
-            global exe_name
             exe_name = exe_path.split("/")[-1]
             exe_dir = exe_path[:-len(exe_name)]
-            if exe_dir is '':
+            if exe_dir == '':
                 exe_dir = './'
             os.chdir(exe_dir)
         else:
-            print("error: " + exe_path + " was not found.")
+            sys.stderr.write("error: " + exe_path + " was not found." + "\n")
             sys.exit(1)
 
+        # Only the records of the commands are printed to stdout in JSON
+        if args.output == "json":
+            formatter = formatting.JsonFormatter()
+        else:
+            formatter = formatting.TextFormatter()
+
         attach = False
         if args.a:
-            try:
-                pid = subprocess.check_output(["pidof", exe_name])
-                attach = True
-                print("Attached to " + exe_name + " (PID: " + str(pid.rstrip('\n')) + ")")
-            except:
-                print("Process " + exe_name + " does not exist")
+            pids = find_pids(exe_name)
+            if len(pids) == 0:
+                sys.stderr.write("Process " + exe_name + " does not exist" + "\n")
                 sys.exit(1)
-        else:
-            exit_flag = False;
-            try:
-                pid_tmp = subprocess.check_output(["pidof", exe_name])
-                print("A process with the name " + exe_name + " is already running. Please kill this other process to proceed.")
-                exit_flag = True;
-            except:
-                pass
-            if exit_flag is True:
+            elif len(pids) > 1:
+                sys.stderr.write("Several processes are named " + exe_name + ": " + " ".join(map(str, pids)) + "\n")
                 sys.exit(1)
+            pid = pids[0]
+            attach = True
+            formatter.message("Attached to " + exe_name + " (PID: " + str(pid) + ")")
+            profile.mark("process lookup")
 
         # load_json(args.json)
         # print(TABLES['forward'].actions['set_dmac'].runtime_data)
@@ -1917,25 +2426,50 @@ def main():
         # Suppress SystemC Copyright message
         os.environ["SYSTEMC_DISABLE_COPYRIGHT_MESSAGE"] = "1"
 
-        global p
         if not attach:
-            p = start_simulation()
-            pid = p.pid
-        else:
-            p = None
-
-        ipc_url = "ipc:///tmp/pfpsimdebug.ipc"
-        ipc_session = DebuggerIPCSession(ipc_url)
-        debugger = PFPSimDebugger(ipc_session, p, pid, args.debug)
-        debugger_cmd = PFPSimDebuggerCmd(debugger)
+            formatter.message("Launching " + exe_name + " as child process...")
+            simulation = Simulation('./' + exe_name, arg_list, args.v, url=args.url, trace_url=args.trace_url).start()
+            pid = simulation.pid
+            profile.mark("simulation launch")
+
+        url, trace_url = args.url, args.trace_url
+        if simulation is not None:
+            # The endpoints allocated for 'auto'
+            url, trace_url = simulation.url, simulation.trace_url
+        ipc_session = DebuggerIPCSession(url)
+        debugger = PFPSimDebugger(ipc_session, simulation, pid, args.debug, not args.no_cache)
+        debugger.trace_url = trace_url
+        debugger.prefetcher.enabled = args.prefetch
+        profile.mark("connection")
+        if statements != None:
+            debugger_cmd = PFPSimDebuggerCmd(debugger, interactive = False, output = args.output)
+            if args.startup_profile:
+                profile.mark("command interpreter")
+                profile.report()
+            exit_code = debugger_cmd.runScript(script.expand(statements, variables))
+            debugger.quit()
+            sys.exit(exit_code)
+        debugger_cmd = PFPSimDebuggerCmd(debugger, output = args.output)
+        if args.startup_profile:
+            profile.mark("command interpreter")
+            debugger_cmd.startup_profile = profile
         debugger_cmd.cmdloop()
     except KeyboardInterrupt:
-        print("KeyboardInterrupt")
-        if p.poll() == None:
-            p.kill()
+        sys.stderr.write("KeyboardInterrupt\n")
+    except SimulationExited as e:
+        sys.stderr.write(str(e) + "\n")
+        if e.exit_code != None:
+            sys.exit(1)
+        sys.exit(0)
     except Exception as e:
-        print(str(e))
+        sys.stderr.write(str(e) + "\n")
         traceback.print_exc()
-        if 'p' in globals():
-            if p.poll() == None:
-                p.kill()
+        sys.exit(1)
+    finally:
+        # Stops the trace dispatcher thread and closes its socket
+        if debugger is not None:
+            debugger.close_traces()
+        # Kills the simulation if it is still running and removes the
+        # endpoints allocated for it
+        if simulation is not None:
+            simulation.close()
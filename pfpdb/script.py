@@ -0,0 +1,144 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Command scripts run by pfpdb in batch mode.
+
+A script holds one debugger command per line. Lines starting with # are
+comments. On top of the debugger commands, scripts support:
+
+    set <name> = <value>           Set a variable, used as $name or ${name}
+    for <name> in <values>         Repeat the following lines for each of the
+    ...                            space separated values, or for each integer
+    end                            of a range written <first>..<last>
+    repeat <count>                 Repeat the following lines count times
+    ...
+    end
+"""
+
+import re
+
+VARIABLE = re.compile(r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))")
+NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class ScriptError(Exception):
+    def __init__(self, line_number, message):
+        super(ScriptError, self).__init__(message)
+        self.line_number = line_number
+        self.message = message
+
+    def __str__(self):
+        return "line " + str(self.line_number) + ": " + self.message
+
+
+def substitute(text, variables, line_number):
+    """Replace the variables in text by their value"""
+    def value(match):
+        name = match.group(1) or match.group(2)
+        if name not in variables:
+            raise ScriptError(line_number, "Undefined variable " + name)
+        return variables[name]
+    return VARIABLE.sub(value, text)
+
+
+def parse(lines):
+    """Parse the lines of a script into a list of statements, which are tuples
+    starting with the kind of statement and the line number.
+
+    Raises ScriptError if the loops are malformed."""
+    # Statements of the blocks being parsed, innermost last
+    blocks = [[]]
+    loops = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        words = line.split()
+        if words[0] == "set" and len(words) >= 3 and words[2] == "=":
+            if not NAME.match(words[1]):
+                raise ScriptError(line_number, "Invalid variable name " + words[1])
+            blocks[-1].append(('set', line_number, words[1], line.split("=", 1)[1].strip()))
+        elif words[0] == "for":
+            if len(words) < 4 or words[2] != "in" or not NAME.match(words[1]):
+                raise ScriptError(line_number, "Expected: for <name> in <values>")
+            loops.append(('for', line_number, words[1], " ".join(words[3:])))
+            blocks.append([])
+        elif words[0] == "repeat":
+            if len(words) != 2:
+                raise ScriptError(line_number, "Expected: repeat <count>")
+            loops.append(('repeat', line_number, words[1]))
+            blocks.append([])
+        elif words[0] == "end" and len(words) == 1:
+            if len(loops) == 0:
+                raise ScriptError(line_number, "end without for or repeat")
+            body = blocks.pop()
+            blocks[-1].append(loops.pop() + (body,))
+        else:
+            blocks[-1].append(('command', line_number, line))
+    if len(loops) > 0:
+        raise ScriptError(loops[-1][1], "Missing end")
+    return blocks[0]
+
+
+def expand(statements, variables):
+    """Generate (line number, command) for every command run by the parsed
+    statements, in order. Variables are substituted as commands are
+    generated, and set updates variables."""
+    for statement in statements:
+        kind, line_number = statement[:2]
+        if kind == 'command':
+            yield line_number, substitute(statement[2], variables, line_number)
+        elif kind == 'set':
+            variables[statement[2]] = substitute(statement[3], variables, line_number)
+        elif kind == 'for':
+            _, _, name, values, body = statement
+            for value in loop_values(substitute(values, variables, line_number), line_number):
+                variables[name] = value
+                for item in expand(body, variables):
+                    yield item
+        elif kind == 'repeat':
+            count = substitute(statement[2], variables, line_number)
+            if not count.isdigit():
+                raise ScriptError(line_number, "Invalid repeat count " + count)
+            for _ in range(int(count)):
+                for item in expand(statement[3], variables):
+                    yield item
+
+
+def loop_values(values, line_number):
+    words = values.split()
+    if len(words) == 1 and ".." in words[0]:
+        first, last = words[0].split("..", 1)
+        try:
+            first, last = int(first), int(last)
+        except ValueError:
+            raise ScriptError(line_number, "Invalid range " + words[0])
+        return (str(value) for value in range(first, last + 1))
+    return words
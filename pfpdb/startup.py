@@ -0,0 +1,137 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+"""Breakdown of the time pfpdb takes to start, printed with --startup-profile.
+
+The time spent before main() runs, starting the interpreter and importing the
+modules pfpdb always needs, is read from /proc with a resolution of a clock
+tick. From then on the time of every phase of the startup is recorded, along
+with the time taken by every import which loads new modules.
+"""
+
+import os
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+
+# Returns the number of seconds since the process started, or None if /proc
+# isn't available
+def process_age():
+    try:
+        with open("/proc/self/stat") as stat_file:
+            stat = stat_file.read()
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+    except (IOError, OSError, ValueError):
+        return None
+    # The command name in parentheses may contain spaces. The start time is
+    # the 22nd field, the 20th one after the command name.
+    fields = stat[stat.rindex(")") + 2:].split()
+    return max(0.0, uptime - int(fields[19]) / float(os.sysconf("SC_CLK_TCK")))
+
+
+# Returns the absolute name of the module imported by a call to __import__
+def imported_name(name, args, kwargs):
+    import_globals = args[0] if len(args) > 0 else kwargs.get("globals")
+    fromlist = args[2] if len(args) > 2 else kwargs.get("fromlist")
+    level = args[3] if len(args) > 3 else kwargs.get("level", 0)
+    if level > 0 and import_globals:
+        package = import_globals.get("__package__") or ""
+        if name:
+            return package + "." + name
+        elif fromlist:
+            # from . import module
+            return package + "." + fromlist[0]
+        return package
+    return name
+
+
+# StartupProfile class - Records the phases of the startup and the imports made
+# while it is enabled.
+class StartupProfile(object):
+    def __init__(self, out = None):
+        self.out = out  # sys.stderr if None
+        self.before_main = process_age()
+        self.phases = []   # (phase, seconds)
+        self.imports = []  # (module, seconds), nested imports are included in the outermost one
+        self._last = time.time()
+        self._import = None
+        self._depth = 0
+
+    def enable(self):
+        if self._import is None:
+            self._import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def disable(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def _timed_import(self, name, *args, **kwargs):
+        if self._depth > 0:
+            return self._import(name, *args, **kwargs)
+        count = len(sys.modules)
+        self._depth += 1
+        start = time.time()
+        try:
+            return self._import(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            self._depth -= 1
+            if len(sys.modules) > count:
+                self.imports.append((imported_name(name, args, kwargs), elapsed))
+
+    def mark(self, phase):
+        """Ends a phase of the startup, which began when the previous one ended"""
+        now = time.time()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        self.disable()
+        out = self.out if self.out is not None else sys.stderr
+        total = sum(seconds for _, seconds in self.phases)
+        out.write("Startup profile (ms):\n")
+        if self.before_main is not None:
+            out.write("{:10.1f}  interpreter and pfpdb imports\n".format(self.before_main * 1000))
+            total += self.before_main
+        for phase, seconds in self.phases:
+            out.write("{:10.1f}  {}\n".format(seconds * 1000, phase))
+        out.write("{:10.1f}  total\n".format(total * 1000))
+        if len(self.imports) > 0:
+            out.write("Imports during startup (ms):\n")
+            for module, seconds in sorted(self.imports, key=lambda item: item[1], reverse=True):
+                out.write("{:10.1f}  {}\n".format(seconds * 1000, module))
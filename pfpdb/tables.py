@@ -0,0 +1,278 @@
+#
+# pfpdb: Debugger for models built with the PFPSim Framework
+#
+# Copyright (C) 2016 Concordia Univ., Montreal
+#     Samar Abdi
+#     Umair Aftab
+#     Gordon Bailey
+#     Faras Dewal
+#     Shafigh Parsazad
+#     Eric Tremblay
+#
+# Copyright (C) 2016 Ericsson
+#     Bochra Boughzala
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+
+
+"""Client side representation of the entries of match-action tables."""
+
+import binascii
+import bisect
+import logging
+import socket
+from collections import namedtuple
+from numbers import Integral
+
+from . import PFPSimDebugger_pb2
+
+# One entry of a match-action table. match_key and action_data are tuples of
+# strings, status is a TableEntriesMsg.TableEntryStatus value.
+TableEntry = namedtuple('TableEntry', ['table_name', 'match_key', 'action_name',
+                                       'action_data', 'handle', 'status', 'priority'])
+
+# Number of entries of a table waiting for an operation to complete
+PendingCount = namedtuple('PendingCount', ['table_name', 'inserting', 'modifying', 'deleting'])
+
+# Widths assumed for the prefixes of LPM keys written in decimal
+DEFAULT_WIDTH = 32
+
+
+def parse_value(text):
+    """Return (value, width) for a match key value written in hex (0x0a01),
+    decimal, or as an IPv4, IPv6 or MAC address. width is the number of bits
+    the value was written with, or None for decimal values.
+
+    Raises ValueError if text isn't a value."""
+    if text.lower().startswith("0x"):
+        return int(text, 16), 4 * (len(text) - 2)
+    if text.isdigit():
+        return int(text), None
+    try:
+        if text.count(".") == 3:
+            return int(binascii.hexlify(socket.inet_aton(text)), 16), 32
+        if text.count(":") == 5 and "::" not in text:
+            return int(text.replace(":", ""), 16), 48
+        if ":" in text:
+            return int(binascii.hexlify(socket.inet_pton(socket.AF_INET6, text)), 16), 128
+    except (socket.error, ValueError):
+        pass
+    raise ValueError("Invalid value: " + text)
+
+
+def parse_field(text):
+    """Parse one field of the match key of an entry.
+
+    Returns ('exact', value), ('lpm', value, prefix_length, width) or
+    ('ternary', value, mask). Exact values which aren't numbers, such as names,
+    are kept as strings. Raises ValueError for malformed LPM and ternary
+    fields."""
+    if "&&&" in text:
+        value, mask = text.split("&&&", 1)
+        mask = parse_value(mask.strip())[0]
+        return ('ternary', parse_value(value.strip())[0] & mask, mask)
+    if "/" in text:
+        value, length = text.split("/", 1)
+        value, width = parse_value(value.strip())
+        if width == None:
+            width = DEFAULT_WIDTH
+        length = int(length)
+        if length < 0 or length > width:
+            raise ValueError("Invalid prefix length: " + text)
+        return ('lpm', value >> (width - length), length, width)
+    try:
+        return ('exact', parse_value(text)[0])
+    except ValueError:
+        return ('exact', text)
+
+
+# MirroredTable class - Entries of one table indexed for lookups.
+#
+# Entries whose key only has exact fields are found with a single hash lookup.
+# Entries with exactly one LPM field are stored in a binary trie per width,
+# under the value of their exact fields. All other entries, such as ternary
+# ones, are kept in a list sorted by priority, which is scanned in order.
+class MirroredTable(object):
+    def __init__(self, name):
+        self.name = name
+        self.version = None
+        self.generation = None
+        self.entries = {}   # handle -> TableEntry
+        self._exact = {}    # exact values -> handle
+        self._lpm = {}      # (LPM field index, exact values, width) -> trie
+        self._ternary = []  # sorted (priority, handle, [(value, mask)])
+        self._indexed = {}  # handle -> how the entry is indexed, to remove it
+
+        self.log = logging.getLogger("TableMirror")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.__init__(self.name)
+
+    def add(self, entry):
+        self.remove(entry.handle)
+        self.entries[entry.handle] = entry
+        if entry.status == PFPSimDebugger_pb2.TableEntriesMsg.INSERTING:
+            # Not in the table of the model yet
+            return
+        try:
+            fields = [parse_field(text) for text in entry.match_key]
+        except ValueError as e:
+            self.log.debug("Can't index entry " + str(entry.handle) + ": " + str(e))
+            return
+
+        kinds = [field[0] for field in fields]
+        if kinds.count('ternary') == 0 and kinds.count('lpm') == 0:
+            key = tuple(field[1] for field in fields)
+            self._exact[key] = entry.handle
+            self._indexed[entry.handle] = ('exact', key)
+        elif kinds.count('ternary') == 0 and kinds.count('lpm') == 1:
+            position = kinds.index('lpm')
+            _, prefix, length, width = fields[position]
+            key = (position, tuple(field[1] for field in fields if field[0] == 'exact'), width)
+            node = self._lpm.setdefault(key, [None, None, None])
+            for bit in range(length - 1, -1, -1):
+                child = (prefix >> bit) & 1
+                if node[child] == None:
+                    node[child] = [None, None, None]
+                node = node[child]
+            node[2] = entry.handle
+            self._indexed[entry.handle] = ('lpm', key, prefix, length)
+        else:
+            masks = []
+            for field in fields:
+                if field[0] == 'ternary':
+                    masks.append((field[1], field[2]))
+                elif field[0] == 'lpm':
+                    _, prefix, length, width = field
+                    masks.append((prefix << (width - length),
+                                  ((1 << length) - 1) << (width - length)))
+                else:
+                    masks.append((field[1], None))
+            item = (entry.priority, entry.handle, masks)
+            bisect.insort(self._ternary, item)
+            self._indexed[entry.handle] = ('ternary', item)
+
+    def remove(self, handle):
+        if self.entries.pop(handle, None) == None:
+            return
+        indexed = self._indexed.pop(handle, None)
+        if indexed == None:
+            return
+        if indexed[0] == 'exact':
+            if self._exact.get(indexed[1]) == handle:
+                del self._exact[indexed[1]]
+        elif indexed[0] == 'lpm':
+            _, key, prefix, length = indexed
+            node = self._lpm[key]
+            for bit in range(length - 1, -1, -1):
+                node = node[(prefix >> bit) & 1]
+            if node[2] == handle:
+                node[2] = None
+        else:
+            index = bisect.bisect_left(self._ternary, indexed[1])
+            del self._ternary[index]
+
+    def lookup(self, key):
+        """Return the entry which a key, given as one string per field, would
+        match, or None if the key matches no entry."""
+        values = []
+        for text in key:
+            try:
+                values.append(parse_value(text)[0])
+            except ValueError:
+                values.append(text)
+        values = tuple(values)
+
+        handle = self._exact.get(values)
+        if handle != None:
+            return self.entries[handle]
+
+        best = None
+        for (position, exact, width), trie in self._lpm.items():
+            if len(exact) != len(values) - 1 or not isinstance(values[position], Integral) \
+                    or values[position] >> width != 0:
+                continue
+            if exact != values[:position] + values[position + 1:]:
+                continue
+            node = trie
+            found = node[2]
+            for bit in range(width - 1, -1, -1):
+                node = node[(values[position] >> bit) & 1]
+                if node == None:
+                    break
+                if node[2] != None:
+                    found = node[2]
+            if found != None:
+                length = self._indexed[found][3]
+                if best == None or length > best[1]:
+                    best = (found, length)
+        if best != None:
+            return self.entries[best[0]]
+
+        for _, handle, masks in self._ternary:
+            if len(masks) != len(values):
+                continue
+            for (value, mask), field in zip(masks, values):
+                if mask == None:
+                    if field != value:
+                        break
+                elif not isinstance(field, Integral) or field & mask != value:
+                    break
+            else:
+                return self.entries[handle]
+        return None
+
+
+# TableMirror class - Client side copy of the match-action tables, used to find
+# which entry a key would match without dumping the tables again.
+#
+# A table is mirrored the first time it is looked up. It is brought up to date
+# at most once per stop generation, with only the changes since the version of
+# the mirror if the model supports it, or with all the entries otherwise.
+class TableMirror(object):
+    def __init__(self, debugger):
+        self.debugger = debugger
+        self.tables = {}  # table name -> MirroredTable
+        self.log = logging.getLogger("TableMirror")
+
+    def clear(self):
+        self.tables.clear()
+
+    def sync(self, table_name):
+        table = self.tables.get(table_name)
+        if table == None:
+            table = self.tables[table_name] = MirroredTable(table_name)
+        if table.generation == self.debugger.generation:
+            return table
+
+        version, delta, entries, deleted = self.debugger.get_table_changes(table_name, table.version)
+        if not delta:
+            self.log.debug("Refetching all the entries of " + table_name)
+            table.clear()
+        for handle in deleted:
+            table.remove(handle)
+        for entry in entries:
+            table.add(entry)
+        table.version = version
+        table.generation = self.debugger.generation
+        return table
+
+    def lookup(self, table_name, key):
+        return self.sync(table_name).lookup(key)
@@ -49,6 +49,113 @@ class TraceManager(object):
         self._trace_dispatcher.append_to_trace(parent_trace_id, trace_id,
                 kwargs.get("title", ""), kwargs.get("y_axis",""))
 
+    def add_counter_sampler(self, trace_id, store):
+        """Record the CounterSamplesMsgs published for trace_id into store"""
+        self._ensure_trace_dispatcher()
+
+        self.log.debug("Adding counter sampler")
+        self._trace_dispatcher.add_sink(trace_id,
+                                        TraceManager._CounterSampler(store))
+
+    def close(self):
+        """Stop the trace dispatcher and close its socket"""
+        if self._trace_dispatcher is not None:
+            self.log.debug("Stopping trace dispatcher")
+            self._trace_dispatcher.close()
+            self._trace_dispatcher = None
+
+    def flush(self, time_ns):
+        """Plot the drop rate windows which ended by time_ns, the simulation
+        time of a stop"""
+        if self._trace_dispatcher is not None:
+            self._trace_dispatcher.flush(time_ns)
+
+    def remove_sink(self, trace_id):
+        """Stop delivering the data of trace_id to the sink added for it"""
+        if self._trace_dispatcher is not None:
+            self.log.debug("Removing sink")
+            self._trace_dispatcher.remove_sink(trace_id)
+
+    def add_drop_rate_trace(self, trace_id, window_ns, parent_trace_id=None, **kwargs):
+        """Plot the rate of the PacketDroppedMsgs published for trace_id,
+        counted over windows of window_ns of simulation time, on a new plot or
+        on the plot of parent_trace_id"""
+        self._ensure_trace_dispatcher()
+
+        title  = kwargs.get("title", "")
+        y_axis = kwargs.get("y_axis", "")
+        if parent_trace_id is None:
+            self.log.debug("Creating drop rate trace")
+            plot = TraceManager._Trace(kwargs.get("x_axis", ""), y_axis, title, trace_id)
+        else:
+            self.log.debug("Adding drop rate to existing trace")
+            plot = self._trace_dispatcher.get_trace(parent_trace_id)
+            if plot is None:
+                self.log.warning("Tried to associate to non-existant trace %d" % parent_trace_id)
+                return
+
+        plot.add_trace(trace_id, title, y_axis)
+        self._trace_dispatcher.add_sink(trace_id,
+                                        TraceManager._DropRate(plot, trace_id, window_ns))
+
+    class _DropRate(object):
+        """Trace sink turning PacketDroppedMsgs into points of the number of
+        drops per us in each window of simulation time.
+
+        A window is plotted once a drop from a later window arrives, or once
+        the simulation stops after its end."""
+        def __init__(self, plot, trace_id, window_ns):
+            self.plot      = plot
+            self.trace_id  = trace_id
+            self.window_ns = window_ns
+            self.window    = None  # Index of the current window
+            self.count     = 0
+
+        def add_data(self, data):
+            msg = pb.PacketDroppedMsg()
+            msg.ParseFromString(data.payload)
+
+            self._advance(int(msg.time_ns // self.window_ns))
+            self.count += 1
+
+        def flush(self, time_ns):
+            if self.window is not None:
+                self._advance(int(time_ns // self.window_ns))
+
+        def _advance(self, window):
+            if self.window is None:
+                self.window = window
+            elif window > self.window:
+                self._add_point(self.window, self.count)
+                # Bring the rate down to zero over windows without drops
+                if window > self.window + 1:
+                    self._add_point(self.window + 1, 0)
+                if window > self.window + 2:
+                    self._add_point(window - 1, 0)
+                self.window = window
+                self.count  = 0
+
+        def _add_point(self, window, count):
+            msg = pb.TracingUpdateMsg()
+            msg.id          = self.trace_id
+            msg.timestamp   = int((window + 1) * self.window_ns)
+            msg.float_value = count * 1000.0 / self.window_ns
+            self.plot.add_data(Data(id_=self.trace_id, payload=msg.SerializeToString()))
+
+    class _CounterSampler(object):
+        """Trace sink storing counter samples in a CounterSampleStore.
+
+        Unlike _Trace, samples are stored in this process, directly from the
+        dispatcher thread."""
+        def __init__(self, store):
+            self.store = store
+
+        def add_data(self, data):
+            msg = pb.CounterSamplesMsg()
+            msg.ParseFromString(data.payload)
+            self.store.add_sample(msg.timestamp, msg.column_list,
+                                  msg.value_list, msg.new_name_list)
+
     class _TraceDispatcher(threading.Thread):
         def __init__(self, ipc_url, topic):
             super(TraceManager._TraceDispatcher, self).__init__()
@@ -61,6 +168,7 @@ class TraceManager(object):
 
             self.lock = threading.Lock()
             self.trace_map = {}
+            self.closed = False
 
             self.log = logging.getLogger("_TraceDispatcher")
             self.log.addHandler(logging.StreamHandler())
@@ -78,16 +186,56 @@ class TraceManager(object):
                     self.log.warning("Received duplicate trace id %d"
                                      % trace.id_)
 
+        def add_sink(self, trace_id, sink):
+            """Deliver the data of trace_id to sink, which isn't a plot"""
+            with self.lock:
+                if trace_id not in self.trace_map:
+                    self.trace_map[trace_id] = sink
+                else:
+                    self.log.warning("Received duplicate trace id %d" % trace_id)
+
+        def close(self):
+            # Closing the socket makes the blocking recv of run fail
+            self.closed = True
+            self.sock.close()
+
+        def remove_sink(self, trace_id):
+            with self.lock:
+                if self.trace_map.pop(trace_id, None) is None:
+                    self.log.warning("Tried to remove non-existant trace %d" % trace_id)
+
+        def get_trace(self, trace_id):
+            """Return the plot of trace_id, which other traces can be added to"""
+            with self.lock:
+                return self._plot(trace_id)
+
+        def _plot(self, trace_id):
+            trace = self.trace_map.get(trace_id)
+            if isinstance(trace, TraceManager._DropRate):
+                return trace.plot
+            elif isinstance(trace, TraceManager._CounterSampler):
+                return None
+            return trace
+
+        def flush(self, time_ns):
+            with self.lock:
+                for sink in self.trace_map.values():
+                    if isinstance(sink, TraceManager._DropRate):
+                        sink.flush(time_ns)
+
         def append_to_trace(self, parent_trace_id, trace_id, title, y_axis):
             """Associate an existing trace object with a new id"""
             with self.lock:
-                if parent_trace_id not in self.trace_map:
+                plot = self._plot(parent_trace_id)
+                if plot is None:
                     self.log.warning("Tried to associate to non-existant trace %d" % parent_trace_id)
                 elif trace_id in self.trace_map:
                     self.log.warning("Received duplicate trace id %d" % trace_id)
                 else:
-                    self.trace_map[trace_id] = self.trace_map[parent_trace_id]
-                    self.trace_map[trace_id].add_trace(trace_id, title, y_axis)
+                    # Sinks such as _DropRate aren't plots, their data is
+                    # plotted in the plot they feed
+                    self.trace_map[trace_id] = plot
+                    plot.add_trace(trace_id, title, y_axis)
 
 
         def _deserialize_messages(self, messages):
@@ -106,7 +254,12 @@ class TraceManager(object):
                 msgs = []
                 # Read at least one message blockingly.
                 self.log.debug("TraceDispatcher waiting for published msg")
-                msgs.append(self.sock.recv())
+                try:
+                    msgs.append(self.sock.recv())
+                except Exception:
+                    if self.closed:
+                        return
+                    raise
 
                 # Then read as many more as we can non-blockingly
                 try:
@@ -114,6 +267,8 @@ class TraceManager(object):
                         msgs.append(self.sock.recv(nnpy.DONTWAIT))
                         self.log.debug("Trace dispatcher received additional msg")
                 except AssertionError:
+                    if self.closed:
+                        return
                     if nnpy.nanomsg.nn_errno() != nnpy.EAGAIN:
                         error_msg = nnpy.ffi.string(
                             nnpy.nanomsg.nn_strerror(nnpy.nanomsg.nn_errno()))
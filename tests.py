@@ -1,7 +1,16 @@
-from pfpdb.pfpdb import DebuggerIPCSession
-from pfpdb.pfpdb import PFPSimDebugger
 from pfpdb.pfpdb import PFPSimDebuggerCmd
+from pfpdb.client import DebuggerIPCSession, PFPSimDebugger
+from pfpdb.client import Session, Simulation, Stop, Packet, Hop, find_pids, AUTO_URL
+from pfpdb.startup import StartupProfile
 import pfpdb.pfpdb as pfpdb
+from pfpdb.cache import PrefixSet, MetadataCache, PacketCache, Prefetcher
+from pfpdb.counters import CounterSnapshots, CounterSampleStore
+from pfpdb.packets import PacketMirror
+from pfpdb.pcap import PcapngWriter
+from pfpdb.analysis import ModuleProfile, FlowGraph, DropLog, DropCause
+from pfpdb.tracing import TraceManager, Data
+from pfpdb.tables import TableEntry, MirroredTable
+from pfpdb import script
 
 from threading import Thread
 
@@ -16,6 +25,13 @@ import sys
 
 import time
 
+import struct
+import tempfile
+import os
+import json
+
+from io import BytesIO
+
 if sys.version_info[0] < 3:
     def str_to_bytes(s):
         return [c for c in s]
@@ -282,6 +298,1253 @@ def test_run():
     yield test_method
 
 
+def test_watch():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.GenericAcknowledge
+
+    submsg = pb2.GenericAcknowledgeMsg()
+    submsg.status = pb2.GenericAcknowledgeMsg.SUCCESS
+
+    response.message = submsg.SerializeToString()
+
+    def validate_set_watchpoint(counter_name, condition, value, req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.SetWatchpoint
+
+        wp_req = pb2.SetWatchpointMsg()
+        wp_req.ParseFromString(wrap.message)
+
+        assert_equal(counter_name, wp_req.counter_name)
+        if condition is None:
+            assert not wp_req.HasField("condition")
+        else:
+            assert_equal(condition, wp_req.condition)
+            assert_equal(value, wp_req.value)
+
+    validator = RequestValidator(partial(validate_set_watchpoint, "queue_depth", None, None))
+    test_method = partial(check_run, response, "watch counter queue_depth",
+                          "Watchpoint was set successfully.", validator)
+    test_method.description = "Watch counter without condition"
+    yield test_method
+
+    validator = RequestValidator(partial(validate_set_watchpoint, "queue_depth",
+                                         pb2.WATCH_GREATER_THAN, "100"))
+    test_method = partial(check_run, response, "watch counter queue_depth if > 100",
+                          "Watchpoint was set successfully.", validator)
+    test_method.description = "Watch counter with threshold condition"
+    yield test_method
+
+    validator = RequestValidator(partial(validate_set_watchpoint, "queue_depth",
+                                         pb2.WATCH_CROSSES, "64"))
+    test_method = partial(check_run, response, "watch -c queue_depth if crosses 64 --disable",
+                          "Watchpoint was set successfully.", validator)
+    test_method.description = "Watch counter with crosses condition"
+    yield test_method
+
+    validator = RequestValidator(partial(validate_set_watchpoint, "queue_depth",
+                                         pb2.WATCH_RATE_ABOVE, "0.005"))
+    test_method = partial(check_run, response, "watch counter queue_depth if rate > 5 per us",
+                          "Watchpoint was set successfully.", validator)
+    test_method.description = "Watch counter with rate condition"
+    yield test_method
+
+
+def test_next():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.SimulationStopped
+
+    submsg = pb2.SimulationStoppedMsg()
+    submsg.module = "egress"
+    submsg.packet_id = 7
+    submsg.time = 120.0
+    submsg.read = True
+
+    response.message = submsg.SerializeToString()
+
+    def validate_next(mode, count, module, hops, req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.Next
+
+        next_req = pb2.NextMsg()
+        next_req.ParseFromString(wrap.message)
+
+        assert_equal(mode, next_req.mode)
+        assert_equal(count, next_req.count)
+        assert_equal(module, next_req.module)
+        assert_equal(hops, next_req.report_hops)
+
+    def started(cli):
+        cli.run_called = True
+
+    expected = ("\x1b[0mPacket ID: 7\n" +
+                "Module: egress (Read)\n" +
+                "Time: 120.0 ns")
+
+    validator = RequestValidator(partial(validate_next, pb2.NextMsg.STEP, 40, "", False))
+    test_method = partial(check_run, response, "next 40", expected, validator, started)
+    test_method.description = "next with a step count"
+    yield test_method
+
+    validator = RequestValidator(partial(validate_next, pb2.NextMsg.UNTIL_MODULE, 0, "egress", False))
+    test_method = partial(check_run, response, "until egress", expected, validator, started)
+    test_method.description = "until a module"
+    yield test_method
+
+    validator = RequestValidator(partial(validate_next, pb2.NextMsg.FINISH, 0, "", False))
+    test_method = partial(check_run, response, "finish", expected, validator, started)
+    test_method.description = "finish the current module"
+    yield test_method
+
+    submsg.hop_module_list.extend(["parser", "ingress"])
+    submsg.hop_time_list.extend([100.0, 110.0])
+    submsg.hop_read_list.extend([True, False])
+
+    response.message = submsg.SerializeToString()
+
+    expected = ("\x1b[0mHops:\n" +
+                "    parser (Read) at 100.0 ns\n" +
+                "    ingress (Write) at 110.0 ns\n" +
+                "\x1b[0mPacket ID: 7\n" +
+                "Module: egress (Read)\n" +
+                "Time: 120.0 ns")
+
+    validator = RequestValidator(partial(validate_next, pb2.NextMsg.STEP, 3, "", True))
+    test_method = partial(check_run, response, "n 3 --hops", expected, validator, started)
+    test_method.description = "next with intermediate hops"
+    yield test_method
+
+
+def test_print_counters():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.AllCounterValues
+
+    # Reply as a model which ignores the filters would
+    submsg = pb2.AllCounterValuesMsg()
+    submsg.name_list.extend(["egress.port0.drops", "ingress.port0.drops",
+                             "egress.port1.drops", "egress.port2.drops"])
+    submsg.value_list.extend([12, 50, 30, 0])
+
+    response.message = submsg.SerializeToString()
+
+    def validate_get_all_counters(req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.GetAllCounters
+
+        counters_req = pb2.GetAllCountersMsg()
+        counters_req.ParseFromString(wrap.message)
+
+        assert_equal("egress.*drop*", counters_req.pattern)
+        assert_equal(False, counters_req.regex)
+        assert_equal(pb2.GetAllCountersMsg.BY_VALUE_DESCENDING, counters_req.sort)
+        assert_equal(2, counters_req.limit)
+
+    expected = ("Counter Name          Value\n" +
+                "------------------  -------\n" +
+                "egress.port1.drops       30\n" +
+                "egress.port0.drops       12")
+
+    validator = RequestValidator(validate_get_all_counters)
+    test_method = partial(check_run, response, "print counter all --match egress.*drop* --top 2",
+                          expected, validator)
+    test_method.description = "Print filtered top counters"
+    yield test_method
+
+
+def test_print_counters_sorted():
+    class ScriptedModel(object):
+        def __init__(self, replies):
+            self.replies = replies
+
+        def send(self, request):
+            pass
+
+        def recv(self):
+            return self.replies.pop(0)
+
+    # The model ignores the sort order, the debugger sorts the counters itself
+    counters = pb2.AllCounterValuesMsg(name_list=["b", "c", "a"], value_list=[2, 3, 1])
+    model = ScriptedModel([counters, 10.0])
+    debugger = PFPSimDebugger(model, DummyProcess(), None, False)
+    names, values = debugger.print_all_counters(sort=pb2.GetAllCountersMsg.BY_VALUE_DESCENDING)
+    assert_equal(["c", "b", "a"], list(names))
+    assert_equal([3, 2, 1], list(values))
+    # All the counters were sent, so they are still snapshotted
+    assert_equal(1, len(debugger.counter_snapshots.snapshots))
+
+
+def test_print_packets():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.PacketListValues
+
+    submsg = pb2.PacketListValuesMsg()
+    submsg.filtered = True
+    submsg.summary_module_list.extend(["egress", "parser"])
+    submsg.summary_count_list.extend([3, 12])
+    submsg.summary_oldest_age_list.extend([250.0, 40.5])
+
+    response.message = submsg.SerializeToString()
+
+    def validate_get_packet_list(expected_fields, req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.GetPacketList
+
+        list_req = pb2.GetPacketListMsg()
+        list_req.ParseFromString(wrap.message)
+
+        assert_equal(expected_fields,
+                     dict((f.name, v) for f, v in list_req.ListFields()))
+
+    expected = ("Module    Packets    Oldest Age (ns)\n" +
+                "--------  ---------  -----------------\n" +
+                "egress    3          250\n" +
+                "parser    12         40.5")
+
+    validator = RequestValidator(partial(validate_get_packet_list,
+                                         {"summary": True, "min_time": 1000.0}))
+    test_method = partial(check_run, response, "print packets --summary --since 1 us",
+                          expected, validator)
+    test_method.description = "Print packet summary"
+    yield test_method
+
+    # Reply as a model which ignores the filters would
+    submsg = pb2.PacketListValuesMsg()
+    submsg.id_list.extend([3, 1, 2, 4])
+    submsg.location_list.extend(["parser", "parser", "parser", "parser"])
+    submsg.time_list.extend([30.0, 10.0, 20.0, 40.0])
+
+    response.message = submsg.SerializeToString()
+
+    expected = ("Packet ID    Module    Time (ns)\n" +
+                "-----------  --------  -----------\n" +
+                "2            parser    20\n" +
+                "Showing 1 of 2 packets")
+
+    validator = RequestValidator(partial(validate_get_packet_list,
+                                         {"module": "parser", "min_id": 2, "max_id": 3, "limit": 1}))
+    test_method = partial(check_run, response, "print packets -m parser --ids 2-3 --limit 1",
+                          expected, validator)
+    test_method.description = "Print filtered and paged packets"
+    yield test_method
+
+    expected = ('{"type": "packet", "id": 2, "module": "parser", "time_ns": 20.0}\n' +
+                '{"type": "packet_count", "shown": 1, "total": 2}')
+
+    test_method = partial(check_run, response, "print packets -j -m parser --ids 2-3 --limit 1",
+                          expected, validator)
+    test_method.description = "Print packets as JSON records"
+    yield test_method
+
+
+def test_print_bulk_packets():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.PacketFieldValue
+
+    submsg = pb2.PacketFieldValueMsg()
+    submsg.bulk = True
+    submsg.id_list.extend([1, 3])
+    submsg.length_list.extend([1, 1])
+    submsg.value = b"\x40\x3F"
+
+    response.message = submsg.SerializeToString()
+
+    def validate_get_fields(field_name, packet_ids, req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.GetPacketField
+
+        field_req = pb2.GetPacketFieldMsg()
+        field_req.ParseFromString(wrap.message)
+
+        assert_equal(field_name, field_req.field_name)
+        assert_equal(packet_ids, list(field_req.id_list))
+        assert_equal(packet_ids[0], field_req.id)
+
+    expected = ("Packet ID    ipv4.ttl\n" +
+                "-----------  ----------\n" +
+                "1            64\n" +
+                "3            63")
+
+    validator = RequestValidator(partial(validate_get_fields, "ipv4.ttl", [1, 2, 3]))
+    test_method = partial(check_run, response, "print field ipv4.ttl 1-3 dec", expected, validator)
+    test_method.description = "Print field of a range of packets"
+    yield test_method
+
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.RawPacketValue
+
+    submsg = pb2.RawPacketValueMsg()
+    submsg.bulk = True
+    submsg.id_list.extend([2, 5])
+    submsg.length_list.extend([2, 3])
+    submsg.value = b"\x00\x01ABC"
+
+    response.message = submsg.SerializeToString()
+
+    expected = ("Packet 2:\n" +
+                "00000000: 00 01                                             ..\n" +
+                "\n" +
+                "Packet 5:\n" +
+                "00000000: 41 42 43                                          ABC")
+
+    test_method = partial(check_run, response, "print raw 2,5", expected)
+    test_method.description = "Print raw contents of a list of packets"
+    yield test_method
+
+
+def test_profile_modules():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.BacktraceReply
+
+    submsg = pb2.BacktraceReplyMsg()
+    submsg.bulk = True
+    submsg.packet_id_list.extend([1, 2])
+    submsg.hop_count_list.extend([3, 1])
+    submsg.finished_list.extend([False, True])
+    submsg.module_list.extend(["parser", "egress", "deparser", "parser"])
+    submsg.read_time_list.extend([0.0, 10.0, 30.0, 5.0])
+    submsg.write_time_list.extend([10.0, 30.0, -1.0, 9.0])
+
+    response.message = submsg.SerializeToString()
+
+    def validate_backtrace_all(req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.Backtrace
+
+        bt_req = pb2.BacktraceMsg()
+        bt_req.ParseFromString(wrap.message)
+
+        assert bt_req.all_packets
+        assert bt_req.include_finished
+
+    expected = ("Module    Hops    Mean (ns)    p50 (ns)    p99 (ns)    Total (ns)\n" +
+                "--------  ------  -----------  ----------  ----------  ------------\n" +
+                "egress    1       20           20          20          20\n" +
+                "parser    2       7            4           10          14\n" +
+                "Profiled 2 packets")
+
+    validator = RequestValidator(validate_backtrace_all)
+    test_method = partial(check_run, response, "profile modules", expected, validator)
+    test_method.description = "Profile modules from bulk backtraces"
+    yield test_method
+
+
+def test_collect_backtraces_prunes_departed():
+    class ScriptedModel(object):
+        def __init__(self, replies):
+            self.replies = replies
+
+        def send(self, request):
+            pass
+
+        def recv(self):
+            return self.replies.pop(0)
+
+    def bulk(ids, hops, finished, modules, read_times, write_times):
+        reply = pb2.BacktraceReplyMsg(bulk=True)
+        reply.packet_id_list.extend(ids)
+        reply.hop_count_list.extend(hops)
+        reply.finished_list.extend(finished)
+        reply.module_list.extend(modules)
+        reply.read_time_list.extend(read_times)
+        reply.write_time_list.extend(write_times)
+        return pb2.DebugMsg.BacktraceReply, reply
+
+    # Packet 1 is dropped between the two collections, packet 2 finishes
+    model = ScriptedModel([bulk([1, 2], [1, 1], [False, False], ["parser", "parser"],
+                                [0.0, 5.0], [-1.0, -1.0]),
+                           bulk([2], [1], [True], ["parser"], [5.0], [9.0])])
+    debugger = PFPSimDebugger(model, DummyProcess(), None, False)
+    debugger.collect_backtraces()
+    assert_equal(set([1, 2]), set(debugger.module_profile._counted))
+    debugger.collect_backtraces()
+    assert_equal({}, debugger.module_profile._counted)
+    assert_equal({}, debugger.flow_graph._counted)
+
+
+def test_print_dropped_packets():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.DroppedPackets
+
+    submsg = pb2.DroppedPacketsMsg()
+    submsg.incremental = True
+    submsg.first_index = 0
+    submsg.packet_id_list.extend([4, 9])
+    submsg.module_list.extend(["egress", "parser"])
+    submsg.reason_list.extend(["ttl", "bad checksum"])
+    submsg.time_list.extend([100.0, 200.0])
+
+    response.message = submsg.SerializeToString()
+
+    def validate_get_dropped(req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.GetDroppedPackets
+
+        drop_req = pb2.GetDroppedPacketsMsg()
+        drop_req.ParseFromString(wrap.message)
+
+        assert drop_req.HasField("since_index")
+        assert_equal(0, drop_req.since_index)
+
+    expected = ("Packet ID    Module    Reason\n" +
+                "-----------  --------  ------------\n" +
+                "4            egress    ttl\n" +
+                "9            parser    bad checksum")
+
+    validator = RequestValidator(validate_get_dropped)
+    test_method = partial(check_run, response, "print dropped_packets", expected, validator)
+    test_method.description = "Print dropped packets fetched incrementally"
+    yield test_method
+
+
+def test_table_dump_filters():
+    response      = pb2.DebugMsg()
+    response.type = pb2.DebugMsg.TableEntries
+
+    # The model doesn't apply the filters, so the debugger has to
+    submsg = pb2.TableEntriesMsg()
+    for table, key, action, handle in (("acl", "10.0.0.1", "drop", 1),
+                                       ("acl", "10.0.0.2", "permit", 2),
+                                       ("acl", "10.0.0.3", "drop", 3),
+                                       ("routes", "10.0.0.0/8", "drop", 4)):
+        entry = submsg.entry_list.add()
+        entry.table_name = table
+        entry.match_key_list.append(key)
+        entry.action_name = action
+        entry.handle = handle
+        entry.status = pb2.TableEntriesMsg.OK
+
+    response.message = submsg.SerializeToString()
+
+    def validate_get_table_entries(req):
+        wrap = pb2.DebugMsg()
+        wrap.ParseFromString(req)
+
+        assert wrap.type == pb2.DebugMsg.GetTableEntries
+
+        table_req = pb2.GetTableEntriesMsg()
+        table_req.ParseFromString(wrap.message)
+
+        assert_equal("acl", table_req.table_name)
+        assert_equal("drop", table_req.action_name)
+        assert_equal(2, table_req.min_handle)
+        assert_equal(5, table_req.max_handle)
+
+    expected = ("Table    Action    Match Key      Handle  Action Data    Status\n" +
+                "-------  --------  -----------  --------  -------------  --------\n" +
+                "acl      drop      10.0.0.3            3                 OK")
+
+    validator = RequestValidator(validate_get_table_entries)
+    test_method = partial(check_run, response, "table_dump acl action drop handles 2-5", expected, validator)
+    test_method.description = "Dump a table filtered by action and handles"
+    yield test_method
+
+
+def test_table_entry_paging():
+    class PagedModel(object):
+        """Serves the table entries two at a time, ignoring the filters"""
+        def __init__(self, entries):
+            self.entries = entries
+            self.requests = []
+
+        def send(self, request):
+            self.requests.append(request.message)
+
+        def recv(self):
+            request = self.requests[-1]
+            start = int(request.page_token) if request.page_token else 0
+            reply = pb2.TableEntriesMsg()
+            for table, handle in self.entries[start:start + request.page_size]:
+                entry = reply.entry_list.add()
+                entry.table_name = table
+                entry.match_key_list.append(str(handle))
+                entry.action_name = "forward"
+                entry.handle = handle
+            if start + request.page_size < len(self.entries):
+                reply.next_page_token = str(start + request.page_size).encode()
+            return reply
+
+    model = PagedModel([("acl", 1), ("routes", 2), ("acl", 3), ("acl", 4), ("routes", 5)])
+    debugger = PFPSimDebugger(model, DummyProcess(), None, False)
+
+    entries = list(debugger.iter_table_entries("acl", page_size=2))
+    assert_equal([1, 3, 4], [entry.handle for entry in entries])
+    assert_equal(("3",), entries[1].match_key)
+    assert_equal(3, len(model.requests))
+    assert_equal(["acl"] * 3, [request.table_name for request in model.requests])
+
+
+def test_mirrored_table():
+    def entry(handle, key, action="forward", priority=0):
+        return TableEntry("t", tuple(key), action, (), handle, pb2.TableEntriesMsg.OK, priority)
+
+    routes = MirroredTable("routes")
+    routes.add(entry(1, ["0.0.0.0/0"], "default"))
+    routes.add(entry(2, ["10.0.0.0/8"]))
+    routes.add(entry(3, ["10.1.0.0/16"]))
+    routes.add(entry(4, ["10.1.2.3"]))
+
+    assert_equal(4, routes.lookup(["10.1.2.3"]).handle)
+    assert_equal(3, routes.lookup(["10.1.2.4"]).handle)
+    assert_equal(2, routes.lookup(["0x0a020000"]).handle)
+    assert_equal(1, routes.lookup(["192.168.0.1"]).handle)
+    routes.remove(3)
+    assert_equal(2, routes.lookup(["10.1.2.4"]).handle)
+
+    acl = MirroredTable("acl")
+    acl.add(entry(1, ["10.0.0.0&&&0xff000000", "80"], "deny", priority=2))
+    acl.add(entry(2, ["0&&&0", "80"], "permit", priority=1))
+    acl.add(entry(3, ["10.0.0.1&&&0xffffffff", "0&&&0"], "deny", priority=3))
+    assert_equal(2, acl.lookup(["10.0.0.1", "80"]).handle)
+    assert_equal(3, acl.lookup(["10.0.0.1", "22"]).handle)
+    assert_equal(None, acl.lookup(["10.0.0.2", "22"]))
+    acl.remove(2)
+    assert_equal(1, acl.lookup(["10.0.0.1", "80"]).handle)
+
+
+def test_table_mirror_delta():
+    class VersionedModel(object):
+        def __init__(self):
+            self.requests = []
+            self.replies = []
+
+        def send(self, request):
+            self.requests.append(request.message)
+
+        def recv(self):
+            return self.replies.pop(0)
+
+    def reply(version, entries, delta=False, deleted=()):
+        msg = pb2.TableEntriesMsg()
+        msg.version = version
+        msg.delta = delta
+        for handle, key in entries:
+            entry = msg.entry_list.add()
+            entry.table_name = "exact"
+            entry.match_key_list.append(key)
+            entry.handle = handle
+            entry.status = pb2.TableEntriesMsg.OK
+        for handle in deleted:
+            msg.deleted_list.add(table_name="exact", handle=handle)
+        return msg
+
+    model = VersionedModel()
+    debugger = PFPSimDebugger(model, DummyProcess(), None, False)
+
+    model.replies.append(reply(7, [(1, "0x01"), (2, "0x02")]))
+    assert_equal(1, debugger.table_mirror.lookup("exact", ["1"]).handle)
+    assert not model.requests[0].HasField("since_version")
+
+    # Nothing is fetched until the simulation makes progress
+    assert_equal(2, debugger.table_mirror.lookup("exact", ["2"]).handle)
+    assert_equal(1, len(model.requests))
+
+    debugger.generation += 1
+    model.replies.append(reply(9, [(3, "0x02")], delta=True, deleted=[2]))
+    assert_equal(3, debugger.table_mirror.lookup("exact", ["0x2"]).handle)
+    assert_equal(7, model.requests[1].since_version)
+    assert_equal(2, len(debugger.table_mirror.tables["exact"]))
+
+
+def test_cp_load():
+    class BatchModel(object):
+        """Applies batches of commands, failing the deletes"""
+        def __init__(self):
+            self.batches = []
+
+        def send(self, request):
+            self.batches.append(list(request.message.command_list))
+
+        def recv(self):
+            reply = pb2.CPCommandResultsMsg()
+            reply.count = len(self.batches[-1])
+            for index, command in enumerate(self.batches[-1]):
+                if command.startswith("delete_entry"):
+                    reply.failed_index_list.append(index)
+                    reply.error_list.append("No such handle")
+            return pb2.DebugMsg.CPCommandResults, reply
+
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, "w") as cp_file:
+        cp_file.write("# routes\n" +
+                      "insert_entry routes 10.0.0.0/8 forward 1\n" +
+                      "\n" +
+                      "delete_entry routes 7\n" +
+                      "insert_entry routes 10.1.0.0/16 forward 2\n" +
+                      "delete_entry routes 9\n")
+
+    model = BatchModel()
+    debugger_cli = PFPSimDebuggerCmd(PFPSimDebugger(model, DummyProcess(), None, False))
+    try:
+        with captured_output() as (out, err):
+            debugger_cli.onecmd("cp load " + path + " batch 3")
+    finally:
+        os.remove(path)
+
+    assert_equal([["insert_entry routes 10.0.0.0/8 forward 1", "delete_entry routes 7",
+                   "insert_entry routes 10.1.0.0/16 forward 2"], ["delete_entry routes 9"]],
+                 model.batches)
+    lines = out.getvalue().strip().split("\n")
+    assert lines[0].startswith("Sent 4 commands in ")
+    assert lines[0].endswith(", 2 failed")
+    assert_equal("No such handle  2           4             delete_entry routes 7", lines[3])
+
+    # An empty batch isn't sent, and doesn't let the simulation progress
+    debugger = PFPSimDebugger(model, DummyProcess(), None, False)
+    assert_equal([], debugger.cp_commands([]))
+    assert_equal(2, len(model.batches))
+    assert_equal(0, debugger.generation)
+
+
+def test_cp_wait():
+    class ScriptedModel(object):
+        def __init__(self, replies):
+            self.replies = replies
+            self.requests = []
+
+        def send(self, request):
+            self.requests.append(request)
+
+        def recv(self):
+            return self.replies.pop(0)
+
+    ack = (pb2.DebugMsg.GenericAcknowledge, pb2.GenericAcknowledgeMsg.SUCCESS)
+
+    # The model counts pending entries and waits for them itself
+    counts = pb2.TableEntriesMsg(counted=True)
+    counts.pending_list.add(table_name="acl", inserting=2, deleting=1)
+    model = ScriptedModel([counts, ack])
+    debugger_cli = PFPSimDebuggerCmd(PFPSimDebugger(model, DummyProcess(), None, False))
+    debugger_cli.run_called = True
+    with captured_output() as (out, err):
+        debugger_cli.onecmd("cp wait acl")
+
+    assert_equal("No pending operations", out.getvalue().strip())
+    assert model.requests[0].message.count_pending
+    assert_equal(pb2.NextMsg.UNTIL_SETTLED, model.requests[1].message.mode)
+    assert_equal("acl", model.requests[1].message.table_name)
+
+    # The model sends the entries, which are counted by the debugger, and is
+    # continued until none of them is pending
+    def entries(*statuses):
+        msg = pb2.TableEntriesMsg()
+        for handle, status in enumerate(statuses):
+            msg.entry_list.add(table_name="acl", handle=handle, status=status)
+        return msg
+
+    model = ScriptedModel([entries(pb2.TableEntriesMsg.OK, pb2.TableEntriesMsg.INSERTING,
+                                   pb2.TableEntriesMsg.MODIFYING),
+                           entries(pb2.TableEntriesMsg.OK, pb2.TableEntriesMsg.INSERTING,
+                                   pb2.TableEntriesMsg.MODIFYING),
+                           ack,
+                           entries(pb2.TableEntriesMsg.OK, pb2.TableEntriesMsg.OK,
+                                   pb2.TableEntriesMsg.MODIFYING),
+                           ack,
+                           entries(pb2.TableEntriesMsg.OK, pb2.TableEntriesMsg.OK,
+                                   pb2.TableEntriesMsg.OK)])
+    debugger_cli = PFPSimDebuggerCmd(PFPSimDebugger(model, DummyProcess(), None, False))
+    debugger_cli.run_called = True
+    with captured_output() as (out, err):
+        debugger_cli.onecmd("cp pending")
+        debugger_cli.onecmd("cp wait every 5 us")
+
+    assert_equal("Table    Inserting    Modifying    Deleting    Pending\n" +
+                 "-------  -----------  -----------  ----------  ---------\n" +
+                 "acl      1            1            0           2\n" +
+                 "No pending operations", out.getvalue().strip())
+    assert_equal(pb2.DebugMsg.Continue, model.requests[2].parent_msg.type)
+    assert_equal(5000.0, float(model.requests[2].message.time_ns))
+
+    # A breakpoint is hit before the entries settle, the pending operations
+    # are asked for before the prefetcher may use the IPC session
+    class RecordingPrefetcher(object):
+        def __init__(self, requests):
+            self.requests = requests
+            self.started = None
+
+        def start(self, packet_id, module=None):
+            self.started = (len(self.requests), packet_id, module)
+
+        def stop(self):
+            pass
+
+    hit = pb2.BreakpointHitMsg(id=1, packet_id=4, module="parser", read="1", time_ns=10.0)
+    model = ScriptedModel([counts, (pb2.DebugMsg.BreakpointHit, hit), counts])
+    debugger_cli = PFPSimDebuggerCmd(PFPSimDebugger(model, DummyProcess(), None, False))
+    debugger_cli.debugger.prefetcher = RecordingPrefetcher(model.requests)
+    debugger_cli.run_called = True
+    with captured_output() as (out, err):
+        debugger_cli.postcmd(debugger_cli.onecmd("cp wait acl"), "cp wait acl")
+
+    assert_equal((3, 4, "parser"), debugger_cli.debugger.prefetcher.started)
+
+
+def test_json_output():
+    class ScriptedModel(object):
+        def __init__(self, replies):
+            self.replies = replies
+
+        def send(self, request):
+            pass
+
+        def recv(self):
+            return self.replies.pop(0)
+
+    breakpoints = pb2.AllBreakpointValuesMsg(id_list=[3], temporary=["0"], disabled=["0"])
+    breakpoints.breakpoint_condition_list.add(condition_list=[pb2.BREAK_ON_PACKET_ID], value_list=["7"])
+    model = ScriptedModel([pb2.WhoAmIReplyMsg(packet_id=4), 12.5, breakpoints])
+    debugger_cli = PFPSimDebuggerCmd(PFPSimDebugger(model, DummyProcess(), None, False))
+    with captured_output() as (out, err):
+        debugger_cli.onecmd("bad_command -j")
+        debugger_cli.onecmd("whoami extra -j")
+        debugger_cli.onecmd("whoami -j")
+        debugger_cli.onecmd("whattimeisit -j")
+        debugger_cli.onecmd("info breakpoints -j")
+
+    records = [json.loads(line) for line in out.getvalue().strip().split("\n")]
+    assert_equal([{"type": "message", "text": "*** Unknown syntax: bad_command"},
+                  {"type": "message",
+                   "text": "Incorrect 'whoami' command. Use 'help' command to see correct syntax."},
+                  {"type": "whoami", "packet_id": 4},
+                  {"type": "simulation_time", "time_ns": 12.5},
+                  {"type": "breakpoint", "id": 3, "temporary": False, "enabled": True,
+                   "conditions": [{"packet_id": 7}]}], records)
+    assert_equal(2, debugger_cli.errors)
+
+
+def test_session():
+    class ScriptedModel(object):
+        def __init__(self, replies):
+            self.replies = replies
+            self.requests = []
+            self.closed = False
+
+        def send(self, request):
+            self.requests.append(request)
+
+        def recv(self):
+            return self.replies.pop(0)
+
+        def close(self):
+            self.closed = True
+
+    hit = pb2.BreakpointHitMsg(id=1, module="ingress", packet_id=7, time_ns=12.5, read="1")
+    packet_list = pb2.PacketListValuesMsg(id_list=[7, 9], location_list=["ingress", "egress"],
+                                          time_list=[12.5, 3.0])
+    backtrace = pb2.BacktraceReplyMsg(module_list=["parser", "ingress"], read_time_list=[1.0, 12.5],
+                                      write_time_list=[2.0])
+    counters = pb2.AllCounterValuesMsg(name_list=["rx", "tx"], value_list=[4, 2])
+    model = ScriptedModel([
+        (pb2.DebugMsg.GenericAcknowledge, pb2.GenericAcknowledgeMsg.SUCCESS),
+        (pb2.DebugMsg.BreakpointHit, hit),
+        pb2.WhoAmIReplyMsg(packet_id=7),
+        packet_list,
+        (pb2.DebugMsg.BacktraceReply, backtrace),
+        counters,
+        -1,
+        (pb2.DebugMsg.SimulationEnd, pb2.SimulationEndMsg())])
+
+    with Session(PFPSimDebugger(model, None, None, False)) as session:
+        assert session.set_breakpoint(module="ingress", packet_id=7)
+        assert_equal(Stop(Stop.BREAKPOINT, id=1, packet_id=7, module="ingress", read=True, time_ns=12.5),
+                     session.run())
+        assert_equal(7, session.whoami())
+        assert_equal([Packet(7, "ingress", 12.5), Packet(9, "egress", 3.0)], session.packets())
+        assert_equal([Hop("parser", 1.0, 2.0), Hop("ingress", 12.5, None)], session.backtrace())
+        assert_equal([("rx", 4), ("tx", 2)], list(session.counters().items()))
+        # The snapshot of the counters took the time of the breakpoint hit
+        assert_equal(12.5, session.debugger.counter_snapshots.latest().time_ns)
+        assert_equal(None, session.counter("missing"))
+        assert_equal(Stop.END, session.continue_().reason)
+        trace_manager = session.debugger.trace_manager
+        trace_manager._ensure_trace_dispatcher()
+        dispatcher = trace_manager._trace_dispatcher
+
+    assert model.closed
+    # The trace dispatcher's socket is closed, which ends its thread
+    assert dispatcher.closed
+    assert_equal(None, session.debugger._trace_manager)
+    request = model.requests[0].message
+    assert_equal([pb2.BREAK_ON_MODULE_READ, pb2.BREAK_ON_PACKET_ID], list(request.condition_list))
+    assert_equal(["ingress", "7"], list(request.value_list))
+
+    # The simulation is restarted with the same arguments, the model's -d is
+    # passed to the python script here
+    simulation = Simulation(sys.executable, ["-c", "import time; time.sleep(60)"]).start()
+    first_pid = simulation.pid
+    assert_equal(None, simulation.poll())
+    simulation.restart()
+    assert first_pid != simulation.pid
+    assert_equal(None, simulation.poll())
+    simulation.close()
+    assert simulation.poll() != None
+
+    # Every simulation gets its own endpoints, which are passed to the model
+    # and removed once it is closed
+    first = Simulation(sys.executable, ["-c", "import time; time.sleep(60)"], url=AUTO_URL, trace_url=AUTO_URL)
+    second = Simulation(sys.executable, ["-c", "import time; time.sleep(60)"], url=AUTO_URL)
+    assert first.url != second.url
+    assert_equal(pfpdb.DEFAULT_TRACE_URL, second.trace_url)
+    assert_equal(["-d", "--debug-url", first.url, "--trace-url", first.trace_url], first.command()[3:])
+    assert_equal(["-d", "--debug-url", second.url], second.command()[3:])
+    first.start()
+    directory = first.directory
+    assert os.path.isdir(directory)
+    first.close()
+    second.close()
+    assert not os.path.exists(directory)
+
+
+def test_startup_profile():
+    profile = StartupProfile(out=StringIO())
+    profile.enable()
+    sys.modules.pop("colorsys", None)
+    import colorsys
+    profile.mark("import")
+    profile.report()
+
+    assert_equal(["import"], [phase for phase, _ in profile.phases])
+    assert_equal(["colorsys"], [module for module, _ in profile.imports])
+    lines = profile.out.getvalue().splitlines()
+    assert_equal("Startup profile (ms):", lines[0])
+    assert lines[-1].endswith("  colorsys")
+
+    # The interpreter running the tests is found by name
+    with open("/proc/self/cmdline", "rb") as cmdline_file:
+        argv0 = cmdline_file.read().split(b"\0")[0].decode()
+    assert os.getpid() in find_pids(os.path.basename(argv0))
+    assert_equal([], find_pids("no-such-model"))
+
+
+def test_script_expansion():
+    statements = script.parse(["# comment",
+                               "set module = egress",
+                               "for id in 1..3",
+                               "  print ${id}",
+                               "  repeat 2",
+                               "    next",
+                               "  end",
+                               "end",
+                               "until $module"])
+    assert_equal([(4, "print 1"), (6, "next"), (6, "next"),
+                  (4, "print 2"), (6, "next"), (6, "next"),
+                  (4, "print 3"), (6, "next"), (6, "next"),
+                  (9, "until egress")],
+                 list(script.expand(statements, {})))
+
+    try:
+        script.parse(["for i in a b", "print $i"])
+        assert False
+    except script.ScriptError as e:
+        assert_equal(1, e.line_number)
+
+    try:
+        list(script.expand(script.parse(["print $missing"]), {}))
+        assert False
+    except script.ScriptError as e:
+        assert_equal("line 1: Undefined variable missing", str(e))
+
+
+def test_run_script():
+    class BulkModel(object):
+        def __init__(self):
+            self.requests = []
+
+        def send(self, request):
+            self.requests.append(request)
+
+        def recv(self):
+            request = self.requests[-1].message
+            reply = pb2.RawPacketValueMsg(bulk=True)
+            for packet_id in request.id_list:
+                reply.id_list.append(packet_id)
+                reply.length_list.append(1)
+                reply.value += struct.pack("B", packet_id)
+            return pb2.DebugMsg.RawPacketValue, reply
+
+    model = BulkModel()
+    debugger_cli = PFPSimDebuggerCmd(PFPSimDebugger(model, DummyProcess(), None, False), interactive=False)
+    commands = script.expand(script.parse(["for id in 1..3", "print raw $id", "end", "bad_command"]), {})
+    with captured_output() as (out, err):
+        exit_code = debugger_cli.runScript(commands)
+
+    # The three packets are fetched with one request
+    assert_equal(1, len(model.requests))
+    assert_equal([1, 2, 3], list(model.requests[0].message.id_list))
+    assert_equal(3, out.getvalue().count("00000000: 0"))
+    assert_equal(1, exit_code)
+
+
+def test_prefix_set():
+    words = PrefixSet(["top.egress.drops", "top.egress.tx", "top.ingress.rx"])
+    words.add("top.egress.tx")
+    words.add("top.egress.a")
+
+    assert_equal(4, len(words))
+    assert "top.ingress.rx" in words
+    assert "top.ingress" not in words
+    assert_equal(["top.egress.a", "top.egress.drops", "top.egress.tx"], words.complete("top.e"))
+    assert_equal(4, len(words.complete("")))
+    assert_equal([], words.complete("bottom"))
+    assert_equal([], words.complete("zzz"))
+
+
+def test_metadata_cache_generation():
+    class CountingDebugger(object):
+        def __init__(self):
+            self.generation = 0
+            self.fetches = 0
+            self.metadata = MetadataCache(self)
+
+        def print_all_counters(self):
+            self.fetches += 1
+            names = ["rx", "tx"]
+            self.metadata.observe_counters(names)
+            return names, [0, 0]
+
+    debugger = CountingDebugger()
+    assert_equal(["rx"], debugger.metadata.counter_names("r"))
+    assert_equal(["tx"], debugger.metadata.counter_names("t"))
+    assert_equal(1, debugger.fetches)
+
+    debugger.generation += 1
+    assert_equal(["rx", "tx"], debugger.metadata.counter_names())
+    assert_equal(2, debugger.fetches)
+
+
+def test_packet_cache():
+    class Debugger(object):
+        generation = 0
+
+    debugger = Debugger()
+    packet_cache = PacketCache(debugger, capacity=2)
+    MISSING = PacketCache.MISSING
+
+    assert packet_cache.get(('raw', 1)) is MISSING
+    packet_cache.put(('raw', 1), b"\x01")
+    packet_cache.put(('raw', 2), None)
+    assert_equal(b"\x01", packet_cache.get(('raw', 1)))
+    assert_equal(None, packet_cache.get(('raw', 2)))
+
+    # ('raw', 1) was used less recently than ('raw', 2)
+    packet_cache.get(('raw', 2))
+    packet_cache.put(('field', 1, 'ipv4.ttl'), b"\x40")
+    assert packet_cache.get(('raw', 1)) is MISSING
+    assert_equal((3, 2, 1), (packet_cache.hits, packet_cache.misses, packet_cache.evictions))
+
+    debugger.generation += 1
+    assert packet_cache.get(('field', 1, 'ipv4.ttl')) is MISSING
+    assert_equal(0, len(packet_cache))
+
+    packet_cache.enabled = False
+    packet_cache.put(('raw', 1), b"\x01")
+    assert packet_cache.get(('raw', 1)) is MISSING
+    assert_equal(0, len(packet_cache))
+
+
+def test_prefetcher():
+    class RecordingDebugger(object):
+        def __init__(self):
+            self.generation = 0
+            self.packet_cache = PacketCache(self)
+            self.calls = []
+
+        def whoami(self):
+            self.calls.append(('whoami',))
+
+        def backtrace(self, packet_id=None):
+            self.calls.append(('bt', packet_id))
+
+        def get_parsed_packet(self, packet_id):
+            self.calls.append(('print', packet_id))
+
+        def print_packets(self, module=None):
+            self.calls.append(('packets', module))
+            return [1, 4, 6, 9], [module] * 4, [0.0] * 4
+
+    debugger = RecordingDebugger()
+    prefetcher = Prefetcher(debugger, depth=3)
+
+    prefetcher.start(5, "parser")
+    prefetcher.stop()
+    assert_equal([], debugger.calls)
+
+    prefetcher.enabled = True
+    prefetcher.start(5, "parser")
+    prefetcher.stop()
+    assert_equal([('whoami',), ('bt', None), ('print', 5), ('packets', "parser"),
+                  ('bt', 4), ('print', 4), ('bt', 6), ('print', 6)],
+                 debugger.calls)
+    assert_equal(7, prefetcher.prefetched)
+
+
+def test_module_profile():
+    profile = ModuleProfile()
+    profile.add_backtrace(1, ["parser", "egress"], [0.0, 10.0], [10.0, -1.0])
+    # Only the hop completed since is counted
+    profile.add_backtrace(1, ["parser", "egress", "deparser"], [0.0, 10.0, 25.0], [10.0, 25.0, -1.0])
+    profile.add_backtrace(2, ["parser"], [5.0], [9.0], finished=True)
+
+    assert_equal([("egress", 1, 15.0, 15.0, 15.0, 15.0),
+                  ("parser", 2, 7.0, 4.0, 10.0, 14.0)],
+                 profile.stats())
+    assert_equal(2, profile.packets)
+
+    out = StringIO()
+    profile.export_folded(out)
+    assert_equal("parser 14\nparser;egress 15\n", out.getvalue())
+
+    profile.retain([])
+    profile.add_backtrace(1, ["parser", "egress", "deparser"], [0.0, 10.0, 25.0], [10.0, 25.0, 26.0])
+    assert_equal(3, profile.packets)
+
+
+def test_flow_graph():
+    graph = FlowGraph()
+    graph.add_backtrace(1, ["parser", "egress"], [0.0, -1.0], [-1.0, -1.0])
+    assert_equal({}, graph.edges)
+    graph.add_backtrace(1, ["parser", "egress", "deparser"], [0.0, 10.0, 30.0], [10.0, 30.0, -1.0])
+    graph.add_backtrace(2, ["parser", "egress"], [5.0, 9.0], [9.0, 20.0], finished=True)
+
+    assert_equal([("parser", "egress", 2, 7.0), ("egress", "deparser", 1, 20.0)],
+                 graph.edge_stats())
+
+    graph.add_occupancy(0.0, {"parser": 1, "egress": 2})
+    graph.add_occupancy(1000.0, {"parser": 1, "egress": 6})
+    assert_equal([("deparser", 0.0, 0, 0.0, False),
+                  ("egress", 4.0, 6, 0.004, True),
+                  ("parser", 1.0, 1, 0.0, False)],
+                 graph.node_stats())
+
+    out = StringIO()
+    graph.export_dot(out)
+    dot = out.getvalue()
+    assert dot.startswith("digraph flow {\n")
+    assert '"egress" [label="egress\\noccupancy 4.0", color=red, fontcolor=red];' in dot
+    assert '"parser" -> "egress" [label="2 packets\\n7.0 ns"];' in dot
+
+
+def test_drop_log():
+    drop_log = DropLog()
+    drop_log.add(1, "egress", "ttl", 100.0)
+    drop_log.add(2, "parser", "bad checksum", 150.0)
+    drop_log.add(3, "egress", "ttl", 200.0)
+
+    assert_equal([DropCause("egress", "ttl", 2, 0.01, 2, 0.01),
+                  DropCause("parser", "bad checksum", 1, 0.005, 1, 0.005)],
+                 drop_log.summary(200.0))
+
+    drop_log.add(4, "parser", "bad checksum", 300.0)
+    assert_equal([DropCause("egress", "ttl", 2, 0.005, 0, 0.0),
+                  DropCause("parser", "bad checksum", 2, 0.005, 1, 0.005)],
+                 drop_log.summary(400.0))
+    assert_equal(4, len(drop_log))
+    assert_equal((4, "parser", "bad checksum", 300.0), list(drop_log.drops())[-1])
+
+
+def test_drop_rate_trace():
+    class Plot(object):
+        def __init__(self):
+            self.points = []
+
+        def add_data(self, data):
+            msg = pb2.TracingUpdateMsg()
+            msg.ParseFromString(data.payload)
+            assert_equal(7, data.id_)
+            self.points.append((msg.timestamp, msg.float_value))
+
+    plot = Plot()
+    sink = TraceManager._DropRate(plot, 7, 1000.0)
+    for time_ns in (100.0, 500.0, 1200.0, 5500.0):
+        drop = pb2.PacketDroppedMsg()
+        drop.time_ns = time_ns
+        sink.add_data(Data(id_=7, payload=drop.SerializeToString()))
+
+    assert_equal([(1000, 2.0), (2000, 1.0), (3000, 0.0), (5000, 0.0)], plot.points)
+
+    # The last window is plotted once the simulation stops after its end
+    sink.flush(5800.0)
+    assert_equal(4, len(plot.points))
+    sink.flush(6300.0)
+    assert_equal((6000, 1.0), plot.points[-1])
+
+
+def test_append_to_drop_rate_trace():
+    class Plot(object):
+        def __init__(self):
+            self.traces = []
+
+        def add_trace(self, trace_id, title, y_axis):
+            self.traces.append(trace_id)
+
+    plot = Plot()
+    dispatcher = TraceManager._TraceDispatcher("ipc:///tmp/pfpdb-test-trace", "PFPDB")
+    dispatcher.add_sink(7, TraceManager._DropRate(plot, 7, 1000.0))
+    dispatcher.append_to_trace(7, 8, "", "")
+    assert dispatcher.trace_map[8] is plot
+    assert dispatcher.get_trace(7) is plot
+    assert_equal([8], plot.traces)
+
+
+def test_counter_snapshots():
+    snapshots = CounterSnapshots(max_snapshots=2)
+    snapshots.record(1, 100.0, ["rx", "tx", "drops"], [10, 10, 0])
+    snapshots.record(2, 300.0, ["rx", "tx", "drops"], [50, 10, 0])
+    # Only the changed counters, with a counter appearing for the first time
+    snapshots.record(3, 400.0, ["drops", "errors"], [5, 1], version=7,
+                     changed_only=True)
+
+    assert_equal([2, 3], list(snapshots.snapshots.keys()))
+    assert_equal(7, snapshots.version)
+
+    old, new, deltas = snapshots.diff()
+    assert_equal((2, 3), (old.stop, new.stop))
+    assert_equal([("drops", 0, 5, 5, 0.05), ("errors", 0, 1, 1, 0.01)],
+                 [tuple(d) for d in deltas])
+    assert_equal([50, 10, 5, 1], list(new.values))
+
+    try:
+        snapshots.diff(since=1)
+        assert False
+    except KeyError:
+        pass
+
+
+def test_counter_sample_store():
+    store = CounterSampleStore()
+    store.add_sample(10, [0, 1], [5, 0], new_names=["rx", "drops"])
+    store.add_sample(20, [0], [7])
+    store.add_sample(30, [], [])
+    store.add_snapshot(40, ["drops", "rx", "tx"], [2, 7, 1])
+
+    assert_equal(4, len(store))
+    assert_equal([5, 7, 7, 7], list(store.column_values(store.columns["rx"])))
+    assert_equal([0, 0, 0, 2], list(store.column_values(store.columns["drops"])))
+
+    out = StringIO()
+    store.export_csv(out, store.select("*x"))
+    assert_equal("time_ns,rx,tx\n" +
+                 "10.0,5,0\n" +
+                 "20.0,7,0\n" +
+                 "30.0,7,0\n" +
+                 "40.0,7,1\n", out.getvalue())
+
+    # Smaller blocks than samples, and a column which changes in some only
+    store.CSV_BLOCK = 3
+    store.add_sample(50, [2], [4])
+    out = StringIO()
+    store.export_csv(out)
+    assert_equal("time_ns,rx,drops,tx\n" +
+                 "10.0,5,0,0\n" +
+                 "20.0,7,0,0\n" +
+                 "30.0,7,0,0\n" +
+                 "40.0,7,2,1\n" +
+                 "50.0,7,2,4\n", out.getvalue())
+
+
+def test_counter_sample_export_memory():
+    try:
+        import tracemalloc
+    except ImportError:
+        return
+
+    class NullFile(object):
+        def write(self, data):
+            pass
+
+    def export_peak(samples):
+        store = CounterSampleStore()
+        store.CSV_BLOCK = 100
+        names = ["counter" + str(i) for i in range(20)]
+        for sample in range(samples):
+            store.add_snapshot(float(sample), names, [sample] * len(names))
+        tracemalloc.start()
+        try:
+            store.export_csv(NullFile())
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # The samples x counters values would take megabytes, only a block of
+    # them is expanded at a time
+    small = export_peak(5000)
+    large = export_peak(20000)
+    assert large < 512 * 1024
+    assert large < 2 * small
+
+
+def test_packet_mirror():
+    mirror = PacketMirror()
+
+    full = pb2.PacketListValuesMsg()
+    full.id_list.extend([1, 2, 3])
+    full.location_list.extend(["parser", "parser", "egress"])
+    full.time_list.extend([10.0, 20.0, 30.0])
+    full.generation = 4
+    mirror.apply(full)
+
+    assert_equal(4, mirror.generation)
+    assert_equal(([1, 2], ["parser", "parser"], [10.0, 20.0]), mirror.packets("parser"))
+
+    changes = pb2.PacketListValuesMsg()
+    changes.incremental = True
+    changes.generation = 6
+    changes.id_list.extend([2, 4])
+    changes.location_list.extend(["egress", "parser"])
+    changes.time_list.extend([40.0, 45.0])
+    changes.removed_id_list.append(3)
+    mirror.apply(changes)
+
+    assert_equal(6, mirror.generation)
+    assert_equal(([1, 2, 4], ["parser", "egress", "parser"], [10.0, 40.0, 45.0]),
+                 mirror.packets())
+    assert_equal(set([1, 4]), mirror.by_module["parser"])
+    assert_equal(set([2]), mirror.by_module["egress"])
+
+
+def test_pcapng_writer():
+    out = BytesIO()
+    writer = PcapngWriter(out)
+    writer.write_packet(b"\x01\x02\x03", 2**32 + 5.2, "module: egress")
+    writer.write_packet(b"\x04\x05\x06\x07", 10)
+    data = out.getvalue()
+
+    blocks = []
+    offset = 0
+    while offset < len(data):
+        block_type, length = struct.unpack_from("<II", data, offset)
+        assert_equal(length, struct.unpack_from("<I", data, offset + length - 4)[0])
+        assert_equal(0, length % 4)
+        blocks.append((block_type, data[offset + 8:offset + length - 4]))
+        offset += length
+
+    assert_equal([0x0A0D0D0A, 1, 6, 6], [block[0] for block in blocks])
+    # Interface timestamps are in ns
+    assert_equal((9, 1, 9), struct.unpack_from("<HHB", blocks[1][1], 8))
+
+    body = blocks[2][1]
+    assert_equal((0, 1, 5, 3, 3), struct.unpack_from("<IIIII", body))
+    assert_equal(b"\x01\x02\x03", body[20:23])
+    assert_equal((1, 14), struct.unpack_from("<HH", body, 24))
+    assert_equal(b"module: egress", body[28:42])
+
+    body = blocks[3][1]
+    assert_equal((0, 0, 10, 4, 4), struct.unpack_from("<IIIII", body))
+    assert_equal(24, len(body))
+
+
 def assert_equal(expected, actual):
     try:
         assert expected == actual
@@ -291,7 +1554,8 @@ def assert_equal(expected, actual):
         raise
 
 
-def check_run(response_msg, run_command, expected_stdout, validator=None):
+def check_run(response_msg, run_command, expected_stdout, validator=None,
+              setup_cli=None):
     ipc_url = "ipc:///tmp/pfpdb-test.ipc"
 
     model_thread = Thread(target=dummy_model_main,
@@ -308,6 +1572,9 @@ def check_run(response_msg, run_command, expected_stdout, validator=None):
     debugger     = PFPSimDebugger(ipc_session, DummyProcess(), None, False)
     debugger_cli = PFPSimDebuggerCmd(debugger)
 
+    if setup_cli is not None:
+        setup_cli(debugger_cli)
+
     with captured_output() as (out, err):
         debugger_cli.onecmd(run_command)
 